@@ -1,22 +1,40 @@
 import os
 import uuid
-import threading
-from datetime import datetime, timedelta
 import io
 from flask import Flask, request, jsonify, send_from_directory, make_response, redirect, send_file, g
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 from functools import wraps
 from pdf import generate_itinerary_pdf
+from place import Place
+import http_client
+import circuit_breaker
+import rate_limiter
 from services import (
-    plan_trip, plan_trip_smart, calculate_route,
-    geocoding_cache, weather_cache, places_cache, llm_scoring_cache, routing_cache,
+    plan_trip, plan_trip_smart, replan_itinerary, calculate_route, optimize_route,
+    CACHES, search_results_cache, SEARCH_RESULTS_TTL, start_housekeeping, housekeeper, get_calibration_stats, start_calibration_warmup,
     register_user, login_user, logout_user, get_user_by_session_token,
     save_itinerary_service, get_trips, update_itinerary, get_trip
 )
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
+class PlaceJSONProvider(DefaultJSONProvider):
+    """Serializes Place records straight to JSON, so responses never build an intermediate list of dicts."""
+    @staticmethod
+    def default(o):
+        if isinstance(o, Place):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__, static_folder="../static", static_url_path="/static")
+app.json = PlaceJSONProvider(app)
+
+# One background thread sweeps expired entries from every cache. Started at
+# import (not under __main__) so it also runs when gunicorn loads app:app.
+start_housekeeping()
+# Fit travel-time calibration from cached legs off the request path
+start_calibration_warmup()
 
 # Provided a simple rout protection overlay 
 def login_required(f):
@@ -37,10 +55,6 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated
 
-# In-memory cache for paginated search results
-# Structure: {session_id: {'results': [...], 'weather': {...}, 'starting_coords': {...}, 'expires': datetime}}
-search_results_cache = {}
-
 @app.route("/")
 def index():
     return send_from_directory("../static", "index.html")
@@ -81,29 +95,24 @@ def api_plan():
     
     try:
         # Check if we have cached results for this session
-        if session_id and session_id in search_results_cache:
-            cached = search_results_cache[session_id]
+        # Structure: {'results': [place rows], 'weather': {...}, 'starting_coords': {...}}
+        cached = search_results_cache.get(session_id) if session_id else None
+        if cached:
+            results = cached['results']
             
-            # Check if cache is still valid
-            if cached['expires'] > datetime.now():
-                results = cached['results']
-                
-                # Return paginated results
-                paginated_results = results[offset:offset + limit]
-                
-                return jsonify({
-                    'places': paginated_results,
-                    'weather': cached['weather'],
-                    'starting_coords': cached['starting_coords'],
-                    'session_id': session_id,
-                    'total_count': len(results),
-                    'has_more': offset + limit < len(results),
-                    'offset': offset,
-                    'limit': limit
-                })
-            else:
-                # Cache expired, remove it
-                del search_results_cache[session_id]
+            # Return paginated results (only the requested page is turned back into Places)
+            paginated_results = [Place.from_row(row) for row in results[offset:offset + limit]]
+            
+            return jsonify({
+                'places': paginated_results,
+                'weather': cached['weather'],
+                'starting_coords': cached['starting_coords'],
+                'session_id': session_id,
+                'total_count': len(results),
+                'has_more': offset + limit < len(results),
+                'offset': offset,
+                'limit': limit
+            })
         
         # First call or cache miss: Generate full results
         result = plan_trip(data)
@@ -111,13 +120,12 @@ def api_plan():
         # Generate new session ID
         new_session_id = str(uuid.uuid4())
         
-        # Cache full results (expires in 10 minutes)
-        search_results_cache[new_session_id] = {
-            'results': result.get('places', []),
+        # Cache full results as compact place rows (expires in 10 minutes)
+        search_results_cache.set(new_session_id, {
+            'results': [place.to_row() for place in result.get('places', [])],
             'weather': result.get('weather', {}),
-            'starting_coords': result.get('starting_coords', {}),
-            'expires': datetime.now() + timedelta(minutes=10)
-        }
+            'starting_coords': result.get('starting_coords', {})
+        }, SEARCH_RESULTS_TTL)
         
         # Return first page
         all_results = result.get('places', [])
@@ -163,6 +171,54 @@ def api_plan_smart():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/replan", methods=["POST"])
+def api_replan():
+    """
+    Apply one edit to a smart itinerary, recomputing only the affected legs,
+    times and totals (the LLM is only asked about a newly added place).
+    Expects JSON body with:
+    - itinerary: array of items from /api/plan-smart
+    - starting_coords: {lat, lng}
+    - edit: {op: replace|remove|insert|move, index, place (replace/insert), to (move)}
+    - travel_mode, start_time, end_time: as sent to /api/plan-smart
+    - interests, budget, use_weather: optional, for scoring a new place
+    """
+    data = request.get_json()
+    if not data or "itinerary" not in data or "edit" not in data:
+        return jsonify({"error": "missing itinerary or edit"}), 400
+    
+    coords = data.get("starting_coords") or {}
+    if "lat" not in coords or "lng" not in coords:
+        return jsonify({"error": "missing starting_coords"}), 400
+    
+    itinerary = data["itinerary"]
+    edit = data["edit"]
+    if not isinstance(itinerary, list) or not isinstance(edit, dict):
+        return jsonify({"error": "itinerary must be an array and edit an object"}), 400
+    op = edit.get("op")
+    if op not in ("replace", "remove", "insert", "move"):
+        return jsonify({"error": "edit op must be replace, remove, insert or move"}), 400
+    
+    size = len(itinerary) + (1 if op == "insert" else 0)
+    index = edit.get("index")
+    # bool is a subclass of int; true/false is not an index
+    if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < size:
+        return jsonify({"error": "edit index out of range"}), 400
+    if op == "move":
+        to = edit.get("to")
+        if not isinstance(to, int) or isinstance(to, bool) or not 0 <= to < len(itinerary):
+            return jsonify({"error": "edit to out of range"}), 400
+    if op in ("replace", "insert"):
+        place = edit.get("place")
+        if not isinstance(place, dict) or not place.get("name") or place.get("lat") is None or place.get("lng") is None:
+            return jsonify({"error": "edit place needs name, lat and lng"}), 400
+    
+    try:
+        result = replan_itinerary(data)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/calculate-route", methods=["POST"])
 @login_required
 def api_calculate_route():
@@ -171,6 +227,10 @@ def api_calculate_route():
     Expects JSON body with:
     - waypoints: array of {lat, lng} objects
     - travel_mode: string (driving-car, cycling-regular, foot-walking)
+    - optimize: optional bool; reorder the stops between the first waypoint
+      and the end to minimize travel time (response adds "order", the
+      waypoint indices in visiting order)
+    - fixed_end: optional bool; with optimize, keep the last waypoint last
     """
     data = request.get_json()
     if not data or "waypoints" not in data:
@@ -185,7 +245,11 @@ def api_calculate_route():
     try:
         # Convert waypoints to tuples
         waypoint_tuples = [(w["lat"], w["lng"]) for w in waypoints]
-        route_data = calculate_route(waypoint_tuples, travel_mode)
+        if str(data.get("optimize", "")).lower() in ("true", "1"):
+            fixed_end = str(data.get("fixed_end", "")).lower() in ("true", "1")
+            route_data = optimize_route(waypoint_tuples, travel_mode, fixed_end=fixed_end)
+        else:
+            route_data = calculate_route(waypoint_tuples, travel_mode)
         return jsonify(route_data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -194,38 +258,43 @@ def api_calculate_route():
 def api_cache_stats():
     """
     Get statistics about cache performance.
-    Returns information about all active caches.
+    Returns information about all active caches, plus housekeeping, outbound
+    HTTP counters per upstream host and rate-limiter wait times per upstream.
     """
     try:
-        stats = {
-            "geocoding": geocoding_cache.get_stats(),
-            "weather": weather_cache.get_stats(),
-            "places": places_cache.get_stats(),
-            "llm_scoring": llm_scoring_cache.get_stats(),
-            "routing": routing_cache.get_stats(),
-            "total_active": sum([
-                geocoding_cache.get_stats()["active_entries"],
-                weather_cache.get_stats()["active_entries"],
-                places_cache.get_stats()["active_entries"],
-                llm_scoring_cache.get_stats()["active_entries"],
-                routing_cache.get_stats()["active_entries"]
-            ])
-        }
+        # get_stats() is constant-time, so call it exactly once per cache
+        stats = {name: cache.get_stats() for name, cache in CACHES.items()}
+        stats["total_entries"] = sum(s["total_entries"] for s in stats.values())
+        stats["housekeeping"] = housekeeper.get_stats()
+        stats["http"] = http_client.get_stats()
+        stats["rate_limits"] = rate_limiter.get_stats()
+        stats["travel_calibration"] = get_calibration_stats()
         return jsonify(stats)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/health", methods=["GET"])
+def api_health():
+    """
+    Upstream health as seen by this worker: the circuit breaker state per
+    upstream (Geoapify, Open-Meteo, OpenAI, Gemini). "degraded" means at least
+    one breaker is not closed and its fallback is being served.
+    """
+    breakers = circuit_breaker.get_stats()
+    degraded = any(b["state"] != circuit_breaker.CLOSED for b in breakers.values())
+    return jsonify({
+        "status": "degraded" if degraded else "ok",
+        "breakers": breakers
+    })
+
 @app.route("/api/clear-cache", methods=["POST"])
 def api_clear_cache():
     """
     Clear all caches. Useful for testing or manual cache management.
     """
     try:
-        geocoding_cache.clear()
-        weather_cache.clear()
-        places_cache.clear()
-        llm_scoring_cache.clear()
-        routing_cache.clear()
+        for cache in CACHES.values():
+            cache.clear()
         return jsonify({"message": "All caches cleared successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -399,22 +468,6 @@ def api_get_trips():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def cleanup_expired_cache():
-    """Clean up expired entries from search results cache."""
-    now = datetime.now()
-    expired_keys = [k for k, v in search_results_cache.items() if v['expires'] < now]
-    for key in expired_keys:
-        del search_results_cache[key]
-    
-    if expired_keys:
-        print(f"Cleaned up {len(expired_keys)} expired cache entries")
-    
-    # Schedule next cleanup in 15 minutes
-    threading.Timer(15 * 60, cleanup_expired_cache).start()
-
 if __name__ == "__main__":
-    # Start background cache cleanup
-    threading.Timer(15 * 60, cleanup_expired_cache).start()
-    
     port = int(os.getenv("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Benchmark: interest -> category mapping cost per /api/plan request.
+
+Compares the original linear scan over CATEGORIES against the precompiled
+matcher in category_matcher.py (cold, i.e. memo cleared, and warm), on a
+realistic mix of interests, and checks both return identical categories.
+
+Run: python bench_category_matcher.py
+"""
+
+import random
+import time
+
+from geo_categories import CATEGORIES, SYNONYMS
+import category_matcher
+
+
+def legacy_map_interests_to_categories(interests):
+    """The original implementation, kept here as the baseline."""
+    cats = []
+    if not interests:
+        return []
+
+    for it in interests:
+        token = it.strip().lower()
+        if not token:
+            continue
+
+        if token in SYNONYMS:
+            for c in SYNONYMS[token]:
+                cats.append(c)
+            continue
+
+        token_norm = token.replace(' ', '_')
+
+        matches = []
+        for cat in CATEGORIES:
+            if token in cat or token_norm in cat:
+                matches.append(cat)
+            else:
+                seg = cat.split('.')[-1]
+                if token == seg or token_norm == seg:
+                    matches.append(cat)
+
+        if not matches:
+            for cat in CATEGORIES:
+                if token in cat.replace('_', ' ') or token_norm in cat:
+                    matches.append(cat)
+
+        for m in matches[:5]:
+            cats.append(m)
+
+    seen = set()
+    dedup = []
+    for c in cats:
+        if c not in seen:
+            dedup.append(c)
+            seen.add(c)
+    return dedup
+
+
+# Interests as users type them in the explore UI / guided setup
+INTEREST_POOL = [
+    "museum", "art gallery", "historical site", "hiking", "nature", "park",
+    "restaurant", "coffee shop", "bakery", "shopping", "shopping mall",
+    "bookstore", "theater", "cinema", "music venue", "beach", "spa", "resort",
+    "hostel", "cafe", "coffee", "Zoo ", "ice cream", "aquarium", "castle",
+    "monument", "nightclub", "bar", "pub", "brewery", "water park", "camping",
+    "playground", "sports", "stadium", "library", "market", "memorial",
+    "viewpoint", "garden", "arts centre", "fast food", "pizza", "sushi", "wine",
+]
+
+
+def make_requests(n, seed=7):
+    rng = random.Random(seed)
+    return [rng.sample(INTEREST_POOL, rng.randint(1, 4)) for _ in range(n)]
+
+
+def bench(fn, requests, before_each=None):
+    started = time.perf_counter()
+    for interests in requests:
+        if before_each:
+            before_each()
+        fn(interests)
+    return (time.perf_counter() - started) / len(requests) * 1e6
+
+
+if __name__ == "__main__":
+    requests = make_requests(2000)
+
+    for interests in requests:
+        expected = legacy_map_interests_to_categories(interests)
+        actual = category_matcher.map_interests_to_categories(interests)
+        assert actual == expected, (interests, expected, actual)
+    print(f"Outputs identical for {len(requests)} requests")
+
+    legacy_us = bench(legacy_map_interests_to_categories, requests)
+    cold_us = bench(category_matcher.map_interests_to_categories, requests,
+                    before_each=category_matcher.categories_for_token.cache_clear)
+    category_matcher.categories_for_token.cache_clear()
+    warm_us = bench(category_matcher.map_interests_to_categories, requests)
+
+    print(f"{'implementation':<28}{'us/request':>12}{'speedup':>10}")
+    print(f"{'legacy linear scan':<28}{legacy_us:>12.1f}{1:>9.1f}x")
+    print(f"{'precompiled (memo cleared)':<28}{cold_us:>12.1f}{legacy_us / cold_us:>9.1f}x")
+    print(f"{'precompiled (memoized)':<28}{warm_us:>12.1f}{legacy_us / warm_us:>9.1f}x")
@@ -0,0 +1,637 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# ============== Simple Cache Implementation ==============
+
+# Shared pool for stale-while-revalidate background refreshes
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+
+def _approx_size(value):
+    """
+    Rough size of a cached value in bytes.
+    Uses the JSON encoding length, which tracks the payload size closely
+    for the dicts/lists/tuples we cache, and falls back to sys.getsizeof.
+    Objects holding arrays report their own size via an nbytes attribute.
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+def cache_limits_from_env(name, default_entries, default_mb):
+    """
+    Read the entry/byte limits for a named cache from the environment.
+    e.g. PLACES_CACHE_MAX_ENTRIES=2000, PLACES_CACHE_MAX_MB=64
+    A value of 0 disables that limit.
+    """
+    prefix = name.upper()
+    max_entries = int(os.getenv(f"{prefix}_CACHE_MAX_ENTRIES", default_entries))
+    max_mb = float(os.getenv(f"{prefix}_CACHE_MAX_MB", default_mb))
+    return {
+        "max_entries": max_entries,
+        "max_bytes": int(max_mb * 1024 * 1024)
+    }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function and every concurrent caller for the same key waits for (and
+    shares) its result or exception, so a burst of cache misses for one key
+    turns into a single upstream call.
+    """
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run fn() once per key among concurrent callers and return its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Number of keys currently being computed."""
+        with self._lock:
+            return len(self._calls)
+
+
+class SimpleCache:
+    """
+    Simple time-based cache with automatic expiration.
+    Each cache entry has a TTL (time to live) in seconds.
+
+    The cache is bounded: when it holds more than max_entries entries or more
+    than max_bytes (approximate) of data, least recently used entries are
+    evicted first. A limit of 0 means unbounded.
+
+    Hit/miss/set/expiration/eviction counters and get/set latency are kept
+    incrementally, so get_stats() is constant-time.
+
+    The in-memory LRU acts as an L1 in front of an optional CacheBackend
+    (e.g. SQLiteBackend, shared by every worker on the host): reads check
+    memory first, then the backend, and writes go to both.
+
+    single_flight() coalesces concurrent misses for the same key.
+
+    With stale_seconds > 0 the cache works in soft-TTL/hard-TTL mode: an
+    entry is fresh for ttl_seconds, then stays servable as stale for another
+    stale_seconds. get() only returns fresh values; get_or_revalidate()
+    also returns stale values and refreshes them in the background.
+
+    Expired entries are removed lazily on read and proactively by sweep(),
+    which pops an expiry heap so each call does a bounded amount of work.
+    """
+    def __init__(self, name="cache", max_entries=0, max_bytes=0, backend=None, stale_seconds=0):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.stale_seconds = stale_seconds
+        self._cache = OrderedDict()  # key -> (value, expiry_time, size, fresh_until)
+        self._expiry_heap = []       # (expiry_time, key); may hold superseded entries
+        self._refreshing = set()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._flight = SingleFlight()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        """Zero the statistics counters."""
+        self._hits = 0
+        self._backend_hits = 0
+        self._stale_hits = 0
+        self._refreshes = 0
+        self._misses = 0
+        self._sets = 0
+        self._expirations = 0
+        self._evictions = 0
+        self._get_seconds = 0.0
+        self._set_seconds = 0.0
+
+    def _generate_key(self, *args, **kwargs):
+        """Generate a cache key from arguments."""
+        key_data = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True)
+        return hashlib.md5(key_data.encode()).hexdigest()
+
+    def _remove(self, key):
+        """Drop an entry and release its bytes. Caller holds the lock."""
+        size = self._cache.pop(key)[2]
+        self._bytes -= size
+
+    def _evict(self):
+        """Evict least recently used entries until within limits. Caller holds the lock."""
+        while self._cache and (
+            (self.max_entries and len(self._cache) > self.max_entries) or
+            (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._cache))
+            self._remove(key)
+            self._evictions += 1
+
+    def _store(self, key, value, expiry_time):
+        """Insert into the in-memory LRU and evict if over limits. Caller holds the lock."""
+        if key in self._cache:
+            self._remove(key)
+        size = _approx_size(value)
+        fresh_until = expiry_time - self.stale_seconds
+        self._cache[key] = (value, expiry_time, size, fresh_until)
+        heapq.heappush(self._expiry_heap, (expiry_time, key))
+        self._bytes += size
+        self._evict()
+
+    def _get_from_backend(self, key):
+        """Look a key up in the backend, treating backend errors as misses."""
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            print(f"Cache backend read error ({self.name}): {e}")
+            return None
+
+    def _lookup(self, key):
+        """
+        Find a live entry (memory first, then backend).
+        Returns (value, is_fresh); value is None on a miss. Takes the lock
+        itself, and reads the backend without it so that memory hits from
+        other threads never wait on disk I/O.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now < entry[1]:
+                self._cache.move_to_end(key)
+                return entry[0], now < entry[3]
+            if entry is not None:
+                # Remove expired entry
+                self._remove(key)
+                self._expirations += 1
+        stored = self._get_from_backend(key)
+        if stored is None:
+            return None, False
+        value, expiry_time = stored
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now < entry[1]:
+                # Set by another thread while we read the backend; it is newer
+                return entry[0], now < entry[3]
+            # Promote to memory with the remaining lifetime
+            self._store(key, value, expiry_time)
+            self._backend_hits += 1
+        return value, now < expiry_time - self.stale_seconds
+
+    def get(self, key):
+        """Get value from cache if not expired (memory first, then backend)."""
+        started = time.perf_counter()
+        value, fresh = self._lookup(key)
+        with self._lock:
+            if value is not None and fresh:
+                self._hits += 1
+            else:
+                value = None
+                self._misses += 1
+            self._get_seconds += time.perf_counter() - started
+            return value
+
+    def get_or_revalidate(self, key, refresh):
+        """
+        Stale-while-revalidate lookup. Returns a fresh value as-is; returns a
+        stale value immediately and schedules refresh() (which should re-populate
+        the cache) on a background thread; returns None on a miss.
+        """
+        started = time.perf_counter()
+        value, fresh = self._lookup(key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                if not fresh:
+                    self._stale_hits += 1
+                    self._schedule_refresh(key, refresh)
+            self._get_seconds += time.perf_counter() - started
+            return value
+
+    def _schedule_refresh(self, key, refresh):
+        """Run refresh() in the background unless one is already running for key. Caller holds the lock."""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        self._refreshes += 1
+
+        def run():
+            try:
+                self.single_flight(key, refresh)
+            except Exception as e:
+                print(f"Background refresh failed ({self.name}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        _refresh_executor.submit(run)
+
+    def set(self, key, value, ttl_seconds):
+        """
+        Set value in cache with TTL (time to live) in seconds.
+        In soft/hard TTL mode the entry is kept stale_seconds longer.
+        """
+        started = time.perf_counter()
+        expiry_time = time.time() + ttl_seconds + self.stale_seconds
+        with self._lock:
+            self._store(key, value, expiry_time)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expiry_time)
+            except Exception as e:
+                print(f"Cache backend write error ({self.name}): {e}")
+        with self._lock:
+            self._sets += 1
+            self._set_seconds += time.perf_counter() - started
+
+    def single_flight(self, key, fn):
+        """
+        Compute a missing value once for all concurrent callers of `key`.
+        fn() is expected to populate the cache itself and return the value.
+        The leader re-checks the cache first: a caller that missed just
+        before another flight stored the value (or arrives just after it
+        finished) gets that value instead of calling upstream again.
+        """
+        def lead():
+            value, fresh = self._lookup(key)
+            if value is not None and fresh:
+                return value
+            return fn()
+        return self._flight.do(key, lead)
+
+    def items(self, prefix=""):
+        """
+        Live (key, value) pairs whose key starts with prefix, from memory and
+        the backend (memory wins for keys in both). Scans every entry; meant
+        for occasional bulk reads such as warming a model at startup.
+        """
+        now = time.time()
+        with self._lock:
+            found = {k: entry[0] for k, entry in self._cache.items() if k.startswith(prefix) and now < entry[1]}
+        if self.backend is not None:
+            try:
+                for key, value in self.backend.items(prefix):
+                    found.setdefault(key, value)
+            except Exception as e:
+                print(f"Cache backend read error ({self.name}): {e}")
+        return list(found.items())
+
+    def delete(self, key):
+        """Remove a single entry from every tier."""
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+        if self.backend is not None:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                print(f"Cache backend delete error ({self.name}): {e}")
+
+    def clear(self):
+        """Clear all cache entries."""
+        with self._lock:
+            self._cache.clear()
+            self._expiry_heap = []
+            self._bytes = 0
+        if self.backend is not None:
+            try:
+                self.backend.clear()
+            except Exception as e:
+                print(f"Cache backend clear error ({self.name}): {e}")
+
+    def sweep(self, max_items=500):
+        """
+        Remove up to max_items expired entries from memory, oldest expiry first.
+        Heap records whose entry was overwritten, evicted or deleted are
+        discarded as they surface. Returns the number of entries removed.
+        """
+        now = time.time()
+        removed = 0
+        with self._lock:
+            heap = self._expiry_heap
+            examined = 0
+            while heap and heap[0][0] <= now and examined < max_items:
+                expiry_time, key = heapq.heappop(heap)
+                examined += 1
+                entry = self._cache.get(key)
+                if entry is not None and entry[1] == expiry_time:
+                    self._remove(key)
+                    removed += 1
+            self._expirations += removed
+            # Superseded records pile up when keys are rewritten; rebuild if the heap gets large
+            if len(heap) > 2 * len(self._cache) + 1024:
+                self._expiry_heap = [(entry[1], k) for k, entry in self._cache.items()]
+                heapq.heapify(self._expiry_heap)
+        return removed
+
+    def get_stats(self):
+        """Get cache statistics (constant-time, built from running counters)."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "total_entries": len(self._cache),
+                "approx_bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "backend_hits": self._backend_hits,
+                "stale_hits": self._stale_hits,
+                "background_refreshes": self._refreshes,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "sets": self._sets,
+                "expirations": self._expirations,
+                "evictions": self._evictions,
+                "coalesced_misses": self._flight.coalesced,
+                "avg_get_ms": round(self._get_seconds * 1000 / lookups, 4) if lookups else 0.0,
+                "avg_set_ms": round(self._set_seconds * 1000 / self._sets, 4) if self._sets else 0.0,
+                "backend": self.backend.name if self.backend is not None else None
+            }
+
+# ============== Cache Backends ==============
+
+class CacheBackend:
+    """
+    Interface for a second-tier store behind SimpleCache (the in-process L1).
+    Backends hold JSON-serializable values with absolute expiry timestamps
+    and may be shared between processes, e.g. all gunicorn workers on a host.
+    """
+    name = "backend"
+
+    def get(self, key):
+        """Return (value, expiry_time) for a live entry, or None."""
+        raise NotImplementedError
+
+    def set(self, key, value, expiry_time):
+        """Store a value until expiry_time (epoch seconds)."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove a single entry if present."""
+        raise NotImplementedError
+
+    def items(self, prefix=""):
+        """Live (key, value) pairs whose key starts with prefix."""
+        return []
+
+    def clear(self):
+        """Remove every entry owned by this backend."""
+        raise NotImplementedError
+
+    def compact(self):
+        """Drop expired entries. Returns the number removed."""
+        return 0
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite-backed cache store, persistent across restarts.
+
+    Several caches can share one database file: each SimpleCache gets its own
+    namespace. The database runs in WAL mode with a busy timeout, so every
+    gunicorn worker on the host can read and write the same file concurrently.
+    Connections are opened lazily per process, which keeps this safe when
+    gunicorn forks workers after importing the app (--preload). Expired rows
+    are deleted by compact(), run periodically by the Housekeeper.
+    """
+    name = "sqlite"
+
+    def __init__(self, path, namespace):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        """Return this process's connection, opening it on first use. Caller holds the lock."""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """Return (value, expiry_time) for a live row, or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def items(self, prefix=""):
+        """Live (key, value) pairs in this namespace whose key starts with prefix."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM cache WHERE namespace = ? AND substr(key, 1, ?) = ? AND expires > ?",
+                (self.namespace, len(prefix), prefix, time.time())
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def set(self, key, value, expiry_time):
+        """Store a value; values that cannot be JSON-encoded are skipped."""
+        try:
+            payload = json.dumps(value)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, payload, expiry_time)
+            )
+            conn.commit()
+
+    def delete(self, key):
+        """Delete a single row."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            conn.commit()
+
+    def clear(self):
+        """Delete every row in this namespace."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            conn.commit()
+
+    def compact(self):
+        """Delete expired rows in this namespace. Returns the number of rows removed."""
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND expires <= ?",
+                (self.namespace, time.time())
+            ).rowcount
+            conn.commit()
+        return removed
+
+def cache_backend_from_env(name):
+    """
+    Build the shared second-tier backend for a named cache, or None for an
+    in-process-only cache.
+
+    CACHE_DIR            directory holding the shared cache.sqlite3 file
+    CACHE_BACKEND        "sqlite" (default when CACHE_DIR is set) or "none"
+    CACHE_BACKEND_CACHES comma-separated cache names that use the backend
+    """
+    cache_dir = os.getenv("CACHE_DIR")
+    backend = os.getenv("CACHE_BACKEND", "sqlite" if cache_dir else "none").lower()
+    enabled = os.getenv("CACHE_BACKEND_CACHES", "geocoding,routing")
+    if backend == "none" or name not in [c.strip() for c in enabled.split(",")]:
+        return None
+    if backend == "sqlite":
+        return SQLiteBackend(os.path.join(cache_dir or ".", "cache.sqlite3"), namespace=name)
+    raise Exception(f"Unknown CACHE_BACKEND: {backend}")
+
+# ============== Housekeeping ==============
+
+class Housekeeper:
+    """
+    One long-lived background thread that keeps every registered cache tidy.
+
+    Each tick sweeps at most sweep_budget expired entries per cache (via the
+    caches' expiry heaps), so no single pass holds a cache lock for long;
+    a backlog is worked off over consecutive ticks. Every compact_every ticks
+    the caches' backends compact their expired rows as well.
+    """
+    def __init__(self, interval=5, sweep_budget=500, compact_every=120):
+        self.interval = interval
+        self.sweep_budget = sweep_budget
+        self.compact_every = compact_every
+        self._caches = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._fork_hook_registered = False
+        self._ticks = 0
+        self._swept = 0
+        self._compacted = 0
+        self._last_tick_ms = 0.0
+
+    def register(self, cache):
+        """Add a cache to the sweep rotation."""
+        with self._lock:
+            if cache not in self._caches:
+                self._caches.append(cache)
+
+    def start(self):
+        """Start the background thread if it isn't already running in this process."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-housekeeper", daemon=True)
+            self._thread.start()
+            if not self._fork_hook_registered and hasattr(os, "register_at_fork"):
+                # Threads don't survive fork(); restart in gunicorn workers forked after import
+                os.register_at_fork(after_in_child=self._restart_after_fork)
+                self._fork_hook_registered = True
+
+    def _restart_after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.start()
+
+    def stop(self):
+        """Ask the background thread to exit after its current tick."""
+        self._stop.set()
+
+    def run_once(self):
+        """Sweep every registered cache once. Returns the number of entries removed."""
+        started = time.perf_counter()
+        self._ticks += 1
+        compact = self.compact_every and self._ticks % self.compact_every == 0
+        removed = 0
+        for cache in list(self._caches):
+            try:
+                removed += cache.sweep(self.sweep_budget)
+                if compact and cache.backend is not None:
+                    self._compacted += cache.backend.compact()
+            except Exception as e:
+                print(f"Housekeeping error ({cache.name}): {e}")
+        self._swept += removed
+        self._last_tick_ms = (time.perf_counter() - started) * 1000
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def get_stats(self):
+        """Housekeeping counters."""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval_seconds": self.interval,
+            "ticks": self._ticks,
+            "entries_swept": self._swept,
+            "backend_rows_compacted": self._compacted,
+            "last_tick_ms": round(self._last_tick_ms, 3)
+        }
+
+
+housekeeper = Housekeeper(
+    interval=float(os.getenv("HOUSEKEEPING_INTERVAL_SECONDS", 5)),
+    sweep_budget=int(os.getenv("HOUSEKEEPING_SWEEP_BUDGET", 500))
+)
@@ -0,0 +1,95 @@
+"""
+Precompiled interest -> Geoapify category matcher.
+
+Matching a free-text interest means finding every category key that contains
+the token as a substring (in category order, first 5 kept). Rather than
+scanning all CATEGORIES for every token, we build trigram postings once at
+import: a token's candidates are the intersection of the postings of its
+trigrams, which is then verified with a real substring check. Results are
+memoized per normalized token, so repeated interests cost a dict lookup.
+
+See bench_category_matcher.py for before/after timings.
+"""
+
+from functools import lru_cache
+
+from geo_categories import CATEGORIES, SYNONYMS
+
+# Matches kept per interest token
+MAX_MATCHES_PER_TOKEN = 5
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _build_postings(texts):
+    """trigram -> sorted list of category indices whose text contains it."""
+    postings = {}
+    for idx, text in enumerate(texts):
+        for gram in _trigrams(text):
+            postings.setdefault(gram, []).append(idx)
+    return postings
+
+
+# Category keys as-is ("entertainment.culture.arts_centre") and with
+# underscores as spaces ("entertainment.culture.arts centre")
+_KEYS = list(CATEGORIES)
+_SPACED = [cat.replace('_', ' ') for cat in CATEGORIES]
+_KEY_POSTINGS = _build_postings(_KEYS)
+_SPACED_POSTINGS = _build_postings(_SPACED)
+
+
+def _substring_matches(needle, texts, postings):
+    """Indices (ascending) of texts containing needle, narrowed via trigram postings."""
+    if len(needle) < 3:
+        return [i for i, text in enumerate(texts) if needle in text]
+    candidates = None
+    for gram in _trigrams(needle):
+        ids = postings.get(gram)
+        if not ids:
+            return []
+        candidates = set(ids) if candidates is None else candidates & set(ids)
+        if not candidates:
+            return []
+    return sorted(i for i in candidates if needle in texts[i])
+
+
+@lru_cache(maxsize=4096)
+def categories_for_token(token):
+    """
+    Category keys for one normalized (stripped, lowercased) interest token.
+    Same rules as the original linear scan: synonyms first, then categories
+    containing the token (or its underscored form), then a looser match
+    against categories with underscores read as spaces.
+    """
+    if token in SYNONYMS:
+        return tuple(SYNONYMS[token])
+
+    token_norm = token.replace(' ', '_')
+    ids = set(_substring_matches(token, _KEYS, _KEY_POSTINGS))
+    if token_norm != token:
+        ids.update(_substring_matches(token_norm, _KEYS, _KEY_POSTINGS))
+    matches = sorted(ids)
+
+    if not matches:
+        matches = _substring_matches(token, _SPACED, _SPACED_POSTINGS)
+
+    return tuple(_KEYS[i] for i in matches[:MAX_MATCHES_PER_TOKEN])
+
+
+def map_interests_to_categories(interests):
+    """Categories for a list of free-text interests, de-duplicated in order."""
+    if not interests:
+        return []
+    seen = set()
+    dedup = []
+    for it in interests:
+        token = it.strip().lower()
+        if not token:
+            continue
+        for c in categories_for_token(token):
+            if c not in seen:
+                dedup.append(c)
+                seen.add(c)
+    return dedup
@@ -0,0 +1,141 @@
+"""
+Circuit breakers for upstream services (Geoapify, Open-Meteo, OpenAI, Gemini).
+
+A breaker counts consecutive failures of one upstream. After
+failure_threshold of them it opens: calls are rejected immediately with
+CircuitOpenError, so callers go straight to their fallbacks (haversine
+routing, default weather, default LLM scores) instead of waiting on
+timeouts and retries. After reset_timeout seconds the breaker goes
+half-open and lets a single probe call through; success closes it again,
+failure re-opens it for another reset_timeout.
+
+State is per process (each gunicorn worker finds out on its own).
+"""
+
+import os
+import time
+import threading
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream."""
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._times_opened = 0
+        self._rejected = 0
+        self._last_error = None
+
+    def allow(self):
+        """
+        True if a call may go through now. In half-open state only one probe
+        is allowed at a time; its outcome must be recorded with
+        record_success() / record_failure().
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            # A probe whose outcome was never recorded doesn't block forever
+            probe_stuck = self._probe_in_flight and time.time() - self._probe_started >= self.reset_timeout
+            if self._state == HALF_OPEN and (not self._probe_in_flight or probe_stuck):
+                self._probe_in_flight = True
+                self._probe_started = time.time()
+                return True
+            self._rejected += 1
+            return False
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit open")
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"✓ Circuit closed: {self.name} recovered")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            if error is not None:
+                self._last_error = str(error)[:200]
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._times_opened += 1
+                    print(f"⚡ Circuit open: {self.name} after {self._failures} failures, "
+                          f"retrying in {self.reset_timeout}s")
+                self._state = OPEN
+                self._opened_at = time.time()
+                self._probe_in_flight = False
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker: reject if open, record the outcome otherwise."""
+        self.check()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def get_stats(self):
+        """Breaker state and counters."""
+        state = self.state
+        with self._lock:
+            retry_in = 0
+            if state == OPEN:
+                retry_in = max(0, self.reset_timeout - (time.time() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected,
+                "retry_in_seconds": round(retry_in, 1),
+                "last_error": self._last_error
+            }
+
+
+def _breaker_from_env(name):
+    """Breaker configured by BREAKER_FAILURE_THRESHOLD / BREAKER_RESET_SECONDS."""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+        reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", 30))
+    )
+
+
+BREAKERS = {name: _breaker_from_env(name) for name in ("geoapify", "open_meteo", "openai", "gemini")}
+
+
+def get_stats():
+    """State of every upstream breaker."""
+    return {name: breaker.get_stats() for name, breaker in BREAKERS.items()}
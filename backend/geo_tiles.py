@@ -0,0 +1,169 @@
+"""
+Geohash tiling helpers.
+
+Places are cached per (geohash tile, category) so that nearby queries and
+queries with different radii can share results. This module encodes
+coordinates to geohashes, returns tile bounding boxes, and finds the set of
+tiles covering a search circle.
+"""
+
+from math import radians, cos, sin, asin, sqrt
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+EARTH_RADIUS_M = 6371000
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in meters."""
+    lng1, lat1, lng2, lat2 = map(radians, [lng1, lat1, lng2, lat2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(sqrt(a))
+
+
+def encode(lat, lng, precision):
+    """Encode a coordinate as a geohash string of the given length."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def bbox(geohash):
+    """Return (lat_min, lat_max, lng_min, lng_max) for a geohash tile."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def neighbors(geohash):
+    """The (up to) 8 geohashes of the same precision surrounding a tile."""
+    lat_min, lat_max, lng_min, lng_max = bbox(geohash)
+    step_lat, step_lng = lat_max - lat_min, lng_max - lng_min
+    center_lat, center_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+    found = []
+    for dy in (-1, 0, 1):
+        lat = center_lat + dy * step_lat
+        if not -90.0 < lat < 90.0:
+            continue
+        for dx in (-1, 0, 1):
+            if dx == 0 and dy == 0:
+                continue
+            lng = ((center_lng + dx * step_lng + 180.0) % 360.0) - 180.0
+            gh = encode(lat, lng, len(geohash))
+            if gh != geohash and gh not in found:
+                found.append(gh)
+    return found
+
+
+def tile_size_deg(precision):
+    """(lat_degrees, lng_degrees) spanned by a tile at this precision."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def _circle_intersects_tile(lat, lng, radius_m, tile_bbox):
+    """True if the circle reaches into the tile (distance to nearest tile point <= radius)."""
+    lat_min, lat_max, lng_min, lng_max = tile_bbox
+    nearest_lat = min(max(lat, lat_min), lat_max)
+    nearest_lng = min(max(lng, lng_min), lng_max)
+    return haversine_m(lat, lng, nearest_lat, nearest_lng) <= radius_m
+
+
+def tiles_covering_circle(lat, lng, radius_m, precision):
+    """Geohashes of every tile at `precision` that intersects the circle."""
+    d_lat = radius_m / 111320.0
+    d_lng = radius_m / (111320.0 * max(cos(radians(lat)), 0.01))
+    step_lat, step_lng = tile_size_deg(precision)
+
+    tiles = []
+    seen = set()
+    y = max(lat - d_lat, -90.0)
+    while True:
+        x = lng - d_lng
+        while True:
+            gh = encode(y, ((x + 180.0) % 360.0) - 180.0, precision)
+            if gh not in seen:
+                seen.add(gh)
+                if _circle_intersects_tile(lat, lng, radius_m, bbox(gh)):
+                    tiles.append(gh)
+            if x >= lng + d_lng:
+                break
+            x = min(x + step_lng, lng + d_lng)
+        if y >= min(lat + d_lat, 90.0):
+            break
+        y = min(y + step_lat, lat + d_lat, 90.0)
+    return tiles
+
+
+def _estimated_tile_count(lat, radius_m, precision):
+    """Upper-bound estimate of tiles needed to cover the circle's bounding box."""
+    d_lat = radius_m / 111320.0
+    d_lng = radius_m / (111320.0 * max(cos(radians(lat)), 0.01))
+    step_lat, step_lng = tile_size_deg(precision)
+    return (int(2 * d_lat / step_lat) + 2) * (int(2 * d_lng / step_lng) + 2)
+
+
+def covering_tiles(lat, lng, radius_m, max_tiles):
+    """
+    Cover the circle with the finest geohash precision that needs at most
+    max_tiles tiles. Returns (precision, tiles).
+    """
+    # Pick the precision from a cheap estimate (bounding box tiles overcount
+    # the circle by up to ~2x), then step coarser until the exact cover fits
+    precision = 1
+    for p in range(2, 8):
+        if _estimated_tile_count(lat, radius_m, p) > max_tiles * 2:
+            break
+        precision = p
+    tiles = tiles_covering_circle(lat, lng, radius_m, precision)
+    while len(tiles) > max_tiles and precision > 1:
+        precision -= 1
+        tiles = tiles_covering_circle(lat, lng, radius_m, precision)
+    return precision, tiles
@@ -0,0 +1,265 @@
+"""
+Shared outbound HTTP client for upstream APIs (Geoapify, Open-Meteo).
+
+One requests.Session per process with a keep-alive connection pool mounted
+per upstream host, so repeated calls reuse TCP/TLS connections instead of
+handshaking every time. The client also owns the retry/backoff policy and
+per-host timeouts that used to be copied into individual fetch functions,
+and keeps per-host counters (requests, retries, errors, latency) that are
+reported by /api/cache-stats. Each upstream host has a circuit breaker
+(circuit_breaker.py): while it is open, calls fail fast with
+CircuitOpenError instead of waiting through timeouts and retries. Each
+attempt also takes a token from the upstream's rate limiter
+(rate_limiter.py), waiting briefly or failing with RateLimitedError.
+
+Usage:
+    import http_client
+    r = http_client.get(url, params=params)                  # per-host timeout
+    r = http_client.get(url, params=params, deadline=t)      # no retries past t
+"""
+
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import BREAKERS, CircuitOpenError, OPEN
+from rate_limiter import BUCKETS
+
+# Status codes worth retrying (rate limited / transient upstream errors)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Seconds, used for hosts without an entry in HTTP_TIMEOUTS
+DEFAULT_TIMEOUT = 15
+DEFAULT_HOST_TIMEOUTS = {
+    "api.geoapify.com": 15,
+    "api.open-meteo.com": 10,
+}
+# Upstream host -> upstream name in circuit_breaker.BREAKERS / rate_limiter.BUCKETS
+HOST_UPSTREAMS = {
+    "api.geoapify.com": "geoapify",
+    "api.open-meteo.com": "open_meteo",
+}
+
+
+def _host_timeouts_from_env():
+    """
+    Per-host timeouts, DEFAULT_HOST_TIMEOUTS overridden by HTTP_TIMEOUTS
+    (comma-separated host=seconds, e.g. "api.open-meteo.com=5,api.geoapify.com=20").
+    """
+    timeouts = dict(DEFAULT_HOST_TIMEOUTS)
+    for item in os.getenv("HTTP_TIMEOUTS", "").split(","):
+        host, _, seconds = item.partition("=")
+        if host.strip() and seconds.strip():
+            timeouts[host.strip()] = float(seconds)
+    return timeouts
+
+
+class HttpClient:
+    """
+    Pooled HTTP client with retries and per-host metrics.
+
+    Failed attempts (connection errors, timeouts, RETRY_STATUSES) are retried
+    up to max_retries times with exponential backoff. After the last attempt
+    the final response is returned as-is (callers check r.ok like before) or
+    the final exception is raised. Timeouts, connection errors and
+    RETRY_STATUSES count as failures for the host's breaker (if any), and
+    every attempt takes a token from the host's rate limiter (if any).
+    """
+    def __init__(self, pool_size=10, max_retries=2, backoff=0.5, max_backoff=4.0,
+                 timeouts=None, default_timeout=DEFAULT_TIMEOUT, breakers=None, limiters=None):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.breakers = breakers or {}
+        self.limiters = limiters or {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self._mounted = set()
+        self._stats = {}
+
+    def _session_for(self, scheme, host):
+        """This process's session, with a connection pool mounted for host."""
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                # Pooled sockets must not be shared with a forked parent
+                self._session = requests.Session()
+                self._pid = os.getpid()
+                self._mounted = set()
+            prefix = f"{scheme}://{host}/"
+            if prefix not in self._mounted:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                self._session.mount(prefix, adapter)
+                self._mounted.add(prefix)
+            return self._session
+
+    def _host_stats(self, host):
+        """Counters for host, created on first use. Caller holds the lock."""
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats[host] = {
+                "requests": 0, "attempts": 0, "retries": 0, "errors": 0, "short_circuited": 0, "rate_limited": 0,
+                "total_ms": 0.0, "max_ms": 0.0, "status": {}
+            }
+        return stats
+
+    def _record(self, host, elapsed_ms, status=None, retried=False, failed=False):
+        with self._lock:
+            stats = self._host_stats(host)
+            stats["attempts"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if status is not None:
+                stats["status"][status] = stats["status"].get(status, 0) + 1
+            if retried:
+                stats["retries"] += 1
+            if failed:
+                stats["errors"] += 1
+
+    def request(self, method, url, timeout=None, deadline=None, **kwargs):
+        """
+        Send a request through the host's pool. timeout defaults to the host's
+        configured timeout; deadline (epoch seconds) caps every attempt's
+        timeout and stops retrying once it has passed. Raises CircuitOpenError
+        if the host's breaker is open, RateLimitedError if no rate-limit token
+        becomes available in time.
+        """
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        breaker = self.breakers.get(host)
+        limiter = self.limiters.get(host)
+        session = self._session_for(parts.scheme, parts.netloc)
+        if timeout is None:
+            timeout = self.timeouts.get(host, self.default_timeout)
+        with self._lock:
+            self._host_stats(host)["requests"] += 1
+
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            # Don't spend a rate-limit token on a call the breaker will refuse
+            if breaker is not None and breaker.state == OPEN:
+                self._short_circuit(host, breaker)
+            if limiter is not None:
+                # Callers with a deadline may queue for their whole remaining budget
+                max_wait = limiter.max_wait if deadline is None else deadline - time.time()
+                try:
+                    limiter.acquire(max(0, max_wait))
+                except Exception:
+                    with self._lock:
+                        self._host_stats(host)["rate_limited"] += 1
+                    raise
+            if breaker is not None and not breaker.allow():
+                self._short_circuit(host, breaker)
+
+            attempt_timeout = timeout
+            if deadline is not None:
+                attempt_timeout = min(timeout, deadline - time.time())
+                if attempt_timeout <= 0:
+                    with self._lock:
+                        self._host_stats(host)["errors"] += 1
+                    raise requests.exceptions.Timeout(f"Deadline passed before calling {host}")
+
+            last = attempt == self.max_retries
+            started = time.perf_counter()
+            try:
+                r = session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if breaker is not None:
+                    breaker.record_failure(e)
+                transient = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                retry = transient and not last and self._can_retry(breaker, delay, deadline)
+                self._record(host, (time.perf_counter() - started) * 1000, retried=retry, failed=not retry)
+                if not retry:
+                    raise
+                print(f"Retry {attempt + 1}/{self.max_retries}: {host} {type(e).__name__}")
+            else:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                transient = r.status_code in RETRY_STATUSES
+                if r.status_code == 429 and limiter is not None:
+                    # Over quota: make every thread/worker back off, not just this one
+                    limiter.drain()
+                if breaker is not None:
+                    if transient:
+                        breaker.record_failure(f"HTTP {r.status_code}")
+                    else:
+                        breaker.record_success()
+                retry = transient and not last and self._can_retry(breaker, delay, deadline)
+                self._record(host, elapsed_ms, r.status_code, retried=retry,
+                             failed=not r.ok and not retry)
+                if not retry:
+                    return r
+                print(f"Retry {attempt + 1}/{self.max_retries}: {host} returned {r.status_code}")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def _short_circuit(self, host, breaker):
+        with self._lock:
+            self._host_stats(host)["short_circuited"] += 1
+        raise CircuitOpenError(f"{breaker.name} circuit open, not calling {host}")
+
+    def _can_retry(self, breaker, delay, deadline):
+        """
+        True if another attempt makes sense: the host's breaker hasn't just
+        opened and a backoff of delay seconds still leaves time before the deadline.
+        """
+        if breaker is not None and breaker.state == OPEN:
+            return False
+        return deadline is None or time.time() + delay < deadline
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get_stats(self):
+        """Per-host counters."""
+        with self._lock:
+            result = {}
+            for host, stats in self._stats.items():
+                attempts = stats["attempts"]
+                result[host] = {
+                    "requests": stats["requests"],
+                    "attempts": attempts,
+                    "retries": stats["retries"],
+                    "errors": stats["errors"],
+                    "short_circuited": stats["short_circuited"],
+                    "rate_limited": stats["rate_limited"],
+                    "avg_ms": round(stats["total_ms"] / attempts, 1) if attempts else 0,
+                    "max_ms": round(stats["max_ms"], 1),
+                    "status": {str(code): n for code, n in sorted(stats["status"].items())},
+                    "timeout_seconds": self.timeouts.get(host, self.default_timeout)
+                }
+            return result
+
+
+client = HttpClient(
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", 10)),
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", 2)),
+    backoff=float(os.getenv("HTTP_BACKOFF_SECONDS", 0.5)),
+    timeouts=_host_timeouts_from_env(),
+    default_timeout=float(os.getenv("HTTP_TIMEOUT_SECONDS", DEFAULT_TIMEOUT)),
+    breakers={host: BREAKERS[name] for host, name in HOST_UPSTREAMS.items()},
+    limiters={host: BUCKETS[name] for host, name in HOST_UPSTREAMS.items() if name in BUCKETS}
+)
+
+
+def get(url, **kwargs):
+    """GET through the shared client."""
+    return client.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST through the shared client."""
+    return client.post(url, **kwargs)
+
+
+def get_stats():
+    """Per-host counters of the shared client."""
+    return client.get_stats()
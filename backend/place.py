@@ -0,0 +1,108 @@
+"""
+Compact place records.
+
+A Place holds one candidate activity from Geoapify parsing through to the
+JSON response. It uses __slots__ instead of a per-place dict, and keeps the
+dict-style access (place["name"], place.get("cost"), "lat" in place) that
+the planning code and prompts already use.
+
+Caches store places as plain tuples ("rows", see to_row/from_row): smaller
+than dicts, immutable so per-request scores can't leak into a cached entry,
+and JSON-safe for the SQLite cache backend.
+"""
+
+# Fields parsed from the places source, in row order
+BASE_FIELDS = (
+    "id", "name", "lat", "lng", "type", "cost", "hours",
+    "address", "street", "city", "state", "country"
+)
+# Fields filled in per request (travel times, LLM scores)
+EXTRA_FIELDS = (
+    "travel_time_min", "distance_km",
+    "relevance_score", "matched_reason", "is_outdoor", "weather_warning"
+)
+
+# Row positions of the coordinates, for filtering rows without building Places
+ROW_LAT = BASE_FIELDS.index("lat")
+ROW_LNG = BASE_FIELDS.index("lng")
+
+
+class Place:
+    """
+    One place. Base fields are always set; extra fields only exist once
+    assigned, so get()/in/[] behave like they did on the old place dicts.
+    """
+    __slots__ = BASE_FIELDS + EXTRA_FIELDS
+
+    def __init__(self, id, name, lat, lng, type="N/A", cost="Unknown", hours="N/A",
+                 address="", street="", city="", state="", country=""):
+        self.id = id
+        self.name = name
+        self.lat = lat
+        self.lng = lng
+        self.type = type
+        self.cost = cost
+        self.hours = hours
+        self.address = address
+        self.street = street
+        self.city = city
+        self.state = state
+        self.country = country
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Place from a place dict (e.g. MOCK_PLACES); unknown keys are ignored."""
+        place = cls(*(data.get(f) for f in BASE_FIELDS))
+        for f in EXTRA_FIELDS:
+            if f in data:
+                setattr(place, f, data[f])
+        return place
+
+    @classmethod
+    def from_row(cls, row):
+        """Inverse of to_row (rows may come back from JSON as lists)."""
+        place = cls(*row[:len(BASE_FIELDS)])
+        if len(row) > len(BASE_FIELDS):
+            for f, value in zip(EXTRA_FIELDS, row[len(BASE_FIELDS):]):
+                setattr(place, f, value)
+        return place
+
+    def to_row(self):
+        """
+        Tuple of the base fields, followed by all extra fields (unset ones as
+        None) if any of them has been set.
+        """
+        row = tuple(getattr(self, f) for f in BASE_FIELDS)
+        if any(hasattr(self, f) for f in EXTRA_FIELDS):
+            row += tuple(getattr(self, f, None) for f in EXTRA_FIELDS)
+        return row
+
+    def to_dict(self):
+        """Plain dict of every field that is set (the JSON shape of a place)."""
+        return {f: getattr(self, f) for f in self.__slots__ if hasattr(self, f)}
+
+    # dict-style access
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __repr__(self):
+        return f"Place({self.id!r}, {self.name!r})"
@@ -0,0 +1,226 @@
+"""
+Offline POI index.
+
+Loads a GeoJSON / OSM-style dump of places into a compact spatial index so
+fetch_places_from_geoapify can answer "places of category X within R meters"
+for covered regions without a network round-trip.
+
+Layout: every place is stored once, as the same compact place row the
+Geoapify path caches (see place.py). For each category in geo_categories.CATEGORIES we keep a sorted
+list of geohash keys with a parallel list of place indices. A search circle
+is covered with a handful of geohash tiles, and each tile is a contiguous
+prefix range in the sorted keys, found by bisection.
+
+Usage:
+    python poi_index.py dump.geojson     # import and print index stats
+"""
+
+import sys
+import json
+import time
+from math import cos, radians
+from bisect import bisect_left, bisect_right
+from array import array
+
+import geo_tiles
+from geo_categories import CATEGORIES
+from place import ROW_LAT, ROW_LNG
+
+# Geohash precision stored per place (~150m cells); queries use coarser prefixes
+KEY_PRECISION = 7
+# Upper bound on tiles used to cover one query circle
+MAX_QUERY_TILES = 16
+
+_KNOWN_CATEGORIES = set(CATEGORIES)
+
+# Common OSM tags -> Geoapify category keys, for raw OSM-style dumps
+OSM_TAG_CATEGORIES = {
+    ("amenity", "restaurant"): "catering.restaurant",
+    ("amenity", "fast_food"): "catering.fast_food",
+    ("amenity", "cafe"): "catering.cafe",
+    ("amenity", "bar"): "catering.bar",
+    ("amenity", "pub"): "catering.pub",
+    ("amenity", "ice_cream"): "catering.ice_cream",
+    ("amenity", "library"): "education.library",
+    ("amenity", "cinema"): "entertainment.cinema",
+    ("amenity", "theatre"): "entertainment.culture.theatre",
+    ("amenity", "arts_centre"): "entertainment.culture.arts_centre",
+    ("tourism", "museum"): "entertainment.museum",
+    ("tourism", "zoo"): "entertainment.zoo",
+    ("tourism", "aquarium"): "entertainment.aquarium",
+    ("tourism", "gallery"): "entertainment.culture.gallery",
+    ("tourism", "attraction"): "tourism.attraction",
+    ("tourism", "viewpoint"): "tourism.attraction.viewpoint",
+    ("tourism", "hotel"): "accommodation.hotel",
+    ("tourism", "hostel"): "accommodation.hostel",
+    ("tourism", "camp_site"): "camping.camp_site",
+    ("leisure", "park"): "leisure.park",
+    ("leisure", "garden"): "leisure.park.garden",
+    ("leisure", "playground"): "leisure.playground",
+    ("natural", "beach"): "beach",
+    ("historic", "monument"): "tourism.sights.memorial.monument",
+    ("historic", "memorial"): "tourism.sights.memorial",
+    ("shop", "books"): "commercial.books",
+    ("shop", "mall"): "commercial.shopping_mall",
+    ("shop", "supermarket"): "commercial.supermarket",
+    ("shop", "bakery"): "commercial.food_and_drink.bakery",
+    ("craft", "brewery"): "production.brewery",
+}
+
+
+def _feature_categories(props):
+    """
+    Known category keys for a feature, including every parent key
+    (e.g. catering.cafe.coffee also indexes catering.cafe and catering).
+    """
+    raw = []
+    for c in props.get("categories") or []:
+        raw.append(c.get("key") if isinstance(c, dict) else str(c))
+    for (tag, value), cat in OSM_TAG_CATEGORIES.items():
+        if props.get(tag) == value:
+            raw.append(cat)
+
+    cats = set()
+    for key in raw:
+        if not key:
+            continue
+        parts = key.split(".")
+        for i in range(1, len(parts) + 1):
+            prefix = ".".join(parts[:i])
+            if prefix in _KNOWN_CATEGORIES:
+                cats.add(prefix)
+    return cats
+
+
+def _iter_features(path):
+    """Yield features from a GeoJSON FeatureCollection or a line-delimited GeoJSON file."""
+    with open(path, encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "{":
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = None
+            if data is not None:
+                if data.get("type") == "FeatureCollection":
+                    yield from data.get("features", [])
+                else:
+                    yield data
+                return
+            f.seek(0)
+        for line in f:
+            line = line.strip().rstrip(",")
+            if line.startswith("{"):
+                yield json.loads(line)
+
+
+class PoiIndex:
+    """
+    In-memory spatial index of places keyed by Geoapify category.
+    Build it with PoiIndex.from_geojson(); query it with query().
+    """
+    def __init__(self):
+        self.places = []        # place rows (Place.to_row()), same as the places cache holds
+        self._keys = {}         # category -> sorted list of geohash keys
+        self._ids = {}          # category -> array of place indices, parallel to _keys
+        self.bounds = None      # (lat_min, lat_max, lng_min, lng_max) of the imported data
+
+    @classmethod
+    def from_geojson(cls, path, normalize):
+        """
+        Import a dump. `normalize(feature, category, categories)` converts a
+        feature to a Place; it is called with the feature's most specific
+        category and all the category keys it matched.
+        """
+        started = time.time()
+        index = cls()
+        staged = {}
+        lat_min = lng_min = float("inf")
+        lat_max = lng_max = float("-inf")
+
+        for feat in _iter_features(path):
+            props = feat.get("properties", {})
+            cats = _feature_categories(props)
+            if not cats:
+                continue
+            most_specific = max(cats, key=lambda c: c.count("."))
+            place = normalize(feat, most_specific, cats)
+            if place.get("lat") is None or place.get("lng") is None:
+                continue
+
+            idx = len(index.places)
+            index.places.append(place.to_row())
+            key = geo_tiles.encode(place["lat"], place["lng"], KEY_PRECISION)
+            for cat in cats:
+                staged.setdefault(cat, []).append((key, idx))
+
+            lat_min = min(lat_min, place["lat"])
+            lat_max = max(lat_max, place["lat"])
+            lng_min = min(lng_min, place["lng"])
+            lng_max = max(lng_max, place["lng"])
+
+        for cat, entries in staged.items():
+            entries.sort()
+            index._keys[cat] = [k for k, _ in entries]
+            index._ids[cat] = array("i", (i for _, i in entries))
+        if index.places:
+            index.bounds = (lat_min, lat_max, lng_min, lng_max)
+
+        print(f"Loaded POI index from {path}: {len(index.places)} places, "
+              f"{len(index._keys)} categories in {time.time() - started:.1f}s")
+        return index
+
+    def covers(self, lat, lng, radius_m):
+        """True if the search circle lies inside the imported data's bounding box."""
+        if self.bounds is None:
+            return False
+        lat_min, lat_max, lng_min, lng_max = self.bounds
+        d_lat = radius_m / 111320.0
+        d_lng = radius_m / (111320.0 * max(cos(radians(lat)), 0.01))
+        return (lat - d_lat >= lat_min and lat + d_lat <= lat_max and
+                lng - d_lng >= lng_min and lng + d_lng <= lng_max)
+
+    def query(self, lat, lng, radius_m, category, tiles=None):
+        """
+        Places of `category` within radius_m of (lat, lng) as (distance_m, row)
+        pairs, nearest first. Pass precomputed covering tiles to reuse them
+        across categories.
+        """
+        keys = self._keys.get(category)
+        if not keys:
+            return []
+        ids = self._ids[category]
+        if tiles is None:
+            _, tiles = geo_tiles.covering_tiles(lat, lng, radius_m, MAX_QUERY_TILES)
+
+        results = []
+        for tile in tiles:
+            lo = bisect_left(keys, tile)
+            hi = bisect_right(keys, tile + "~")  # '~' sorts after every base32 char
+            for i in range(lo, hi):
+                row = self.places[ids[i]]
+                dist = geo_tiles.haversine_m(lat, lng, row[ROW_LAT], row[ROW_LNG])
+                if dist <= radius_m:
+                    results.append((dist, row))
+        results.sort(key=lambda pair: pair[0])
+        return results
+
+    def get_stats(self):
+        """Basic index statistics."""
+        return {
+            "places": len(self.places),
+            "categories": len(self._keys),
+            "bounds": self.bounds
+        }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python poi_index.py <dump.geojson>")
+        sys.exit(1)
+    from services import _normalize_place
+    idx = PoiIndex.from_geojson(sys.argv[1], _normalize_place)
+    print(json.dumps(idx.get_stats(), indent=2))
@@ -0,0 +1,203 @@
+"""
+Token-bucket rate limiting for upstream API quotas (e.g. Geoapify's
+requests-per-second cap on the free tier).
+
+Each upstream has one bucket holding up to `burst` tokens, refilled at
+`rate` tokens per second; every outbound attempt takes a token. A caller
+that finds the bucket empty sleeps until a token is due, but never longer
+than its max wait: past that it gets RateLimitedError and degrades to its
+fallback instead of queueing indefinitely.
+
+Buckets are shared by every thread of a process, and by every gunicorn
+worker on the host when RATE_LIMIT_DB (or CACHE_DIR) points at a SQLite
+file: the bucket is then one row, updated under BEGIN IMMEDIATE so only one
+worker takes a token at a time.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+
+class RateLimitedError(Exception):
+    """Raised when a token isn't available within the caller's max wait."""
+
+
+class TokenBucket:
+    """
+    One upstream's bucket. State lives in memory, or in a SQLite file shared
+    by every process on the host if path is given.
+    """
+    def __init__(self, name, rate, burst=None, path=None, max_wait=2.0):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.path = path
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._conn = None
+        self._pid = None
+        # metrics
+        self._acquired = 0
+        self._waited = 0
+        self._rejected = 0
+        self._wait_ms = 0.0
+        self._max_wait_ms = 0.0
+
+    def _connection(self):
+        """This process's connection to the shared bucket file. Caller holds the lock."""
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _refill(self, tokens, updated, now):
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _take(self, cost=1.0):
+        """
+        Take a token if one is available. Returns 0 on success, otherwise the
+        seconds until enough tokens will have accumulated.
+        """
+        with self._lock:
+            now = time.time()
+            if self.path is None:
+                tokens = self._refill(self._tokens, self._updated, now)
+                wait = 0.0 if tokens >= cost else (cost - tokens) / self.rate
+                self._tokens = tokens - cost if not wait else tokens
+                self._updated = now
+                return wait
+
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                tokens = self._refill(row[0], row[1], now) if row else self.burst
+                wait = 0.0 if tokens >= cost else (cost - tokens) / self.rate
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (self.name, tokens - cost if not wait else tokens, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return wait
+
+    def acquire(self, max_wait=None):
+        """
+        Take one token, sleeping until one is available for at most max_wait
+        seconds (default: the bucket's max_wait). Returns the seconds waited;
+        raises RateLimitedError if no token came up in time.
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        started = time.perf_counter()
+        while True:
+            wait = self._take()
+            waited = time.perf_counter() - started
+            if not wait:
+                self._record(waited, rejected=False)
+                return waited
+            if waited + wait > max_wait:
+                self._record(waited, rejected=True)
+                raise RateLimitedError(f"{self.name} rate limit: no token within {max_wait:.1f}s")
+            time.sleep(wait)
+
+    def drain(self):
+        """
+        Empty the bucket, e.g. after the upstream answered 429, so every
+        thread/worker backs off for about one token interval.
+        """
+        with self._lock:
+            now = time.time()
+            if self.path is None:
+                self._tokens = 0.0
+                self._updated = now
+                return
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, 0, ?)",
+                (self.name, now)
+            )
+
+    def _record(self, waited, rejected):
+        waited_ms = waited * 1000
+        with self._lock:
+            if rejected:
+                self._rejected += 1
+            else:
+                self._acquired += 1
+            if waited_ms > 0.5:
+                self._waited += 1
+            self._wait_ms += waited_ms
+            self._max_wait_ms = max(self._max_wait_ms, waited_ms)
+
+    def get_stats(self):
+        """Bucket settings and wait-time metrics."""
+        with self._lock:
+            calls = self._acquired + self._rejected
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "shared": self.path is not None,
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "rejected": self._rejected,
+                "total_wait_ms": round(self._wait_ms, 1),
+                "avg_wait_ms": round(self._wait_ms / calls, 3) if calls else 0,
+                "max_wait_ms": round(self._max_wait_ms, 1)
+            }
+
+
+# Requests per second per upstream; override with RATE_LIMITS="geoapify=5,open_meteo=10"
+DEFAULT_RATES = {
+    "geoapify": 5,
+    "open_meteo": 10,
+}
+
+
+def _rates_from_env():
+    rates = dict(DEFAULT_RATES)
+    for item in os.getenv("RATE_LIMITS", "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def _shared_path_from_env():
+    """SQLite file for buckets shared across workers: RATE_LIMIT_DB, else CACHE_DIR/ratelimit.db."""
+    path = os.getenv("RATE_LIMIT_DB")
+    if path:
+        return path
+    cache_dir = os.getenv("CACHE_DIR")
+    return os.path.join(cache_dir, "ratelimit.db") if cache_dir else None
+
+
+BUCKETS = {
+    name: TokenBucket(
+        name, rate,
+        path=_shared_path_from_env(),
+        max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", 2))
+    )
+    for name, rate in _rates_from_env().items()
+    if rate > 0  # 0 disables limiting for that upstream
+}
+
+
+def get_stats():
+    """Wait-time metrics of every upstream bucket."""
+    return {name: bucket.get_stats() for name, bucket in BUCKETS.items()}
@@ -0,0 +1,423 @@
+"""
+Offline routing over a road graph extract.
+
+Loads road geometry (GeoJSON LineStrings with OSM-style "highway" /
+"oneway" / "maxspeed" properties, e.g. an osmtogeojson export, or a
+synthetic network in the same shape) into compact arrays and answers
+shortest-path queries locally, so calculate_route and the start-to-places
+matrix need no routing API (ROUTING_ENGINE=local, ROAD_GRAPH_PATH).
+
+Layout: node coordinates are two float arrays. Each travel mode (drive,
+bicycle, walk) has its own CSR adjacency: indptr / indices plus parallel
+per-edge travel seconds and meters, built from the highway classes that
+mode may use (one-way streets only restrict driving). Driving also keeps
+a reverse CSR for the backward half of bidirectional search. A coarse grid
+over the nodes snaps coordinates to the nearest usable node.
+
+Queries:
+- point to point: bidirectional A* on travel time (straight-line
+  potentials at the mode's top speed)
+- one to many (the start-to-every-place case): a single Dijkstra from the
+  source that stops once every target is settled
+
+Building from GeoJSON takes a while for large extracts; save the arrays
+once with the CLI and point ROAD_GRAPH_PATH at the .npz file instead.
+
+Usage:
+    python road_graph.py roads.geojson [roads.npz]   # import, print stats, optionally save
+"""
+
+import sys
+import json
+import time
+import heapq
+from math import cos, radians
+
+import numpy as np
+
+import geo_tiles
+import travel_estimator
+from poi_index import _iter_features
+
+MODES = ("drive", "bicycle", "walk")
+
+# Driving speed (km/h) by OSM highway class; a numeric maxspeed tag wins
+DRIVE_SPEEDS_KMH = {
+    "motorway": 100, "motorway_link": 60, "trunk": 80, "trunk_link": 50,
+    "primary": 60, "primary_link": 40, "secondary": 50, "secondary_link": 40,
+    "tertiary": 40, "tertiary_link": 30, "unclassified": 30, "road": 30,
+    "residential": 25, "living_street": 10, "service": 15,
+}
+WALK_KMH = 5
+BIKE_KMH = 15
+# Highway classes closed to walking / cycling
+NO_WALK = {"motorway", "motorway_link", "trunk", "trunk_link"}
+NO_BIKE = NO_WALK | {"steps"}
+# Non-road classes we still index for walking / cycling
+PATHS = {"footway", "path", "pedestrian", "steps", "cycleway", "bridleway", "track"}
+
+# Node coordinates are merged when equal at this many decimals (~1 cm)
+NODE_DECIMALS = 7
+# Snapping grid cell size in degrees, and the farthest a point may snap (meters)
+SNAP_CELL_DEG = 0.01
+SNAP_MAX_M = 1000
+
+
+def _mode_speeds_kmh(props):
+    """{mode: km/h} for the modes allowed on this way (empty if none)."""
+    highway = props.get("highway")
+    if not highway:
+        return {}
+    speeds = {}
+    if highway in DRIVE_SPEEDS_KMH:
+        speed = DRIVE_SPEEDS_KMH[highway]
+        try:
+            speed = float(str(props.get("maxspeed", "")).split()[0])
+        except (ValueError, IndexError):
+            pass
+        speeds["drive"] = speed
+    if highway in DRIVE_SPEEDS_KMH or highway in PATHS:
+        if highway not in NO_WALK:
+            speeds["walk"] = WALK_KMH
+        if highway not in NO_BIKE:
+            speeds["bicycle"] = BIKE_KMH
+    return speeds
+
+
+def _oneway(props):
+    """1 (forward only), -1 (reverse only) or 0 for a way's driving direction."""
+    value = str(props.get("oneway", "")).lower()
+    if value in ("yes", "true", "1"):
+        return 1
+    if value == "-1":
+        return -1
+    return 1 if props.get("junction") == "roundabout" else 0
+
+
+def _csr(n, src, dst, seconds, meters):
+    """CSR arrays (indptr, indices, seconds, meters) for edges src -> dst."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return (indptr, dst[order].astype(np.int32),
+            seconds[order].astype(np.float32), meters[order].astype(np.float32))
+
+
+class RoadGraph:
+    """
+    Road network in CSR arrays, per travel mode.
+    Build it with RoadGraph.from_geojson() or RoadGraph.load(); query it with
+    route() / one_to_many() / matrix().
+    """
+    def __init__(self, lat, lng, csr, reverse_csr):
+        self.lat = lat
+        self.lng = lng
+        self._csr = csr                  # mode -> (indptr, indices, seconds, meters)
+        self._reverse = reverse_csr      # mode -> reverse CSR; symmetric modes reuse _csr
+        self._grids = {}                 # mode -> {(cell_y, cell_x): node array}
+        self._speeds = {}                # mode -> fastest edge speed (m/s)
+
+    # ---- building / persistence ----
+
+    @classmethod
+    def from_geojson(cls, path):
+        """Import LineString / MultiLineString road features."""
+        started = time.time()
+        node_ids = {}
+        lat, lng = [], []
+        edges = {mode: ([], [], []) for mode in MODES}   # mode -> (src, dst, meters)
+        speeds_by_edge = {mode: [] for mode in MODES}
+
+        def node(lon_p, lat_p):
+            key = (round(lat_p, NODE_DECIMALS), round(lon_p, NODE_DECIMALS))
+            idx = node_ids.get(key)
+            if idx is None:
+                idx = node_ids[key] = len(lat)
+                lat.append(key[0])
+                lng.append(key[1])
+            return idx
+
+        for feat in _iter_features(path):
+            props = feat.get("properties") or {}
+            speeds = _mode_speeds_kmh(props)
+            if not speeds:
+                continue
+            geometry = feat.get("geometry") or {}
+            if geometry.get("type") == "LineString":
+                lines = [geometry.get("coordinates") or []]
+            elif geometry.get("type") == "MultiLineString":
+                lines = geometry.get("coordinates") or []
+            else:
+                continue
+            oneway = _oneway(props)
+            for line in lines:
+                ids = [node(c[0], c[1]) for c in line if len(c) >= 2]
+                for u, v in zip(ids, ids[1:]):
+                    if u == v:
+                        continue
+                    meters = geo_tiles.haversine_m(lat[u], lng[u], lat[v], lng[v])
+                    for mode, kmh in speeds.items():
+                        src, dst, length = edges[mode]
+                        directions = [(u, v), (v, u)]
+                        if mode == "drive" and oneway:
+                            directions = [(u, v)] if oneway == 1 else [(v, u)]
+                        for a, b in directions:
+                            src.append(a)
+                            dst.append(b)
+                            length.append(meters)
+                            speeds_by_edge[mode].append(kmh)
+
+        n = len(lat)
+        csr, reverse = {}, {}
+        for mode in MODES:
+            src, dst, length = (np.asarray(x) for x in edges[mode])
+            src = src.astype(np.int64)
+            dst = dst.astype(np.int64)
+            meters = np.asarray(length, dtype=float)
+            seconds = meters / (np.asarray(speeds_by_edge[mode], dtype=float) / 3.6) if len(meters) else meters
+            csr[mode] = _csr(n, src, dst, seconds, meters)
+            if mode == "drive":
+                reverse[mode] = _csr(n, dst, src, seconds, meters)
+
+        graph = cls(np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64), csr, reverse)
+        print(f"Loaded road graph from {path}: {n} nodes, "
+              f"{len(csr['drive'][1])} drive / {len(csr['walk'][1])} walk edges in {time.time() - started:.1f}s")
+        return graph
+
+    def save(self, path):
+        """Write the arrays to a .npz file for fast loading."""
+        arrays = {"lat": self.lat, "lng": self.lng}
+        for mode, parts in self._csr.items():
+            for name, arr in zip(("indptr", "indices", "seconds", "meters"), parts):
+                arrays[f"{mode}_{name}"] = arr
+        for mode, parts in self._reverse.items():
+            for name, arr in zip(("indptr", "indices", "seconds", "meters"), parts):
+                arrays[f"{mode}_rev_{name}"] = arr
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load a graph saved with save() (.npz) or import a GeoJSON file."""
+        if not path.endswith(".npz"):
+            return cls.from_geojson(path)
+        started = time.time()
+        data = np.load(path)
+        names = ("indptr", "indices", "seconds", "meters")
+        csr = {mode: tuple(data[f"{mode}_{name}"] for name in names) for mode in MODES}
+        reverse = {mode: tuple(data[f"{mode}_rev_{name}"] for name in names)
+                   for mode in MODES if f"{mode}_rev_indptr" in data}
+        graph = cls(data["lat"], data["lng"], csr, reverse)
+        print(f"Loaded road graph from {path}: {len(graph.lat)} nodes in {time.time() - started:.1f}s")
+        return graph
+
+    # ---- snapping ----
+
+    def _grid(self, mode):
+        """Nodes with at least one edge in this mode, bucketed by grid cell."""
+        grid = self._grids.get(mode)
+        if grid is None:
+            indptr = self._csr[mode][0]
+            usable = np.nonzero(np.diff(indptr) > 0)[0]
+            if mode in self._reverse:
+                rev_indptr = self._reverse[mode][0]
+                usable = np.union1d(usable, np.nonzero(np.diff(rev_indptr) > 0)[0])
+            cells_y = np.floor(self.lat[usable] / SNAP_CELL_DEG).astype(np.int64)
+            cells_x = np.floor(self.lng[usable] / SNAP_CELL_DEG).astype(np.int64)
+            grid = {}
+            for node, cy, cx in zip(usable.tolist(), cells_y.tolist(), cells_x.tolist()):
+                grid.setdefault((cy, cx), []).append(node)
+            grid = {cell: np.asarray(nodes) for cell, nodes in grid.items()}
+            self._grids[mode] = grid
+        return grid
+
+    def snap(self, lat, lng, mode):
+        """(node, distance_m) of the nearest node usable in mode, or (None, None) if none within SNAP_MAX_M."""
+        grid = self._grid(mode)
+        cy = int(np.floor(lat / SNAP_CELL_DEG))
+        cx = int(np.floor(lng / SNAP_CELL_DEG))
+        cell_m = SNAP_CELL_DEG * 111320.0 * max(cos(radians(lat)), 0.01)
+        rings = int(SNAP_MAX_M // cell_m) + 1
+        best, best_m = None, None
+        for ring in range(rings + 1):
+            candidates = [grid[(cy + dy, cx + dx)]
+                          for dy in range(-ring, ring + 1) for dx in range(-ring, ring + 1)
+                          if max(abs(dy), abs(dx)) == ring and (cy + dy, cx + dx) in grid]
+            if candidates:
+                nodes = np.concatenate(candidates)
+                dist = travel_estimator.haversine_km(lat, lng, self.lat[nodes], self.lng[nodes]) * 1000
+                i = int(np.argmin(dist))
+                if best_m is None or dist[i] < best_m:
+                    best, best_m = int(nodes[i]), float(dist[i])
+            # Anything in the next ring is at least ring * cell_m away
+            if best_m is not None and best_m <= ring * cell_m:
+                break
+        if best_m is None or best_m > SNAP_MAX_M:
+            return None, None
+        return best, best_m
+
+    # ---- shortest paths ----
+
+    def _expand(self, csr, node):
+        indptr, indices, seconds, meters = csr
+        a, b = indptr[node], indptr[node + 1]
+        return zip(indices[a:b].tolist(), seconds[a:b].tolist(), meters[a:b].tolist())
+
+    def _max_speed(self, mode):
+        """Fastest edge speed in mode (m/s), for admissible A* potentials."""
+        speed = self._speeds.get(mode)
+        if speed is None:
+            _, _, seconds, meters = self._csr[mode]
+            moving = seconds > 0
+            speed = float((meters[moving] / seconds[moving]).max()) if moving.any() else 1.0
+            self._speeds[mode] = speed
+        return speed
+
+    def shortest_path(self, source, target, mode):
+        """
+        (seconds, meters) of the fastest path between two nodes, or None if
+        unreachable. Bidirectional A*: both searches use the average of the
+        straight-line-to-target and from-source potentials (at the mode's top
+        speed), which keeps them consistent with each other, so the usual
+        bidirectional stopping rule still holds.
+        """
+        if source == target:
+            return 0.0, 0.0
+        forward = self._csr[mode]
+        backward = self._reverse.get(mode, forward)
+        scale = 1.0 / (2 * self._max_speed(mode))
+        s_lat, s_lng = float(self.lat[source]), float(self.lng[source])
+        t_lat, t_lng = float(self.lat[target]), float(self.lng[target])
+        potentials = {}
+
+        def potential(node):
+            p = potentials.get(node)
+            if p is None:
+                lat, lng = float(self.lat[node]), float(self.lng[node])
+                p = potentials[node] = (geo_tiles.haversine_m(lat, lng, t_lat, t_lng) - geo_tiles.haversine_m(s_lat, s_lng, lat, lng)) * scale
+            return p
+
+        sign = (1.0, -1.0)  # the backward search uses the negated potential
+        dist = ({source: (0.0, 0.0)}, {target: (0.0, 0.0)})
+        settled = (set(), set())
+        heaps = ([(potential(source), 0.0, 0.0, source)], [(-potential(target), 0.0, 0.0, target)])
+        graphs = (forward, backward)
+        best = None
+
+        while heaps[0] and heaps[1]:
+            # Stop once no path through unsettled nodes can beat the best meeting point
+            if best is not None and heaps[0][0][0] + heaps[1][0][0] >= best[0]:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, secs, m, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+            other = dist[1 - side]
+            for nxt, edge_s, edge_m in self._expand(graphs[side], node):
+                cand = (secs + edge_s, m + edge_m)
+                known = dist[side].get(nxt)
+                if known is None or cand[0] < known[0]:
+                    dist[side][nxt] = cand
+                    heapq.heappush(heaps[side], (cand[0] + sign[side] * potential(nxt), cand[0], cand[1], nxt))
+                    if nxt in other:
+                        total = (cand[0] + other[nxt][0], cand[1] + other[nxt][1])
+                        if best is None or total[0] < best[0]:
+                            best = total
+        return best
+
+    def one_to_many(self, source, targets, mode):
+        """{target: (seconds, meters)} for every reachable target, from one Dijkstra run."""
+        csr = self._csr[mode]
+        remaining = set(targets)
+        found = {}
+        dist = {source: 0.0}
+        heap = [(0.0, 0.0, source)]
+        settled = set()
+        while heap and remaining:
+            secs, m, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node in remaining:
+                found[node] = (secs, m)
+                remaining.discard(node)
+            for nxt, edge_s, edge_m in self._expand(csr, node):
+                cand = secs + edge_s
+                if cand < dist.get(nxt, float("inf")):
+                    dist[nxt] = cand
+                    heapq.heappush(heap, (cand, m + edge_m, nxt))
+        return found
+
+    # ---- routes in the app's shapes ----
+
+    def _snap_leg_cost(self, snap_m, mode):
+        """(km, min) to get from a coordinate to its snapped node, at the mode's average speed."""
+        km = snap_m / 1000
+        return km, float(travel_estimator.minutes_for(km, mode))
+
+    def route(self, waypoints, mode):
+        """
+        calculate_route-shaped dict for (lat, lng) waypoints, or None if a
+        waypoint can't be snapped or a leg is unreachable.
+        """
+        snapped = [self.snap(lat, lng, mode) for lat, lng in waypoints]
+        if any(node is None for node, _ in snapped):
+            return None
+        legs = []
+        for (a, a_m), (b, b_m) in zip(snapped, snapped[1:]):
+            path = self.shortest_path(a, b, mode)
+            if path is None:
+                return None
+            access_km, access_min = self._snap_leg_cost(a_m + b_m, mode)
+            legs.append({
+                "distance_km": path[1] / 1000 + access_km,
+                "time_min": path[0] / 60 + access_min
+            })
+        return {
+            "total_distance_km": round(sum(leg["distance_km"] for leg in legs), 2),
+            "total_time_min": round(sum(leg["time_min"] for leg in legs), 1),
+            "legs": legs
+        }
+
+    def matrix(self, sources, targets, mode):
+        """
+        Rows (one per source) of {"distance_km", "time_min"} cells, None
+        where the pair can't be routed. One Dijkstra run per source.
+        """
+        snapped_targets = [self.snap(lat, lng, mode) for lat, lng in targets]
+        target_nodes = [node for node, _ in snapped_targets if node is not None]
+        rows = []
+        for lat, lng in sources:
+            source, source_m = self.snap(lat, lng, mode)
+            found = self.one_to_many(source, target_nodes, mode) if source is not None else {}
+            row = []
+            for node, target_m in snapped_targets:
+                path = found.get(node) if node is not None else None
+                if path is None:
+                    row.append(None)
+                    continue
+                access_km, access_min = self._snap_leg_cost(source_m + target_m, mode)
+                row.append({"distance_km": path[1] / 1000 + access_km, "time_min": path[0] / 60 + access_min})
+            rows.append(row)
+        return rows
+
+    def get_stats(self):
+        """Basic graph statistics."""
+        return {
+            "nodes": len(self.lat),
+            "edges": {mode: int(len(parts[1])) for mode, parts in self._csr.items()},
+            "bytes": int(self.lat.nbytes + self.lng.nbytes +
+                         sum(arr.nbytes for parts in list(self._csr.values()) + list(self._reverse.values())
+                             for arr in parts))
+        }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("usage: python road_graph.py <roads.geojson> [out.npz]")
+        sys.exit(1)
+    graph = RoadGraph.from_geojson(sys.argv[1])
+    print(json.dumps(graph.get_stats(), indent=2))
+    if len(sys.argv) == 3:
+        graph.save(sys.argv[2])
+        print(f"Saved {sys.argv[2]}")
@@ -0,0 +1,128 @@
+"""
+Visiting-order optimization for a route's intermediate stops.
+
+Given an N x N travel-time matrix (e.g. TravelMatrix.minutes) whose index 0
+is the fixed start, find the order of the other stops that minimizes total
+travel time, optionally keeping the last stop fixed as the end:
+
+1. Nearest neighbour builds an initial path.
+2. Best-improvement local search alternates 2-opt (reverse a segment) and
+   Or-opt (move a run of 1-3 stops elsewhere) until neither helps.
+
+Every candidate move of a kind is scored at once with NumPy, using prefix
+sums of the path's forward and reverse leg costs, so reversals are priced
+correctly on asymmetric (one-way streets) matrices and ~50 stops take a few
+milliseconds. A free end is handled as a fixed dummy end that every stop
+reaches at zero cost.
+"""
+
+import numpy as np
+
+# Longest run of consecutive stops Or-opt moves as a block
+OR_OPT_MAX_SEGMENT = 3
+# Safety cap on local search moves
+MAX_MOVES = 1000
+_EPS = 1e-9
+
+
+def path_cost(cost, path):
+    """Total cost of visiting path (indices) in order."""
+    path = np.asarray(path)
+    return float(cost[path[:-1], path[1:]].sum()) if len(path) > 1 else 0.0
+
+
+def _nearest_neighbour(cost, end):
+    """Path from 0 to end, always going to the nearest unvisited stop."""
+    n = len(cost)
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[0] = unvisited[end] = False
+    path = [0]
+    while unvisited.any():
+        row = np.where(unvisited, cost[path[-1]], np.inf)
+        nxt = int(np.argmin(row))
+        path.append(nxt)
+        unvisited[nxt] = False
+    path.append(end)
+    return np.array(path)
+
+
+def _best_two_opt(cost, path):
+    """(delta, i, j) of the best segment reversal path[i..j], or None if none improves."""
+    last = len(path) - 2  # last movable position
+    if last < 2:
+        return None
+    forward = np.concatenate(([0.0], np.cumsum(cost[path[:-1], path[1:]])))
+    backward = np.concatenate(([0.0], np.cumsum(cost[path[1:], path[:-1]])))
+    i, j = np.triu_indices(last + 1, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+    before, first, final, after = path[i - 1], path[i], path[j], path[j + 1]
+    delta = (cost[before, final] + cost[first, after] + (backward[j] - backward[i])
+             - cost[before, first] - cost[final, after] - (forward[j] - forward[i]))
+    best = int(np.argmin(delta))
+    if delta[best] >= -_EPS:
+        return None
+    return float(delta[best]), int(i[best]), int(j[best])
+
+
+def _best_or_opt(cost, path):
+    """(delta, i, length, k) of the best move of path[i:i+length] to after position k, or None."""
+    last = len(path) - 2
+    best = None
+    for length in range(1, min(OR_OPT_MAX_SEGMENT, last) + 1):
+        starts = np.arange(1, last - length + 2)
+        if not len(starts):
+            continue
+        ends = starts + length - 1
+        removed = (cost[path[starts - 1], path[ends + 1]]
+                   - cost[path[starts - 1], path[starts]] - cost[path[ends], path[ends + 1]])
+        # insert between path[k] and path[k + 1]
+        k = np.arange(0, last + 1)
+        inserted = (cost[path[k][None, :], path[starts][:, None]] + cost[path[ends][:, None], path[k + 1][None, :]]
+                    - cost[path[k], path[k + 1]][None, :])
+        delta = removed[:, None] + inserted
+        # k inside or next to the segment is not a move
+        overlap = (k[None, :] >= starts[:, None] - 1) & (k[None, :] <= ends[:, None])
+        delta[overlap] = np.inf
+        s, kk = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if delta[s, kk] < -_EPS and (best is None or delta[s, kk] < best[0]):
+            best = (float(delta[s, kk]), int(starts[s]), length, int(k[kk]))
+    return best
+
+
+def optimize_order(minutes, fixed_end=False):
+    """
+    Visiting order (list of indices, starting with 0) over an N x N matrix
+    of travel times that minimizes the total. Index 0 stays first; with
+    fixed_end the last index also stays last.
+    """
+    cost = np.asarray(minutes, dtype=float)
+    n = len(cost)
+    if n <= 3 - (0 if fixed_end else 1):
+        return list(range(n))
+    if not fixed_end:
+        # Dummy end reached from anywhere at no cost, never left
+        padded = np.zeros((n + 1, n + 1))
+        padded[:n, :n] = cost
+        padded[n, :] = np.inf
+        cost = padded
+    end = len(cost) - 1
+
+    path = _nearest_neighbour(cost, end)
+    for _ in range(MAX_MOVES):
+        move = _best_two_opt(cost, path)
+        if move is not None:
+            _, i, j = move
+            path[i:j + 1] = path[i:j + 1][::-1]
+            continue
+        move = _best_or_opt(cost, path)
+        if move is None:
+            break
+        _, i, length, k = move
+        segment = path[i:i + length]
+        rest = np.concatenate((path[:i], path[i + length:]))
+        at = k + 1 if k < i else k + 1 - length
+        path = np.concatenate((rest[:at], segment, rest[at:]))
+
+    order = [int(x) for x in path]
+    return order if fixed_end else order[:-1]
@@ -0,0 +1,336 @@
+"""
+Local itinerary scheduler for smart plans.
+
+plan_trip_smart used to ask the LLM to pick, order and time the day's
+activities and to write durations and costs as text, which we then parsed
+back. The LLM now only scores places and writes reasons; this module
+builds the timed itinerary deterministically: an orienteering problem
+with time windows (maximize the relevance collected between start_time and
+end_time, given activity durations, opening hours and travel times).
+
+Heuristic, fast for the few dozen candidates a plan has:
+1. Greedy insertion: repeatedly insert the candidate, at the position,
+   with the best value gained per minute added to the day (value is the
+   relevance score squared, so strong matches win over filler).
+2. 2-opt: reverse segments of the route while that ends the day earlier,
+   freeing time for step 1.
+3. Swaps: replace a scheduled stop by a better unscheduled one when the
+   day stays feasible.
+Each further stop of a kind (a second restaurant, a third museum) is
+worth less (REPEAT_PENALTY), which keeps the day varied.
+
+Durations and costs are per-kind estimates; opening hours are read from
+OSM opening_hours strings ("Mo-Fr 09:00-17:00; Sa 10:00-14:00", "24/7",
+"10-17"). Places with unknown hours are treated as always open.
+"""
+
+import re
+
+# Activity kinds by keywords in a place's type, first match wins:
+# (kind, keywords, typical visit in minutes, cost in USD when the place has no price)
+KINDS = [
+    ("cafe", ("cafe", "coffee", "bakery", "ice_cream", "ice cream"), 45, 8),
+    ("dining", ("restaurant", "dining", "catering", "food", "pub", "bar"), 75, 27.5),
+    ("museum", ("museum", "gallery", "arts_centre", "arts centre"), 120, 17.5),
+    ("entertainment", ("cinema", "theatre", "theater", "entertainment", "zoo", "aquarium", "theme_park"), 150, 16),
+    ("historic", ("historic", "monument", "memorial", "castle", "heritage", "ruins"), 90, 10),
+    ("shopping", ("shopping", "mall", "market", "commercial", "shop"), 90, 0),
+    ("outdoors", ("park", "garden", "beach", "nature", "natural", "leisure", "trail", "viewpoint"), 60, 0),
+    ("sightseeing", ("attraction", "tourism", "sights"), 75, 15),
+]
+DEFAULT_KIND = ("other", (), 60, 0)
+
+# Value of a kind's n-th best stop is multiplied by REPEAT_PENALTY ** (n - 1)
+REPEAT_PENALTY = 0.6
+# Improvement rounds (2-opt + swaps + re-insertion) after the first greedy fill
+MAX_ROUNDS = 5
+# travel_min key of the trip's starting point; a tuple so no place id can equal it
+START = ("start",)
+
+_DAYS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
+_DAY_SPEC = re.compile(r"^((?:Mo|Tu|We|Th|Fr|Sa|Su|PH|SH)(?:\s*[-,]\s*(?:Mo|Tu|We|Th|Fr|Sa|Su|PH|SH))*)\s+(.*)$")
+# Public / school holiday selectors; we don't know the holiday calendar
+_HOLIDAYS = ("PH", "SH")
+_RANGE = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*-\s*(\d{1,2})(?::(\d{2}))?$")
+_CLOCK = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*([AaPp][Mm])?$")
+_PRICE = re.compile(r"\$?\s*(\d+(?:\.\d+)?)")
+
+
+def activity_kind(type_str):
+    """(kind, keywords, duration_min, default_cost) for a place type string."""
+    text = (type_str or "").lower()
+    for kind in KINDS:
+        if any(word in text for word in kind[1]):
+            return kind
+    return DEFAULT_KIND
+
+
+def estimate_duration_min(type_str):
+    """Typical visit length in minutes for a place type."""
+    return activity_kind(type_str)[2]
+
+
+def estimate_cost(cost_str, type_str):
+    """
+    Cost in USD from a place's cost field: "Free" -> 0, "$12" -> 12,
+    "$10-25" -> 17.5 (midpoint); otherwise the kind's typical cost.
+    """
+    text = str(cost_str or "").strip().lower()
+    if text in ("free", "0", "$0", "$0.00"):
+        return 0.0
+    prices = [float(p) for p in _PRICE.findall(text)] if "$" in text else []
+    if prices:
+        return sum(prices[:2]) / len(prices[:2])
+    return float(activity_kind(type_str)[3])
+
+
+def parse_clock(value):
+    """Minutes after midnight from "09:00", "17:30", "9:00 AM" or "9 pm"; None if unparseable."""
+    match = _CLOCK.match(str(value or "").strip())
+    if not match:
+        return None
+    hours, minutes, ampm = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if ampm:
+        hours = hours % 12 + (12 if ampm.lower() == "pm" else 0)
+    if hours > 24 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_clock(minutes):
+    """"9:00 AM" style clock time for minutes after midnight."""
+    minutes = int(round(minutes)) % (24 * 60)
+    hours, mins = divmod(minutes, 60)
+    suffix = "AM" if hours < 12 else "PM"
+    return f"{hours % 12 or 12}:{mins:02d} {suffix}"
+
+
+def format_duration(minutes):
+    """"45 minutes", "1 hour", "1.25 hours"."""
+    if minutes < 60:
+        return f"{int(round(minutes))} minutes"
+    hours = round(minutes / 60, 2)
+    if hours == 1:
+        return "1 hour"
+    return f"{hours:g} hours"
+
+
+def parse_duration(text):
+    """Minutes from "45 minutes", "1 hour" or "1.5 hours" (format_duration's output); None if unparseable."""
+    parts = str(text or "").strip().lower().split()
+    if len(parts) != 2:
+        return None
+    try:
+        value = float(parts[0])
+    except ValueError:
+        return None
+    if parts[1].startswith("hour"):
+        return value * 60
+    if parts[1].startswith("minute"):
+        return value
+    return None
+
+
+def _day_matches(spec, weekday):
+    """True if an OSM day spec like "Mo-Fr" or "Sa,Su" includes weekday (0 = Monday)."""
+    for part in spec.replace(" ", "").split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            if first in _DAYS and last in _DAYS:
+                a, b = _DAYS.index(first), _DAYS.index(last)
+                days = range(a, b + 1) if a <= b else list(range(a, 7)) + list(range(0, b + 1))
+                if weekday in days:
+                    return True
+        elif part in _DAYS and _DAYS.index(part) == weekday:
+            return True
+    return False
+
+
+def opening_windows(hours, weekday):
+    """
+    [(open_min, close_min)] for weekday (0 = Monday) from an opening-hours
+    string; [] if closed that day, None if unknown (treat as always open).
+    Later rules override earlier ones for the days they name, as in OSM.
+    Holiday rules ("PH off") are ignored, since we can't tell holidays apart.
+    """
+    text = str(hours or "").strip()
+    if not text or text.upper() in ("N/A", "UNKNOWN"):
+        return None
+    if text == "24/7":
+        return [(0, 24 * 60)]
+    windows = None
+    day_specific = False
+    for rule in text.split(";"):
+        rule = rule.strip()
+        if not rule:
+            continue
+        match = _DAY_SPEC.match(rule)
+        if match:
+            days = [part for part in match.group(1).replace(" ", "").split(",") if part not in _HOLIDAYS]
+            if not days:
+                continue
+            day_specific = True
+            if not _day_matches(",".join(days), weekday):
+                continue
+            rule = match.group(2).strip()
+        if rule.lower() in ("off", "closed"):
+            windows = []
+            continue
+        parsed = []
+        for span in rule.split(","):
+            m = _RANGE.match(span.strip())
+            if not m:
+                return None
+            opens = int(m.group(1)) * 60 + int(m.group(2) or 0)
+            closes = int(m.group(3)) * 60 + int(m.group(4) or 0)
+            if closes <= opens:
+                closes += 24 * 60  # past midnight
+            parsed.append((opens, closes))
+        windows = parsed
+    if windows is None:
+        return [] if day_specific else None
+    return windows
+
+
+def _timeline(route, stops, travel_min, start_min, end_min):
+    """
+    Simulate visiting route (stop indices) in order from START at
+    start_min. Returns (finish_min, [(travel, arrive, begin, end)]) or None
+    if a stop can't be fitted into its opening hours or the day overruns.
+    """
+    clock = start_min
+    previous = START
+    timeline = []
+    for i in route:
+        stop = stops[i]
+        travel = travel_min(previous, stop["key"])
+        arrive = clock + travel
+        begin = None
+        if stop["windows"] is None:
+            begin = arrive
+        else:
+            for opens, closes in stop["windows"]:
+                candidate = max(arrive, opens)
+                if candidate + stop["duration_min"] <= closes:
+                    begin = candidate
+                    break
+        if begin is None:
+            return None
+        clock = begin + stop["duration_min"]
+        if clock > end_min:
+            return None
+        timeline.append((travel, arrive, begin, clock))
+        previous = stop["key"]
+    return clock, timeline
+
+
+def _route_value(route, stops):
+    """
+    Summed value of the stops on a route: score squared, with each kind's
+    stops discounted by REPEAT_PENALTY in order of score (so order-independent).
+    """
+    by_kind = {}
+    for i in route:
+        by_kind.setdefault(stops[i]["kind"], []).append(stops[i]["score"] ** 2)
+    value = 0.0
+    for values in by_kind.values():
+        values.sort(reverse=True)
+        value += sum(v * REPEAT_PENALTY ** rank for rank, v in enumerate(values))
+    return value
+
+
+def _insert_greedy(route, stops, travel_min, start_min, end_min):
+    """Insert candidates one at a time by best value gained per minute added, while any fits."""
+    finish = _timeline(route, stops, travel_min, start_min, end_min)[0]
+    while True:
+        value = _route_value(route, stops)
+        used = set(route)
+        best = None
+        for c in range(len(stops)):
+            if c in used:
+                continue
+            for pos in range(len(route) + 1):
+                trial = route[:pos] + [c] + route[pos:]
+                result = _timeline(trial, stops, travel_min, start_min, end_min)
+                if result is None:
+                    continue
+                gain = _route_value(trial, stops) - value
+                ratio = gain / max(result[0] - finish, 1.0)
+                if gain > 0 and (best is None or ratio > best[0]):
+                    best = (ratio, trial, result[0])
+        if best is None:
+            return route
+        route, finish = best[1], best[2]
+
+
+def _two_opt(route, stops, travel_min, start_min, end_min):
+    """Reverse segments while that makes the day end earlier. Returns (route, improved)."""
+    finish = _timeline(route, stops, travel_min, start_min, end_min)[0]
+    improved = False
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                trial = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                result = _timeline(trial, stops, travel_min, start_min, end_min)
+                if result is not None and result[0] < finish - 1e-6:
+                    route, finish = trial, result[0]
+                    improved = changed = True
+    return route, improved
+
+
+def _swap(route, stops, travel_min, start_min, end_min):
+    """Replace one scheduled stop with an unscheduled one if that raises the route's value. Returns (route, improved)."""
+    value = _route_value(route, stops)
+    used = set(route)
+    for pos in range(len(route)):
+        rest = route[:pos] + route[pos + 1:]
+        for c in range(len(stops)):
+            if c in used or _route_value(rest + [c], stops) <= value + 1e-6:
+                continue
+            for insert_at in range(len(rest) + 1):
+                trial = rest[:insert_at] + [c] + rest[insert_at:]
+                if _timeline(trial, stops, travel_min, start_min, end_min) is not None:
+                    return trial, True
+    return route, False
+
+
+def _score(value, default=50.0):
+    """A stop's score as a float (LLM scores may be None, strings or junk)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def schedule(stops, travel_min, start_min, end_min):
+    """
+    Choose, order and time stops between start_min and end_min.
+
+    stops: dicts with "key", "score" (0-100), "duration_min", "kind" and
+    "windows" (from opening_windows). travel_min(a, b): minutes from key a
+    to key b, where START is the trip's starting point.
+
+    Returns one dict per scheduled stop, in visiting order: "key",
+    "travel_min" (from the previous stop or the start),
+    "arrive_min", "start_min" (after any wait for opening) and "end_min".
+    """
+    stops = [dict(s, score=_score(s.get("score"))) for s in stops]
+    stops = [s for s in stops if s["score"] > 0]
+    if not stops or end_min <= start_min:
+        return []
+    route = _insert_greedy([], stops, travel_min, start_min, end_min)
+    for _ in range(MAX_ROUNDS):
+        route, shorter = _two_opt(route, stops, travel_min, start_min, end_min)
+        route, swapped = _swap(route, stops, travel_min, start_min, end_min)
+        before = len(route)
+        route = _insert_greedy(route, stops, travel_min, start_min, end_min)
+        if not (shorter or swapped or len(route) > before):
+            break
+
+    _, timeline = _timeline(route, stops, travel_min, start_min, end_min)
+    return [
+        {"key": stops[i]["key"], "travel_min": travel, "arrive_min": arrive, "start_min": begin, "end_min": end}
+        for i, (travel, arrive, begin, end) in zip(route, timeline)
+    ]
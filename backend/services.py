@@ -1,8 +1,9 @@
 import os
 import json
-import requests
 import time
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 import secrets
 from bson import ObjectId
@@ -13,60 +14,64 @@ import google.generativeai as genai
 
 load_dotenv()
 
-from geo_categories import CATEGORIES, SYNONYMS
-
-# ============== Simple Cache Implementation ==============
-
-class SimpleCache:
-    """
-    Simple time-based cache with automatic expiration.
-    Each cache entry has a TTL (time to live) in seconds.
-    """
-    def __init__(self):
-        self._cache = {}
-    
-    def _generate_key(self, *args, **kwargs):
-        """Generate a cache key from arguments."""
-        key_data = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True)
-        return hashlib.md5(key_data.encode()).hexdigest()
-    
-    def get(self, key):
-        """Get value from cache if not expired."""
-        if key in self._cache:
-            value, expiry_time = self._cache[key]
-            if time.time() < expiry_time:
-                return value
-            else:
-                # Remove expired entry
-                del self._cache[key]
-        return None
-    
-    def set(self, key, value, ttl_seconds):
-        """Set value in cache with TTL (time to live) in seconds."""
-        expiry_time = time.time() + ttl_seconds
-        self._cache[key] = (value, expiry_time)
-    
-    def clear(self):
-        """Clear all cache entries."""
-        self._cache.clear()
-    
-    def get_stats(self):
-        """Get cache statistics."""
-        total = len(self._cache)
-        expired = sum(1 for _, (_, exp) in self._cache.items() if time.time() >= exp)
-        return {
-            "total_entries": total,
-            "active_entries": total - expired,
-            "expired_entries": expired
-        }
+from category_matcher import map_interests_to_categories
+import geo_tiles
+from poi_index import PoiIndex
+from road_graph import RoadGraph
+from place import Place, ROW_LAT, ROW_LNG
+import http_client
+import travel_estimator
+import travel_calibration
+import scheduler
+import route_optimizer
+from travel_matrix import TravelMatrix
+from circuit_breaker import BREAKERS
+
+from cache import SimpleCache, cache_limits_from_env, cache_backend_from_env, housekeeper
+
+# Initialize caches with different TTLs for different data types.
+# Each cache is bounded (LRU eviction); limits can be overridden via
+# <NAME>_CACHE_MAX_ENTRIES / <NAME>_CACHE_MAX_MB environment variables.
+# Caches listed in CACHE_BACKEND_CACHES also read/write a shared SQLite store
+# under CACHE_DIR, so results survive restarts and are shared by every
+# gunicorn worker on the host.
+# Weather and places serve stale entries for a while past their TTL and
+# refresh them in the background (stale-while-revalidate).
+def _make_cache(name, default_entries, default_mb, stale_seconds=0):
+    return SimpleCache(
+        name,
+        backend=cache_backend_from_env(name),
+        stale_seconds=stale_seconds,
+        **cache_limits_from_env(name, default_entries, default_mb)
+    )
 
-# Initialize caches with different TTLs for different data types
-geocoding_cache = SimpleCache()      # 24 hours - addresses don't change
-weather_cache = SimpleCache()        # 30 minutes - weather updates frequently
-places_cache = SimpleCache()         # 2 hours - places don't change often
-llm_scoring_cache = SimpleCache()    # 1 hour - scores can be reused
-llm_combined_cache = SimpleCache()   # 1 hour - combined scores + itinerary results
-routing_cache = SimpleCache()        # 6 hours - routes are fairly static
+geocoding_cache = _make_cache("geocoding", 5000, 8)          # 24 hours - addresses don't change
+weather_cache = _make_cache("weather", 2000, 4, stale_seconds=30 * 60)   # 30 minutes fresh, +30 stale - weather updates frequently
+places_cache = _make_cache("places", 4000, 64, stale_seconds=60 * 60)    # 2 hours fresh, +1 hour stale - (tile, category) place slices
+llm_scoring_cache = _make_cache("llm_scoring", 500, 16)      # 1 hour - scores can be reused
+llm_combined_cache = _make_cache("llm_combined", 500, 32)    # 1 hour - combined scores + itinerary results
+routing_cache = _make_cache("routing", 20000, 16)            # 6 hours - routes are fairly static
+search_results_cache = _make_cache("search_results", 2000, 64)  # 10 minutes - paginated /api/plan results
+# Memory only (NumPy arrays, never written to a backend): pairwise travel matrices per candidate set
+travel_matrix_cache = SimpleCache("travel_matrix", **cache_limits_from_env("travel_matrix", 200, 32))
+
+# All module-level caches by name, for stats and maintenance endpoints
+CACHES = {
+    "geocoding": geocoding_cache,
+    "weather": weather_cache,
+    "places": places_cache,
+    "llm_scoring": llm_scoring_cache,
+    "llm_combined": llm_combined_cache,
+    "routing": routing_cache,
+    "search_results": search_results_cache,
+    "travel_matrix": travel_matrix_cache
+}
+
+def start_housekeeping():
+    """Register every cache with the background housekeeper and start its thread (idempotent)."""
+    for cache in CACHES.values():
+        housekeeper.register(cache)
+    housekeeper.start()
 
 # Cache TTL constants (in seconds)
 GEOCODING_TTL = 24 * 60 * 60  # 24 hours
@@ -74,6 +79,58 @@ WEATHER_TTL = 30 * 60          # 30 minutes
 PLACES_TTL = 2 * 60 * 60       # 2 hours
 LLM_SCORING_TTL = 60 * 60      # 1 hour
 ROUTING_TTL = 6 * 60 * 60      # 6 hours
+SEARCH_RESULTS_TTL = 10 * 60   # 10 minutes
+TRAVEL_MATRIX_TTL = 30 * 60    # 30 minutes - rebuilt with newly cached legs after that
+
+# Places tiling: finest geohash precision covering a query with at most
+# PLACES_MAX_TILES tiles (POI index lookups)
+PLACES_MAX_TILES = int(os.getenv("PLACES_MAX_TILES", 12))
+# Geoapify places are fetched per category around the user and cached under
+# the user's geohash tile at PLACES_CACHE_PRECISION (5: ~5 x 5 km);
+# PLACES_FETCH_LIMIT features per fetch, at most PLACES_MAX_FETCHES fetches per query
+PLACES_CACHE_PRECISION = int(os.getenv("PLACES_CACHE_PRECISION", 5))
+PLACES_FETCH_LIMIT = int(os.getenv("PLACES_FETCH_LIMIT", 50))
+PLACES_MAX_FETCHES = int(os.getenv("PLACES_MAX_FETCHES", 5))
+
+# Missing place slices are fetched in parallel; the whole fetch shares one deadline
+PLACES_FETCH_WORKERS = int(os.getenv("PLACES_FETCH_WORKERS", 8))
+PLACES_FETCH_DEADLINE = float(os.getenv("PLACES_FETCH_DEADLINE_SECONDS", 12))
+_places_executor = ThreadPoolExecutor(max_workers=PLACES_FETCH_WORKERS, thread_name_prefix="places-fetch")
+
+# Optional offline POI dump (GeoJSON / line-delimited GeoJSON); see poi_index.py
+POI_INDEX_PATH = os.getenv("POI_INDEX_PATH")
+
+# Routing engine for calculate_route and start-to-places travel times:
+# "geoapify" (Routing / Route Matrix APIs) or "local" (offline road graph at
+# ROAD_GRAPH_PATH, GeoJSON or a .npz saved by road_graph.py; no API calls)
+ROUTING_ENGINE = os.getenv("ROUTING_ENGINE", "geoapify").lower()
+ROAD_GRAPH_PATH = os.getenv("ROAD_GRAPH_PATH")
+
+# Start-to-places travel times come from one route matrix request:
+# "geoapify" (Route Matrix API) or "local" (straight-line estimate, no API call)
+ROUTE_MATRIX = os.getenv("ROUTE_MATRIX", "geoapify").lower()
+# Targets per Route Matrix request
+ROUTE_MATRIX_MAX_TARGETS = int(os.getenv("ROUTE_MATRIX_MAX_TARGETS", 50))
+# Places that get real routing; the rest keep a straight-line estimate.
+# Matches the 20 places the LLM prompts see, so the itinerary is fully routed.
+ROUTING_TOP_K = int(os.getenv("ROUTING_TOP_K", 20))
+# Skip the route matrix for start-to-place times when the calibrated estimate
+# has been accurate in the start's region lately (see travel_calibration.py)
+CALIBRATION_SKIP_ROUTING = os.getenv("CALIBRATION_SKIP_ROUTING", "true").lower() == "true"
+# Nearest neighbours per place whose cached real legs are laid over a travel matrix
+TRAVEL_MATRIX_NEIGHBORS = int(os.getenv("TRAVEL_MATRIX_NEIGHBORS", 8))
+
+# Route legs are cached by endpoints rounded to this many decimals (4 ~ 11 m);
+# in these modes a leg and its reverse share one cache entry
+ROUTE_LEG_DECIMALS = int(os.getenv("ROUTE_LEG_DECIMALS", 4))
+ROUTE_LEG_SYMMETRIC_MODES = set(m.strip() for m in os.getenv("ROUTE_LEG_SYMMETRIC_MODES", "walk,bicycle").split(",") if m.strip())
+
+# Our travel modes -> Geoapify routing modes
+GEOAPIFY_MODES = {
+    "driving-car": "drive",
+    "cycling-regular": "bicycle",
+    "foot-walking": "walk"
+}
 
 load_dotenv()
 
@@ -107,17 +164,25 @@ MOCK_TRAVEL_TIMES = {"p1": 10, "p2": 15, "p3": 20}
 def fetch_weather_from_openmeteo(lat, lng):
     """
     Fetch current and hourly weather data from Open-Meteo API.
-    Results are cached for 30 minutes (weather changes frequently).
+    Results are cached for 30 minutes (weather changes frequently); for the
+    following 30 minutes the stale result is served while a refresh runs.
     """
     # Check cache first - round coordinates to 2 decimals for cache key
     cache_key = f"weather_{round(lat, 2)}_{round(lng, 2)}"
-    cached_result = weather_cache.get(cache_key)
+    # Stale entries are returned immediately and refreshed in the background
+    cached_result = weather_cache.get_or_revalidate(
+        cache_key, lambda: _fetch_weather_uncached(lat, lng, cache_key)
+    )
     if cached_result:
         print(f"✓ Cache hit: Weather for ({lat}, {lng})")
         return cached_result
     
     print(f"⚡ Cache miss: Fetching weather for ({lat}, {lng})")
-    
+    # Concurrent misses for the same rounded location share one upstream call
+    return weather_cache.single_flight(cache_key, lambda: _fetch_weather_uncached(lat, lng, cache_key))
+
+def _fetch_weather_uncached(lat, lng, cache_key):
+    """Call Open-Meteo and cache the summarized result under cache_key."""
     try:
         url = "https://api.open-meteo.com/v1/forecast"
         params = {
@@ -128,7 +193,7 @@ def fetch_weather_from_openmeteo(lat, lng):
             "timezone": "auto"
         }
         
-        r = requests.get(url, params=params, timeout=10)
+        r = http_client.get(url, params=params)
         if not r.ok:
             raise Exception(f"Open-Meteo API error: {r.status_code} {r.text}")
         
@@ -211,7 +276,10 @@ def geocode_address(address):
         return cached_result
     
     print(f"⚡ Cache miss: Geocoding '{address}'")
-    
+    return geocoding_cache.single_flight(cache_key, lambda: _geocode_address_uncached(address, cache_key))
+
+def _geocode_address_uncached(address, cache_key):
+    """Call Geoapify forward geocoding and cache the (lat, lon) result under cache_key."""
     if not GEOAPIFY_KEY:
         raise Exception("GEOAPIFY_API_KEY not set in .env")
     url = "https://api.geoapify.com/v1/geocode/search"
@@ -220,7 +288,7 @@ def geocode_address(address):
         "limit": 1,
         "apiKey": GEOAPIFY_KEY
     }
-    r = requests.get(url, params=params, timeout=10)
+    r = http_client.get(url, params=params)
     if not r.ok:
         raise Exception(f"Geoapify geocode error: {r.status_code} {r.text}")
     data = r.json()
@@ -243,76 +311,27 @@ def geocode_address(address):
 def _map_interests_to_categories(interests):
     """
     Simple mapping of common free-text interests to Geoapify category keys.
-    Extend this map as you need.
+    Uses synonyms first, then substring matches against known categories
+    (see category_matcher.py; matching is precompiled and memoized per token).
     """
-    # Build categories using synonyms then fuzzy-match against known categories
-    cats = []
-    if not interests:
-        return []
-
-    for it in interests:
-        token = it.strip().lower()
-        if not token:
-            continue
-
-        # direct synonyms first
-        if token in SYNONYMS:
-            for c in SYNONYMS[token]:
-                cats.append(c)
-            continue
-
-        # normalize token (remove punctuation, spaces -> underscore for matching)
-        token_norm = token.replace(' ', '_')
-
-        # collect matches where token appears in category key or as final segment
-        matches = []
-        for cat in CATEGORIES:
-            if token in cat or token_norm in cat:
-                matches.append(cat)
-            else:
-                # check final segment
-                seg = cat.split('.')[-1]
-                if token == seg or token_norm == seg:
-                    matches.append(cat)
-
-        # if no matches found, try partial token matching (starts/contains)
-        if not matches:
-            for cat in CATEGORIES:
-                if token in cat.replace('_', ' ') or token_norm in cat:
-                    matches.append(cat)
-
-        # limit matches per token to avoid huge lists
-        for m in matches[:5]:
-            cats.append(m)
-
-    # deduplicate preserving order
-    seen = set()
-    dedup = []
-    for c in cats:
-        if c not in seen:
-            dedup.append(c)
-            seen.add(c)
-    return dedup
+    return map_interests_to_categories(interests)
 
 def fetch_places_from_geoapify(lat, lng, interests, max_distance, budget):
     """
     Query Geoapify Places API.
-    Returns list of places in the same shape as your mock (id, name, lat, lng, type, cost, hours).
-    Results are cached for 2 hours (places don't change often).
+    Returns a list of Place records (id, name, lat, lng, type, cost, hours, address fields).
+
+    Results are cached per (geohash tile of the user, category) rather than
+    per query, so users a few blocks apart (in the same or a neighbouring
+    tile) or asking for different radii share a cached slice whenever it
+    provably holds their nearest places (see _slice_answer); otherwise that
+    category is fetched again around the user.
+    Slices are cached for 2 hours (places don't change often), then served
+    stale for up to an hour while a background refresh runs.
+
+    If an offline POI index is configured (POI_INDEX_PATH) and covers the
+    search circle, places are served from it with no network call at all.
     """
-    # Create cache key based on location, interests, and distance
-    interests_sorted = sorted(interests or [])
-    cache_key = f"places_{round(lat, 2)}_{round(lng, 2)}_{'-'.join(interests_sorted)}_{max_distance}_{budget}"
-    cached_result = places_cache.get(cache_key)
-    if cached_result:
-        print(f"✓ Cache hit: Places for ({lat}, {lng})")
-        return cached_result
-    
-    print(f"⚡ Cache miss: Fetching places for ({lat}, {lng})")
-    
-    if not GEOAPIFY_KEY:
-        raise Exception("GEOAPIFY_API_KEY not set in .env")
-
     # convert miles to meters
     try:
         radius_m = int(float(max_distance) * 1609.344)
@@ -325,166 +344,341 @@ def fetch_places_from_geoapify(lat, lng, interests, max_distance, budget):
         # fallback categories if we can't map anything
         cats = ["tourism.attraction", "catering.restaurant", "leisure.park"]
 
-    base_url = "https://api.geoapify.com/v2/places"
-    # Geoapify expects filter in format: circle:lon,lat,radiusMeters
-    filter_param = f"circle:{lng},{lat},{radius_m}"
-
     # If multiple categories, perform per-category requests and merge results
-    features = []
+    places = []
     seen_place_ids = set()
     # limit number of categories to query to avoid rate bursts
     cats_to_query = cats[:5]
     per_cat_limit = max(6, int(20 / max(1, len(cats_to_query))))
 
+    index = _get_poi_index()
+    if index is not None and index.covers(lat, lng, radius_m):
+        print(f"✓ POI index: Places for ({lat}, {lng})")
+        _, tiles = geo_tiles.covering_tiles(lat, lng, radius_m, PLACES_MAX_TILES)
+        in_range_by_cat = {cat: index.query(lat, lng, radius_m, cat, tiles) for cat in cats_to_query}
+    else:
+        in_range_by_cat = _places_in_range_from_geoapify(lat, lng, radius_m, cats_to_query, per_cat_limit)
+
     for cat in cats_to_query:
-        params = {
-            "categories": cat,
-            "filter": filter_param,
-            "bias": f"proximity:{lng},{lat}",
-            "limit": per_cat_limit,
-            "apiKey": GEOAPIFY_KEY
-        }
+        for _, row in in_range_by_cat.get(cat, [])[:per_cat_limit]:
+            pid = row[0]
+            if pid in seen_place_ids:
+                continue
+            seen_place_ids.add(pid)
+            # Cached rows are immutable tuples; each request gets its own Place
+            places.append(Place.from_row(row))
 
-        # Retry logic with exponential backoff (3 attempts, up to 15s timeout)
-        max_retries = 3
-        retry_delay = 0.5
-        data = None
-        
-        for attempt in range(max_retries):
-            try:
-                r = requests.get(base_url, params=params, timeout=15)
-                if r.ok:
-                    data = r.json()
-                    break
-                else:
-                    if attempt < max_retries - 1:
-                        print(f"Retry {attempt + 1}/{max_retries - 1}: Category {cat} returned {r.status_code}")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # exponential backoff
-                    else:
-                        print(f"Warning: Geoapify Places API error for category {cat}: {r.status_code}")
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    print(f"Retry {attempt + 1}/{max_retries - 1}: Timeout on category {cat}")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    print(f"Warning: Geoapify API timeout for category {cat} after {max_retries} attempts")
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"Retry {attempt + 1}/{max_retries - 1}: Error on category {cat}: {str(e)}")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    print(f"Warning: Error fetching places for category {cat}: {str(e)}")
-        
-        if not data:
-            # skip this category on error but continue others
+    return places
+
+def _places_in_range_from_geoapify(lat, lng, radius_m, cats, needed):
+    """
+    Per category, (distance_m, place row) pairs inside the circle, nearest
+    first: at least the `needed` nearest when the category has that many,
+    from cached or freshly fetched Geoapify slices.
+    """
+    if not GEOAPIFY_KEY:
+        raise Exception("GEOAPIFY_API_KEY not set in .env")
+
+    tile = geo_tiles.encode(lat, lng, PLACES_CACHE_PRECISION)
+    print(f"Places for ({lat}, {lng}): tile {tile} x {len(cats)} categories")
+    slices = _gather_place_slices(lat, lng, radius_m, tile, cats, needed)
+
+    in_range_by_cat = {}
+    for cat in cats:
+        entry = slices.get(cat)
+        if entry is None:
+            in_range_by_cat[cat] = []
             continue
-        feats = data.get("features", [])
-        for f in feats:
-            pid = None
-            pprops = f.get("properties", {})
-            pid = pprops.get("place_id") or pprops.get("osm_id") or pprops.get("xid") or str(pprops.get("lat")) + "_" + str(pprops.get("lon"))
-            if pid and pid in seen_place_ids:
-                continue
-            if pid:
-                seen_place_ids.add(pid)
-            features.append(f)
-    places = []
+        answer = _slice_answer(entry, lat, lng, radius_m, needed)
+        if answer is None:
+            # A concurrent fetch for another user in this tile won; use what it has
+            answer = _slice_in_range(entry, lat, lng, radius_m)
+        in_range_by_cat[cat] = answer
+    return in_range_by_cat
+
+def _slice_in_range(entry, lat, lng, radius_m):
+    """(distance_m, row) pairs of a cached slice inside the circle, nearest first."""
+    in_range = []
+    for row in entry["rows"]:
+        dist = geo_tiles.haversine_m(lat, lng, row[ROW_LAT], row[ROW_LNG])
+        if dist <= radius_m:
+            in_range.append((dist, row))
+    in_range.sort(key=lambda pair: pair[0])
+    return in_range
+
+def _slice_answer(entry, lat, lng, radius_m, needed):
+    """
+    Nearest places of a cached slice for a query at (lat, lng), or None if
+    the slice can't be trusted to hold them.
+
+    A slice holds every place of its category within complete_m of the point
+    it was fetched around, so it holds every place within
+    complete_m - (distance to that point) of the query. That is enough if it
+    reaches the whole search circle, or if the `needed` nearest all lie
+    within it.
+    """
+    reach = entry["complete_m"] - geo_tiles.haversine_m(lat, lng, entry["lat"], entry["lng"])
+    in_range = _slice_in_range(entry, lat, lng, radius_m)
+    if reach >= radius_m:
+        return in_range
+    trusted = [pair for pair in in_range if pair[0] <= reach]
+    if len(trusted) >= needed:
+        return trusted
+    return None
+
+def _gather_place_slices(lat, lng, radius_m, tile, cats, needed):
+    """
+    Cached slice (see _fetch_place_slice) for each category, keyed by
+    category: the one cached for the user's tile, or else one cached for a
+    neighbouring tile that can answer this query (so users a few meters
+    apart across a tile edge share it). Categories with neither are fetched
+    into the user's tile.
+
+    Cached slices are served from places_cache (stale ones refresh in the
+    background). Missing slices are fetched concurrently on a bounded thread
+    pool under one shared deadline, at most PLACES_MAX_FETCHES per query;
+    slices that haven't arrived when the deadline passes are left out of this
+    response but keep running and land in the cache for the next request.
+    Concurrent misses for the same slice share one fetch.
+    """
+    deadline = time.time() + PLACES_FETCH_DEADLINE
+    slices = {}
+    pending = {}
+    for cat in cats:
+        cache_key = f"places_near_{tile}_{cat}"
+        cached = places_cache.get_or_revalidate(
+            cache_key, lambda cat=cat, key=cache_key: _fetch_place_slice(lat, lng, radius_m, cat, key)
+        )
+        if cached is not None and _slice_answer(cached, lat, lng, radius_m, needed) is not None:
+            slices[cat] = cached
+            continue
+        neighbour = _neighbour_slice(lat, lng, radius_m, tile, cat, needed)
+        if neighbour is not None:
+            slices[cat] = neighbour
+            continue
+        if len(pending) >= PLACES_MAX_FETCHES:
+            print(f"Warning: Places fetch cap ({PLACES_MAX_FETCHES}) reached; skipping category {cat}")
+            if cached is not None:
+                slices[cat] = cached
+            continue
+        future = _places_executor.submit(
+            places_cache.single_flight, cache_key,
+            lambda cat=cat, key=cache_key: _fetch_place_slice(lat, lng, radius_m, cat, key, deadline)
+        )
+        pending[future] = cat
+
+    if not pending:
+        return slices
+
+    print(f"⚡ Cache miss: Fetching {len(pending)} place slices")
+    done, not_done = wait(pending, timeout=max(0, deadline - time.time()))
+    for future in done:
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Warning: Error fetching places for {pending[future]}: {e}")
+            continue
+        if result is not None:
+            slices[pending[future]] = result
+    if not_done:
+        print(f"Warning: Places deadline passed with {len(not_done)} slices still pending; using partial results")
+    return slices
+
+def _neighbour_slice(lat, lng, radius_m, tile, cat, needed):
+    """A fresh slice cached for a tile next to `tile` that can answer this query, or None."""
+    for other in geo_tiles.neighbors(tile):
+        cached = places_cache.get(f"places_near_{other}_{cat}")
+        if cached is not None and _slice_answer(cached, lat, lng, radius_m, needed) is not None:
+            print(f"✓ Cache hit: Places for {cat} from neighbouring tile {other}")
+            return cached
+    return None
+
+def _fetch_place_slice(lat, lng, radius_m, cat, cache_key, deadline=None):
+    """
+    Fetch one category around (lat, lng) from Geoapify Places (circle filter,
+    nearest first), normalize it into place rows and cache it under cache_key
+    as {"lat", "lng", "complete_m", "rows"}: complete_m is the radius within
+    which the rows hold every place of the category (the whole circle if the
+    response wasn't truncated, else out to the farthest row returned).
+    Retries stop once the optional deadline (epoch seconds) has passed.
+    Returns None on error.
+    """
+    base_url = "https://api.geoapify.com/v2/places"
+    params = {
+        "categories": cat,
+        # Geoapify expects filter in format: circle:lon,lat,radiusMeters
+        "filter": f"circle:{lng},{lat},{radius_m}",
+        "bias": f"proximity:{lng},{lat}",
+        "limit": PLACES_FETCH_LIMIT,
+        "apiKey": GEOAPIFY_KEY
+    }
+
+    # Retries/backoff and the per-host timeout come from http_client; the
+    # deadline stops retrying once the shared places deadline has passed
+    data = None
+    try:
+        r = http_client.get(base_url, params=params, deadline=deadline)
+        if r.ok:
+            data = r.json()
+        else:
+            print(f"Warning: Geoapify Places API error for category {cat}: {r.status_code}")
+    except Exception as e:
+        print(f"Warning: Error fetching places for category {cat}: {str(e)}")
+
+    if not data:
+        # skip this category on error (not cached, so the next query retries it)
+        return None
+    features = data.get("features", [])
+    rows = []
     for feat in features:
-        p = feat.get("properties", {})
-        geometry = feat.get("geometry", {})
-        coords = geometry.get("coordinates", [None, None])
-        lon_p, lat_p = (coords[0], coords[1]) if coords and len(coords) >= 2 else (p.get("lon"), p.get("lat"))
-        # try to find categories names or keys
-        cat_names = []
-        if p.get("categories"):
-            # Geoapify categories in properties may be list of dicts with 'name' or 'name_en'
-            for c in p.get("categories"):
-                if isinstance(c, dict):
-                    nm = c.get("name") or c.get("name_en") or c.get("key")
-                    if nm:
-                        cat_names.append(nm)
-                else:
-                    cat_names.append(str(c))
-        type_str = ", ".join(cat_names) if cat_names else p.get("formatted", "") or "N/A"
-
-        # Hours/price: Places returns limited info; Place Details API gives more.
-        hours = p.get("opening_hours") or p.get("hours") or "N/A"
-        # price: there may be 'price' or 'price_level' or use conditions; fallback Unknown
-        raw_cost = p.get("price") or p.get("price_level") or p.get("fee")
-        
-        # Format cost display: show "Free" for free places, estimate ranges for others
-        if raw_cost is None or raw_cost == 0 or raw_cost == "0" or raw_cost == "$0.00":
-            cost = "Free"
-        elif isinstance(raw_cost, (int, float)):
-            # Estimate cost range by category
-            category_lower = cat.lower()
-            if "restaurant" in category_lower or "catering" in category_lower:
-                cost = "$15-40"
-            elif "museum" in category_lower or "attraction" in category_lower or "monument" in category_lower:
-                cost = "$10-25"
-            elif "cinema" in category_lower or "theater" in category_lower:
-                cost = "$12-20"
-            elif "spa" in category_lower or "gym" in category_lower:
-                cost = "$20-50"
-            elif "shopping" in category_lower or "mall" in category_lower:
-                cost = "Varies"
+        # Places without coordinates can't be distance-filtered or routed
+        if _feature_coords(feat)[0] is None:
+            continue
+        rows.append(_normalize_place(feat, cat).to_row())
+    complete_m = radius_m
+    if len(features) >= PLACES_FETCH_LIMIT and rows:
+        complete_m = min(radius_m, max(geo_tiles.haversine_m(lat, lng, row[ROW_LAT], row[ROW_LNG]) for row in rows))
+    entry = {"lat": lat, "lng": lng, "complete_m": complete_m, "rows": rows}
+    places_cache.set(cache_key, entry, PLACES_TTL)
+    return entry
+
+_poi_index = None
+_poi_index_lock = threading.Lock()
+
+def _get_poi_index():
+    """Offline POI index from POI_INDEX_PATH, loaded on first use (None if not configured)."""
+    global _poi_index
+    if not POI_INDEX_PATH:
+        return None
+    with _poi_index_lock:
+        if _poi_index is None:
+            _poi_index = PoiIndex.from_geojson(POI_INDEX_PATH, _normalize_place)
+    return _poi_index
+
+def _feature_coords(feature):
+    """(lat, lng) of a Geoapify feature, from its geometry or properties."""
+    p = feature.get("properties", {})
+    coords = feature.get("geometry", {}).get("coordinates", [None, None])
+    lon_p, lat_p = (coords[0], coords[1]) if coords and len(coords) >= 2 else (p.get("lon"), p.get("lat"))
+    if lat_p is None or lon_p is None:
+        return None, None
+    return float(lat_p), float(lon_p)
+
+def _feature_id(feat, lat, lng):
+    """
+    Stable id for a Geoapify or OSM-style feature: place_id / xid, the OSM
+    type + id, the feature id, or failing all of those its coordinates.
+    """
+    p = feat.get("properties", {})
+    if p.get("place_id") or p.get("xid"):
+        return str(p.get("place_id") or p.get("xid"))
+    if p.get("osm_id") is not None:
+        return f"{p.get('osm_type') or ''}{p['osm_id']}"
+    for value in (p.get("@id"), p.get("id"), feat.get("id")):
+        if value is not None and value != "":
+            return str(value)
+    return f"{lat:.7f}_{lng:.7f}" if lat is not None and lng is not None else None
+
+def _normalize_place(feat, cat, cats=None):
+    """
+    Convert a Geoapify feature into a Place (id, name, lat, lng, type, cost,
+    hours, address fields). `cat` is the category it was fetched for; `cats`
+    are all its matched category keys, used for the type when the feature
+    lists none itself (OSM-style dumps).
+    """
+    p = feat.get("properties", {})
+    lat_p, lon_p = _feature_coords(feat)
+    # try to find categories names or keys
+    cat_names = []
+    if p.get("categories"):
+        # Geoapify categories in properties may be list of dicts with 'name' or 'name_en'
+        for c in p.get("categories"):
+            if isinstance(c, dict):
+                nm = c.get("name") or c.get("name_en") or c.get("key")
+                if nm:
+                    cat_names.append(nm)
             else:
-                cost = "Check onsite"
+                cat_names.append(str(c))
+    if not cat_names and cats:
+        cat_names = sorted(cats)
+    type_str = ", ".join(cat_names) if cat_names else p.get("formatted", "") or "N/A"
+
+    # Hours/price: Places returns limited info; Place Details API gives more.
+    hours = p.get("opening_hours") or p.get("hours") or "N/A"
+    # price: there may be 'price' or 'price_level' or use conditions; fallback Unknown
+    raw_cost = p.get("price") or p.get("price_level") or p.get("fee")
+    # OSM fee=yes/no says whether there is a price; charge=... says what it is
+    if raw_cost == "no":
+        raw_cost = None
+    elif raw_cost == "yes":
+        raw_cost = p.get("charge") or 1
+    
+    # Format cost display: show "Free" for free places, estimate ranges for others
+    if raw_cost is None or raw_cost == 0 or raw_cost == "0" or raw_cost == "$0.00":
+        cost = "Free"
+    elif isinstance(raw_cost, (int, float)):
+        # Estimate cost range by the category this place was fetched for
+        category_lower = cat.lower()
+        if "restaurant" in category_lower or "catering" in category_lower:
+            cost = "$15-40"
+        elif "museum" in category_lower or "attraction" in category_lower or "monument" in category_lower:
+            cost = "$10-25"
+        elif "cinema" in category_lower or "theater" in category_lower:
+            cost = "$12-20"
+        elif "spa" in category_lower or "gym" in category_lower:
+            cost = "$20-50"
+        elif "shopping" in category_lower or "mall" in category_lower:
+            cost = "Varies"
         else:
-            cost = str(raw_cost) if raw_cost else "Unknown"
-
-        # Extract address information
-        address_line1 = p.get("address_line1") or ""
-        address_line2 = p.get("address_line2") or ""
-        street = p.get("street") or ""
-        housenumber = p.get("housenumber") or ""
-        city = p.get("city") or ""
-        state = p.get("state") or ""
-        postcode = p.get("postcode") or ""
-        country = p.get("country") or ""
-        
-        # Build formatted address
-        street_address = f"{housenumber} {street}".strip() if housenumber or street else address_line1
-        city_state = f"{city}, {state}".strip(", ") if city or state else ""
-        
-        # Full formatted address
-        formatted_address = p.get("formatted") or ""
-        if not formatted_address:
-            address_parts = [part for part in [street_address, city_state, postcode] if part]
-            formatted_address = ", ".join(address_parts)
-        
-        place_obj = {
-            "id": p.get("place_id") or p.get("osm_id") or p.get("xid") or p.get("id") or str(p.get("lat")) + "_" + str(p.get("lon")),
-            "name": p.get("name") or p.get("formatted") or "Unknown",
-            "lat": float(lat_p) if lat_p is not None else None,
-            "lng": float(lon_p) if lon_p is not None else None,
-            "type": type_str,
-            "cost": cost,
-            "hours": hours,
-            "address": formatted_address,
-            "street": street_address,
-            "city": city,
-            "state": state,
-            "country": country
-        }
-        places.append(place_obj)
-
-    # Cache the result
-    places_cache.set(cache_key, places, PLACES_TTL)
-    
-    return places
+            cost = "Check onsite"
+    else:
+        cost = str(raw_cost) if raw_cost else "Unknown"
+
+    # Extract address information
+    address_line1 = p.get("address_line1") or ""
+    address_line2 = p.get("address_line2") or ""
+    street = p.get("street") or ""
+    housenumber = p.get("housenumber") or ""
+    city = p.get("city") or ""
+    state = p.get("state") or ""
+    postcode = p.get("postcode") or ""
+    country = p.get("country") or ""
+    
+    # Build formatted address
+    street_address = f"{housenumber} {street}".strip() if housenumber or street else address_line1
+    city_state = f"{city}, {state}".strip(", ") if city or state else ""
+    
+    # Full formatted address
+    formatted_address = p.get("formatted") or ""
+    if not formatted_address:
+        address_parts = [part for part in [street_address, city_state, postcode] if part]
+        formatted_address = ", ".join(address_parts)
+    
+    return Place(
+        id=_feature_id(feat, lat_p, lon_p),
+        name=p.get("name") or p.get("formatted") or "Unknown",
+        lat=lat_p,
+        lng=lon_p,
+        type=type_str,
+        cost=cost,
+        hours=hours,
+        address=formatted_address,
+        street=street_address,
+        city=city,
+        state=state,
+        country=country
+    )
 
 def calculate_route(waypoints, travel_mode):
     """
     Calculate routing data between multiple waypoints using Geoapify Routing API.
-    Results are cached for 6 hours (routes are relatively static).
+    Routes are assembled from the leg cache (see _leg_cache_key): legs cached
+    for 6 hours by earlier routes or travel-time lookups are reused, and only
+    runs of consecutive missing legs are requested from the API.
     
     Args:
         waypoints: List of (lat, lng) tuples representing waypoints in order
-        travel_mode: One of 'drive', 'bicycle', 'walk' (Geoapify format)
+        travel_mode: One of 'driving-car', 'cycling-regular', 'foot-walking'
         
     Returns:
         Dictionary with route information including:
@@ -492,19 +686,6 @@ def calculate_route(waypoints, travel_mode):
         - total_time_min: Total time in minutes
         - legs: List of leg data (distance and time for each segment)
     """
-    # Create cache key from waypoints and travel mode (round to 3 decimals)
-    waypoints_key = "_".join([f"{round(lat, 3)},{round(lng, 3)}" for lat, lng in waypoints])
-    cache_key = f"route_{waypoints_key}_{travel_mode}"
-    cached_result = routing_cache.get(cache_key)
-    if cached_result:
-        print(f"✓ Cache hit: Route calculation")
-        return cached_result
-    
-    print(f"⚡ Cache miss: Calculating route")
-    
-    if not GEOAPIFY_KEY:
-        raise Exception("GEOAPIFY_API_KEY not set in .env")
-    
     if len(waypoints) < 2:
         return {
             "total_distance_km": 0,
@@ -513,13 +694,52 @@ def calculate_route(waypoints, travel_mode):
         }
     
     # Convert travel mode from our format to Geoapify format
-    mode_mapping = {
-        "driving-car": "drive",
-        "cycling-regular": "bicycle",
-        "foot-walking": "walk"
-    }
-    geoapify_mode = mode_mapping.get(travel_mode, "drive")
+    geoapify_mode = GEOAPIFY_MODES.get(travel_mode, "drive")
+    
+    legs = []
+    for a, b in zip(waypoints, waypoints[1:]):
+        legs.append(routing_cache.get(_leg_cache_key(a, b, geoapify_mode)))
+    missing = [i for i, leg in enumerate(legs) if leg is None]
     
+    if not missing:
+        print(f"✓ Cache hit: Route from {len(legs)} cached legs")
+    else:
+        print(f"⚡ Cache miss: Calculating {len(missing)} of {len(legs)} route legs")
+        if ROUTING_ENGINE != "local" and not GEOAPIFY_KEY:
+            raise Exception("GEOAPIFY_API_KEY not set in .env")
+        # Request each run of consecutive missing legs as one multi-waypoint route
+        for first, last in _consecutive_runs(missing):
+            run_legs = _route_legs(waypoints[first:last + 2], geoapify_mode)
+            legs[first:last + 1] = run_legs
+    
+    total_distance_km = sum(leg["distance_km"] for leg in legs)
+    total_time_min = sum(leg["time_min"] for leg in legs)
+    return {
+        "total_distance_km": round(total_distance_km, 2),
+        "total_time_min": round(total_time_min, 1),
+        "legs": [{"distance_km": leg["distance_km"], "time_min": leg["time_min"]} for leg in legs]
+    }
+
+def _consecutive_runs(indices):
+    """[(first, last)] ranges of consecutive values in a sorted index list."""
+    runs = []
+    for i in indices:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+def _route_legs(waypoints, geoapify_mode):
+    """
+    Route waypoints with one Geoapify Routing call and return one
+    {"distance_km", "time_min"} per leg, writing each to the leg cache.
+    Falls back to straight-line estimates (not cached) if the call fails.
+    With ROUTING_ENGINE=local the offline road graph answers instead.
+    """
+    if ROUTING_ENGINE == "local":
+        return _route_legs_road_graph(waypoints, geoapify_mode)
+
     # Format waypoints as lat,lng|lat,lng|...
     waypoints_str = "|".join([f"{lat},{lng}" for lat, lng in waypoints])
     
@@ -531,7 +751,7 @@ def calculate_route(waypoints, travel_mode):
     }
     
     try:
-        r = requests.get(url, params=params, timeout=15)
+        r = http_client.get(url, params=params)
         if not r.ok:
             raise Exception(f"Geoapify Routing API error: {r.status_code} {r.text}")
         
@@ -543,112 +763,88 @@ def calculate_route(waypoints, travel_mode):
             raise Exception("No route found")
         
         properties = features[0].get("properties", {})
-        
-        # Get total distance (in meters) and time (in seconds)
-        total_distance_m = properties.get("distance", 0)
-        total_time_s = properties.get("time", 0)
-        
-        # Convert to km and minutes
-        total_distance_km = total_distance_m / 1000
-        total_time_min = total_time_s / 60
-        
-        # Fallback: If route returns 0 distance/time, use distance-based estimation
-        if total_distance_km == 0 or total_time_min == 0:
-            # Calculate straight-line distance and estimate travel time
-            from math import radians, cos, sin, asin, sqrt
-            lat1, lon1 = waypoints[0]
-            lat2, lon2 = waypoints[1]
-            
-            # Haversine formula for distance
-            lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            r_earth = 6371  # Radius of earth in kilometers
-            total_distance_km = c * r_earth
-            
-            # Estimate travel time based on mode (avg 60 km/h car, 20 km/h bike, 5 km/h walk)
-            if geoapify_mode == "drive":
-                avg_speed = 60
-            elif geoapify_mode == "bicycle":
-                avg_speed = 20
-            else:  # walk
-                avg_speed = 5
-            
-            total_time_min = (total_distance_km / avg_speed) * 60 if avg_speed > 0 else 0
-            print(f"Using distance-based estimation: {total_distance_km:.2f} km, {total_time_min:.1f} min")
-        
-        # Extract leg information
-        legs = []
         legs_data = properties.get("legs", [])
-        for leg in legs_data:
-            leg_distance_m = leg.get("distance", 0)
-            leg_time_s = leg.get("time", 0)
-            legs.append({
-                "distance_km": leg_distance_m / 1000,
-                "time_min": leg_time_s / 60
-            })
-        
-        result = {
-            "total_distance_km": round(total_distance_km, 2),
-            "total_time_min": round(total_time_min, 1),
-            "legs": legs
-        }
         
-        # Cache the result
-        routing_cache.set(cache_key, result, ROUTING_TTL)
+        # Fallback: If route returns 0 distance/time (or no per-leg data), use distance-based estimation
+        if not properties.get("distance") or not properties.get("time") or len(legs_data) != len(waypoints) - 1:
+            result = _estimate_route(waypoints, geoapify_mode)
+            print(f"Using distance-based estimation: {result['total_distance_km']:.2f} km, {result['total_time_min']:.1f} min")
+            return result["legs"]
         
-        return result
+        # Extract leg information and cache every leg for 6 hours
+        legs = []
+        for (a, b), leg in zip(zip(waypoints, waypoints[1:]), legs_data):
+            leg_result = {
+                "distance_km": leg.get("distance", 0) / 1000,
+                "time_min": leg.get("time", 0) / 60
+            }
+            _cache_leg(a, b, geoapify_mode, leg_result)
+            legs.append(leg_result)
+        return legs
     
     except Exception as e:
         print(f"Routing error: {e}")
-        # Fallback: Use distance-based estimation
-        try:
-            from math import radians, cos, sin, asin, sqrt
-            lat1, lon1 = waypoints[0]
-            lat2, lon2 = waypoints[1]
-            
-            # Haversine formula for distance
-            lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            r_earth = 6371  # Radius of earth in kilometers
-            distance_km = c * r_earth
-            
-            # Estimate travel time based on mode
-            if geoapify_mode == "drive":
-                avg_speed = 60
-            elif geoapify_mode == "bicycle":
-                avg_speed = 20
-            else:  # walk
-                avg_speed = 5
-            
-            time_min = (distance_km / avg_speed) * 60 if avg_speed > 0 else 0
-            print(f"Fallback estimation (no API response): {distance_km:.2f} km, {time_min:.1f} min")
-            
-            result = {
-                "total_distance_km": round(distance_km, 2),
-                "total_time_min": round(time_min, 1),
-                "legs": []
-            }
-            return result
-        except:
-            print(f"Fallback estimation also failed, returning zeros")
-            # Last resort: return zeros
-            return {
-                "total_distance_km": 0,
-                "total_time_min": 0,
-                "legs": []
-            }
+        # Fallback: Use distance-based estimation (every leg, not cached)
+        result = _estimate_route(waypoints, geoapify_mode)
+        print(f"Fallback estimation (no API response): {result['total_distance_km']:.2f} km, {result['total_time_min']:.1f} min")
+        return result["legs"]
+
+def _route_legs_road_graph(waypoints, geoapify_mode):
+    """
+    _route_legs on the offline road graph (ROAD_GRAPH_PATH). Legs are cached
+    like API legs; if the graph isn't configured, a waypoint is off the graph
+    or a leg is unreachable, all legs fall back to estimates (not cached).
+    """
+    graph = _get_road_graph()
+    result = graph.route(waypoints, geoapify_mode) if graph is not None else None
+    if result is None:
+        result = _estimate_route(waypoints, geoapify_mode)
+        print(f"Road graph can't route these waypoints, estimating: {result['total_distance_km']:.2f} km, {result['total_time_min']:.1f} min")
+        return result["legs"]
+    for (a, b), leg in zip(zip(waypoints, waypoints[1:]), result["legs"]):
+        _cache_leg(a, b, geoapify_mode, leg)
+    return result["legs"]
+
+_road_graph = None
+_road_graph_lock = threading.Lock()
+
+def _get_road_graph():
+    """Offline road graph from ROAD_GRAPH_PATH, loaded on first use (None if not configured)."""
+    global _road_graph
+    if not ROAD_GRAPH_PATH:
+        return None
+    with _road_graph_lock:
+        if _road_graph is None:
+            _road_graph = RoadGraph.load(ROAD_GRAPH_PATH)
+    return _road_graph
+
+def _estimate_route(waypoints, geoapify_mode):
+    """
+    Route-shaped straight-line estimate over all legs of waypoints (see
+    travel_estimator), corrected per leg by the calibrated factors.
+    """
+    leg_km, leg_min = travel_estimator.estimate_legs(waypoints, geoapify_mode)
+    calibrator = _get_calibrator()
+    legs = []
+    for (lat, lng), d, t in zip(waypoints, leg_km, leg_min):
+        d, t = calibrator.calibrate(geoapify_mode, lat, lng, d, t)
+        legs.append({"distance_km": float(d), "time_min": float(t)})
+    return {
+        "total_distance_km": round(sum(leg["distance_km"] for leg in legs), 2),
+        "total_time_min": round(sum(leg["time_min"] for leg in legs), 1),
+        "legs": legs
+    }
 
 def calculate_travel_time_from_start(start_lat, start_lng, places, travel_mode):
     """
-    OPTIMIZED: Calculate travel times from start to all places using batched routing calls.
-    Instead of 20+ individual routing API calls, batch them into 1-2 calls.
-    Updates each place dict with travel_time_min and distance_km.
+    Calculate travel times from start to all places.
+    Cached start-to-place legs are reused; all missing ones come from a single
+    route matrix request (see route_matrix) and routed ones are written back
+    to the leg cache (see _leg_cache_key) for 6 hours. If the calibrated
+    estimate is trusted in the start's region (CALIBRATION_SKIP_ROUTING),
+    it stands in for the route matrix, except on the periodic audit requests
+    that keep the region's error up to date.
+    Updates each place with travel_time_min and distance_km.
     """
     if not places:
         return places
@@ -665,46 +861,298 @@ def calculate_travel_time_from_start(start_lat, start_lng, places, travel_mode):
     if not valid_places:
         return places
     
-    # OPTIMIZATION: Use batched routing for the first 5 places as sample
-    # Geoapify routing API allows multiple waypoints in one call
-    # We'll calculate direct routes for each place individually to stay within API limits
-    # but we cache the results to avoid redundant calls
-    
+    mode = GEOAPIFY_MODES.get(travel_mode, "drive")
+    missing = []
     for place in valid_places:
         # Check if route is already cached
-        cache_key = hashlib.md5(
-            f"route_{start_lat}_{start_lng}_{place['lat']}_{place['lng']}_{travel_mode}".encode()
-        ).hexdigest()
-        
+        cache_key = _leg_cache_key((start_lat, start_lng), (place["lat"], place["lng"]), mode)
         cached_route = routing_cache.get(cache_key)
         if cached_route:
-            place["travel_time_min"] = cached_route["time_min"]
-            place["distance_km"] = cached_route["distance_km"]
+            place["travel_time_min"] = round(cached_route["time_min"])
+            place["distance_km"] = round(cached_route["distance_km"], 2)
             print(f"✓ Cache hit: Route to {place.get('name', 'unknown')}")
             continue
-        
-        # Calculate route from start to this place
-        waypoints = [(start_lat, start_lng), (place["lat"], place["lng"])]
-        route_data = calculate_route(waypoints, travel_mode)
-        
-        place["travel_time_min"] = round(route_data["total_time_min"])
-        place["distance_km"] = route_data["total_distance_km"]
-        
-        # Cache the route result for 6 hours
-        routing_cache.set(cache_key, {
-            "time_min": place["travel_time_min"],
-            "distance_km": place["distance_km"]
-        }, ROUTING_TTL)
+        missing.append((place, cache_key))
+    
+    if not missing:
+        return places
+    
+    targets = [(place["lat"], place["lng"]) for place, _ in missing]
+    if CALIBRATION_SKIP_ROUTING and _get_calibrator().trust_estimate(mode, start_lat, start_lng):
+        print(f"✓ Calibrated estimates for {len(missing)} places (route matrix skipped)")
+        cells = _route_matrix_local([(start_lat, start_lng)], targets, mode, provider="calibrated")[0]
+    else:
+        print(f"⚡ Cache miss: Route matrix for {len(missing)} places")
+        cells = route_matrix([(start_lat, start_lng)], targets, travel_mode)[0]
+    
+    for (place, cache_key), cell in zip(missing, cells):
+        place["travel_time_min"] = round(cell["time_min"])
+        place["distance_km"] = round(cell["distance_km"], 2)
+        # Only routed legs are cached (and learned from); estimates are cheap
+        # to recompute and the next request may get a real route
+        if cell["provider"] in ("geoapify", "road_graph"):
+            _cache_leg((start_lat, start_lng), (place["lat"], place["lng"]), mode, {
+                "distance_km": cell["distance_km"],
+                "time_min": cell["time_min"]
+            })
     
     return places
 
+def rank_and_route_places(start_lat, start_lng, places, travel_mode):
+    """
+    Order places nearest first by estimated travel time (one vectorized
+    haversine pass over all of them) and run real routing only for the
+    ROUTING_TOP_K nearest, which are the ones the LLM prompt and itinerary
+    use. The others keep the estimate as travel_time_min / distance_km.
+    Places without coordinates go last.
+    """
+    routable = [p for p in places if p.get("lat") is not None and p.get("lng") is not None]
+    unroutable = [p for p in places if p.get("lat") is None or p.get("lng") is None]
+    if routable:
+        mode = GEOAPIFY_MODES.get(travel_mode, "drive")
+        order, distance_km, time_min = travel_estimator.rank_by_eta(start_lat, start_lng, routable, mode)
+        distance_km, time_min = _get_calibrator().calibrate(mode, start_lat, start_lng, distance_km, time_min)
+        for i in order[ROUTING_TOP_K:]:
+            routable[i]["travel_time_min"] = round(float(time_min[i]))
+            routable[i]["distance_km"] = round(float(distance_km[i]), 2)
+        routable = [routable[i] for i in order]
+        if len(routable) > ROUTING_TOP_K:
+            print(f"Routing {ROUTING_TOP_K} nearest of {len(routable)} places; estimating the rest")
+    calculate_travel_time_from_start(start_lat, start_lng, routable[:ROUTING_TOP_K] + unroutable, travel_mode)
+    return routable + unroutable
+
+def build_travel_matrix(start_lat, start_lng, places, travel_mode):
+    """
+    N x N TravelMatrix over the start (key scheduler.START, index 0) and every place
+    with coordinates (keyed by place id). Cells are straight-line estimates,
+    replaced by real legs from the leg cache for the start row/column and
+    each place's TRAVEL_MATRIX_NEIGHBORS nearest places. Cached in memory
+    for 30 minutes per candidate set and mode.
+    """
+    mode = GEOAPIFY_MODES.get(travel_mode, "drive")
+    routable = [p for p in places if p.get("lat") is not None and p.get("lng") is not None]
+    keys = [scheduler.START] + [p["id"] for p in routable]
+    points = [(start_lat, start_lng)] + [(p["lat"], p["lng"]) for p in routable]
+    return _travel_matrix(keys, points, mode)
+
+def _travel_matrix(keys, points, mode):
+    """Cached TravelMatrix for keyed (lat, lng) points in a Geoapify mode (see build_travel_matrix)."""
+    points_key = "|".join(
+        f"{k}@{round(lat, ROUTE_LEG_DECIMALS)},{round(lng, ROUTE_LEG_DECIMALS)}" for k, (lat, lng) in zip(keys, points)
+    )
+    cache_key = hashlib.md5(f"{mode}_{points_key}".encode()).hexdigest()
+    matrix = travel_matrix_cache.get(cache_key)
+    if matrix is not None:
+        print(f"✓ Cache hit: Travel matrix ({len(matrix)} points)")
+        return matrix
+
+    matrix = TravelMatrix(keys, points, mode)
+    matrix.km[:], matrix.minutes[:] = _get_calibrator().calibrate_rows(points, matrix.km, matrix.minutes, mode)
+    for i, j in matrix.neighbor_pairs(TRAVEL_MATRIX_NEIGHBORS):
+        leg = routing_cache.get(_leg_cache_key(points[i], points[j], mode))
+        if leg:
+            matrix.set_leg(i, j, leg["distance_km"], leg["time_min"])
+    print(f"⚡ Built travel matrix: {len(matrix)} points, {matrix.get_stats()['routed_cells']} routed legs")
+    travel_matrix_cache.set(cache_key, matrix, TRAVEL_MATRIX_TTL)
+    return matrix
+
+def optimize_route(waypoints, travel_mode, fixed_end=False):
+    """
+    Reorder the intermediate waypoints to minimize total travel time over
+    the cached travel matrix (see route_optimizer.py), then route them in
+    that order. The first waypoint stays first; with fixed_end the last
+    stays last.
+    Returns calculate_route's dictionary plus "order": indices into
+    waypoints in visiting order.
+    """
+    mode = GEOAPIFY_MODES.get(travel_mode, "drive")
+    matrix = _travel_matrix([str(i) for i in range(len(waypoints))], waypoints, mode)
+    started = time.perf_counter()
+    order = route_optimizer.optimize_order(matrix.minutes, fixed_end=fixed_end)
+    print(f"Optimized order of {len(waypoints)} waypoints in {(time.perf_counter() - started) * 1000:.1f} ms")
+    route = calculate_route([waypoints[i] for i in order], travel_mode)
+    route["order"] = order
+    return route
+
+def _leg_cache_key(a, b, geoapify_mode):
+    """
+    Canonical routing cache key for the leg a -> b ((lat, lng) tuples) in a
+    Geoapify mode. Endpoints are rounded to ROUTE_LEG_DECIMALS, so routes,
+    itineraries and start-to-place lookups share legs. For modes in
+    ROUTE_LEG_SYMMETRIC_MODES (walking, cycling) a -> b and b -> a share a key.
+    """
+    a = (round(a[0], ROUTE_LEG_DECIMALS), round(a[1], ROUTE_LEG_DECIMALS))
+    b = (round(b[0], ROUTE_LEG_DECIMALS), round(b[1], ROUTE_LEG_DECIMALS))
+    if geoapify_mode in ROUTE_LEG_SYMMETRIC_MODES and b < a:
+        a, b = b, a
+    return f"leg_{geoapify_mode}_{a[0]},{a[1]}_{b[0]},{b[1]}"
+
+def _cache_leg(a, b, geoapify_mode, leg):
+    """Write a routed leg to the leg cache for 6 hours and learn from it (see travel_calibration.py)."""
+    _get_calibrator().observe(a, b, geoapify_mode, leg["distance_km"], leg["time_min"])
+    routing_cache.set(_leg_cache_key(a, b, geoapify_mode), leg, ROUTING_TTL)
+
+_calibrator_fitted = threading.Event()
+_calibrator_started = False
+_calibrator_lock = threading.Lock()
+
+def start_calibration_warmup():
+    """
+    Fit the shared travel calibrator from the legs already in the leg cache
+    (including those other workers left in the shared backend) on a
+    background thread, once per process (idempotent).
+    """
+    global _calibrator_started
+    with _calibrator_lock:
+        if _calibrator_started:
+            return
+        _calibrator_started = True
+    threading.Thread(target=_fit_calibrator, name="calibration-warmup", daemon=True).start()
+
+def _fit_calibrator():
+    """Replay every cached leg into the calibrator (scans the whole leg cache)."""
+    fitted = 0
+    try:
+        for key, leg in routing_cache.items("leg_"):
+            parsed = _parse_leg_cache_key(key)
+            if parsed is None or not isinstance(leg, dict):
+                continue
+            a, b, geoapify_mode = parsed
+            travel_calibration.calibrator.observe(a, b, geoapify_mode, leg["distance_km"], leg["time_min"])
+            fitted += 1
+    except Exception as e:
+        print(f"Warning: Travel calibration warm-up failed: {e}")
+    finally:
+        _calibrator_fitted.set()
+    if fitted:
+        print(f"Calibrated travel estimates from {fitted} cached legs")
+
+def _get_calibrator():
+    """
+    Shared travel calibrator. Never blocks: until the warm-up has replayed
+    the cached legs it answers from what it has learned so far (no
+    correction and no confidence at first, so routing is used).
+    """
+    if not _calibrator_started:
+        start_calibration_warmup()
+    return travel_calibration.calibrator
+
+def get_calibration_stats():
+    """Travel calibration factors and error statistics ("warmed_up" once cached legs are replayed)."""
+    stats = _get_calibrator().get_stats()
+    stats["warmed_up"] = _calibrator_fitted.is_set()
+    return stats
+
+def _parse_leg_cache_key(key):
+    """(a, b, geoapify_mode) from a _leg_cache_key key, or None."""
+    parts = key.split("_")
+    if len(parts) != 4 or parts[0] != "leg":
+        return None
+    try:
+        a = tuple(float(x) for x in parts[2].split(","))
+        b = tuple(float(x) for x in parts[3].split(","))
+    except ValueError:
+        return None
+    if len(a) != 2 or len(b) != 2:
+        return None
+    return a, b, parts[1]
+
+def route_matrix(sources, targets, travel_mode):
+    """
+    Travel times from every source to every target, as rows (one per source)
+    of cells {"distance_km", "time_min", "provider"}, where provider is
+    "geoapify", "road_graph", "local" or "fallback" (the last two are
+    straight-line estimates corrected by the calibrated factors).
+
+    Uses one Geoapify Route Matrix request per ROUTE_MATRIX_MAX_TARGETS
+    targets, the offline road graph when ROUTING_ENGINE=local, or the local
+    straight-line stand-in when ROUTE_MATRIX=local. If the API fails (or
+    can't route a pair) the local estimate is used for the affected cells,
+    marked "fallback".
+    """
+    mode = GEOAPIFY_MODES.get(travel_mode, "drive")
+    if ROUTING_ENGINE == "local":
+        return _route_matrix_road_graph(sources, targets, mode)
+    if ROUTE_MATRIX == "local" or not GEOAPIFY_KEY:
+        return _route_matrix_local(sources, targets, mode)
+
+    rows = [[] for _ in sources]
+    for i in range(0, len(targets), ROUTE_MATRIX_MAX_TARGETS):
+        chunk = targets[i:i + ROUTE_MATRIX_MAX_TARGETS]
+        try:
+            chunk_rows = _route_matrix_geoapify(sources, chunk, mode)
+        except Exception as e:
+            print(f"Route matrix error: {e}")
+            chunk_rows = _route_matrix_local(sources, chunk, mode, provider="fallback")
+        for row, chunk_row in zip(rows, chunk_rows):
+            row.extend(chunk_row)
+    return rows
+
+def _route_matrix_geoapify(sources, targets, mode):
+    """One Geoapify Route Matrix call; unroutable pairs get a local estimate."""
+    r = http_client.post(
+        "https://api.geoapify.com/v1/routematrix",
+        params={"apiKey": GEOAPIFY_KEY},
+        json={
+            "mode": mode,
+            # Geoapify expects [lon, lat]
+            "sources": [{"location": [lng, lat]} for lat, lng in sources],
+            "targets": [{"location": [lng, lat]} for lat, lng in targets]
+        }
+    )
+    if not r.ok:
+        raise Exception(f"Geoapify Route Matrix API error: {r.status_code} {r.text}")
+    data = r.json()
+
+    rows = _route_matrix_local(sources, targets, mode, provider="fallback")
+    for i, row in enumerate(data.get("sources_to_targets", [])):
+        for cell in row:
+            if not cell:
+                continue
+            j = cell.get("target_index")
+            distance_m = cell.get("distance")
+            time_s = cell.get("time")
+            if j is None or distance_m is None or time_s is None:
+                continue
+            i_src = cell.get("source_index", i)
+            rows[i_src][j] = {"distance_km": distance_m / 1000, "time_min": time_s / 60, "provider": "geoapify"}
+    return rows
+
+def _route_matrix_road_graph(sources, targets, mode):
+    """
+    Same contract as _route_matrix_geoapify from the offline road graph: one
+    one-to-many search per source. Pairs the graph can't route get a local
+    estimate marked "fallback".
+    """
+    rows = _route_matrix_local(sources, targets, mode, provider="fallback")
+    graph = _get_road_graph()
+    if graph is None:
+        print("Route matrix: ROAD_GRAPH_PATH not set, estimating")
+        return rows
+    for row, graph_row in zip(rows, graph.matrix(sources, targets, mode)):
+        for j, cell in enumerate(graph_row):
+            if cell is not None:
+                row[j] = {"distance_km": cell["distance_km"], "time_min": cell["time_min"], "provider": "road_graph"}
+    return rows
+
+def _route_matrix_local(sources, targets, mode, provider="local"):
+    """Same contract as _route_matrix_geoapify, from calibrated straight-line estimates."""
+    distance_km, time_min = travel_estimator.estimate_matrix(sources, targets, mode)
+    distance_km, time_min = _get_calibrator().calibrate_rows(sources, distance_km, time_min, mode)
+    return [
+        [{"distance_km": float(d), "time_min": float(t), "provider": provider} for d, t in zip(d_row, t_row)]
+        for d_row, t_row in zip(distance_km, time_min)
+    ]
+
 # ---------------- existing LLM code ----------------
 
 def call_gemini(messages, temperature=0.7):
     """
     Call Google's Gemini API as a fallback.
     Converts OpenAI message format to Gemini format.
+    Raises CircuitOpenError without calling Gemini while its breaker is open.
     """
+    BREAKERS["gemini"].check()
     try:
         # Initialize Gemini model
         model = genai.GenerativeModel('gemini-2.0-flash-exp')
@@ -737,18 +1185,24 @@ def call_gemini(messages, temperature=0.7):
                     })()
                 })()]
         
-        return GeminiResponse(response.text)
+        result = GeminiResponse(response.text)
+        BREAKERS["gemini"].record_success()
+        return result
     
     except Exception as e:
+        BREAKERS["gemini"].record_failure(e)
         print(f"Gemini API error: {str(e)}")
         raise e
 
 def call_llm_with_fallback(model, messages, temperature=0.7):
     """
     Helper function to call OpenAI with fallback to Google Gemini if the primary model fails.
+    While a provider's circuit breaker is open it is skipped without a call; if
+    both are open this raises CircuitOpenError and callers use default scores.
     """
     try:
-        response = client.chat.completions.create(
+        response = BREAKERS["openai"].call(
+            client.chat.completions.create,
             model=model,
             messages=messages,
             temperature=temperature
@@ -768,10 +1222,12 @@ def call_llm_with_fallback(model, messages, temperature=0.7):
             print(f"Gemini fallback also failed: {str(fallback_error)}")
             raise fallback_error
 
-def score_and_generate_itinerary_combined(prefs, places, weather, travel_times, start_time=None, end_time=None, is_smart=False):
+def score_and_generate_itinerary_combined(prefs, places, weather, travel_times, is_smart=False):
     """
     OPTIMIZED: Single LLM call that returns BOTH activity scores AND itinerary.
     This eliminates the 25-30% token waste from duplicate scoring + generation calls.
+    In smart mode the LLM only scores and writes reasons; the timed itinerary
+    is built locally (see scheduler.py), so "itinerary" is empty.
     Results are cached for 1 hour.
     
     Args:
@@ -779,20 +1235,17 @@ def score_and_generate_itinerary_combined(prefs, places, weather, travel_times,
         places: List of available places/activities
         weather: Weather data dict
         travel_times: Dict of travel times from start location
-        start_time: Optional start time for smart mode (format: "HH:MM")
-        end_time: Optional end time for smart mode (format: "HH:MM")
         is_smart: Boolean indicating if this is smart generation mode
     
     Returns:
-        dict with keys: "scores" (activity scores) and "itinerary" (scheduled itinerary)
+        dict with keys: "activity_scores" and "itinerary" (ranked list, manual mode only)
     """
     # Create cache key
     place_names = sorted([p.get('name', '') for p in places[:20]])
     interests_sorted = sorted(prefs.get('interests', []))
     weather_key = f"{weather.get('summary', 'clear')}_{weather.get('max_precip_probability', 0)}" if weather else "no_weather"
-    time_key = f"{start_time}_{end_time}" if start_time and end_time else "no_time"
     cache_key = hashlib.md5(
-        f"combined_{'smart' if is_smart else 'manual'}_{'-'.join(place_names)}_{'-'.join(interests_sorted)}_{prefs.get('budget', 'medium')}_{weather_key}_{time_key}".encode()
+        f"combined_{'smart' if is_smart else 'manual'}_{'-'.join(place_names)}_{'-'.join(interests_sorted)}_{prefs.get('budget', 'medium')}_{weather_key}".encode()
     ).hexdigest()
     
     cached_result = llm_combined_cache.get(cache_key)
@@ -801,17 +1254,21 @@ def score_and_generate_itinerary_combined(prefs, places, weather, travel_times,
         return cached_result
     
     print(f"⚡ Cache miss: Running combined LLM operation")
-    
+    return llm_combined_cache.single_flight(
+        cache_key,
+        lambda: _run_combined_llm(prefs, places, weather, is_smart, cache_key)
+    )
+
+def _run_combined_llm(prefs, places, weather, is_smart, cache_key):
+    """Build the combined scoring + itinerary prompt, call the LLM and cache the parsed result."""
     weather_context = ""
     if weather:
         weather_context = f"""
 Current Weather: {weather.get('summary', 'clear')} | Temp: {weather.get('temp_f', 65)}°F | Rain chance: {weather.get('max_precip_probability', 0)}%"""
     
-    if is_smart and start_time and end_time:
-        # SMART MODE: Single call for both activity scores AND time-scheduled itinerary
-        prompt = f"""You are an expert trip planner. Analyze the activities below and provide BOTH:
-1. Relevance scores with detailed reasons for browsing
-2. A complete time-scheduled itinerary with compelling reasons
+    if is_smart:
+        # SMART MODE: scores and reasons only; scheduler.py picks, orders and times the stops
+        prompt = f"""You are an expert trip planner. Score how well each activity below fits the user, with a compelling reason for each.
 
 User Interests: {', '.join(prefs.get('interests', []))} | Budget: {prefs.get('budget', 'medium')} | Mode: {prefs.get('travel_mode', 'driving-car')}{weather_context}
 
@@ -824,25 +1281,17 @@ Available Activities:
     'travel_time_min': p.get('travel_time_min', 0)
 } for p in places[:20]], indent=1)}
 
-TIME WINDOW: {start_time} to {end_time}
-
 RESPONSE FORMAT (JSON ONLY):
 {{
     "activity_scores": {{
-        "Activity Name": {{"score": 85, "reason": "Detailed reason with specific features/alignment (1-2 sentences)", "outdoor": false, "warning": null}},
+        "Activity Name": {{"score": 85, "reason": "Why this place fits, mentioning its specific features or unique appeal (2-3 sentences)", "outdoor": false, "warning": null}},
         "Park Name": {{"score": 62, "reason": "Explanation mentioning specific appeal or features", "outdoor": true, "warning": "⚠️ High rain chance"}}
-    }},
-    "itinerary": [
-        {{"time": "9:00 AM", "name": "Activity", "duration": "1.5 hours", "cost": "$15.00", "reason": "Compelling reason with specific details about why this activity fits and unique appeal (2-3 sentences)", "travel_time_min": 10}}
-    ]
+    }}
 }}
 
 INSTRUCTIONS:
-- Score all 20 activities (0-100)
-- For EACH activity_score reason: Explain how it aligns with interests, mention specific features, 1-2 sentences
-- For EACH itinerary reason: Explain why this place was selected, mention unique appeal or features, 2-3 sentences
-- Create itinerary fitting {start_time}-{end_time} window
-- Account for travel times
+- Score all 20 activities (0-100) for fit with the interests and budget
+- For EACH reason: Explain how it aligns with interests, mention specific features or unique appeal, 2-3 sentences
 - Reduce outdoor activity scores by 15-20 if precipitation >60%
 - Return ONLY valid JSON, no markdown"""
     else:
@@ -899,7 +1348,9 @@ INSTRUCTIONS:
         
         result = json.loads(content)
         
-        # Validate structure
+        # Validate structure (smart mode has no LLM itinerary)
+        if is_smart:
+            result.setdefault("itinerary", [])
         if "activity_scores" not in result or "itinerary" not in result:
             print("Warning: LLM response missing expected keys, using fallback structure")
             result = {
@@ -1142,89 +1593,6 @@ def score_activities_with_llm(prefs, places, weather=None):
             "weather_warning": None
         } for place in places[:20]}
 
-def call_llm_smart(prefs, places, weather, start_time, end_time):
-    """
-    Enhanced LLM call for smart generation with realistic durations and time-based scheduling.
-    """
-    prompt = f"""
-    You are an expert trip planner creating a detailed, time-optimized itinerary.
-    
-    User preferences: {prefs}
-    Available places: {places}
-    Weather: {weather}
-    Time window: {start_time} to {end_time}
-    
-    INSTRUCTIONS:
-    1. Create a complete itinerary that fits within the time window ({start_time} to {end_time})
-    2. Assign realistic durations for each activity:
-       - Museums/Galleries: 1.5-2.5 hours
-       - Restaurants/Dining: 1-1.5 hours
-       - Parks/Outdoor spaces: 0.5-1.5 hours
-       - Shopping: 1-2 hours
-       - Cafes/Coffee: 0.5-1 hour
-       - Entertainment venues: 2-3 hours
-       - Historic sites: 1-2 hours
-    3. Select activities that match the user's interests and budget
-    4. Space activities to account for travel time between locations
-    5. Include specific costs:
-       - Use actual prices from the places data if available
-       - Otherwise, estimate realistic costs based on the activity type and budget level
-       - Format as "$XX.XX" for paid activities or "Free" for free activities
-    6. Provide thoughtful reasons why each activity was selected
-    7. Create a balanced day with variety (mix of indoor/outdoor, active/relaxing, cultural/dining)
-    
-    OUTPUT FORMAT:
-    Return ONLY a JSON list of activity objects with these exact fields:
-    - "time": Start time in "HH:MM AM/PM" format
-    - "name": Activity/place name (must match a place from the available places)
-    - "duration": Duration as "X.X hours" or "XX minutes"
-    - "cost": Specific cost as "$XX.XX" or "Free"
-    - "reason": Brief explanation (1-2 sentences) why this activity fits the user's preferences
-    - "travel_time_min": Travel time to this location from the previous one (use data from places if available, otherwise estimate)
-    
-    Example:
-    [
-        {{"time": "9:00 AM", "name": "Museum of Art", "duration": "2 hours", "cost": "$25.00", "reason": "Perfect start to explore your interest in art and culture with world-class exhibitions.", "travel_time_min": 15}},
-        {{"time": "11:30 AM", "name": "Central Park", "duration": "1 hour", "cost": "Free", "reason": "A relaxing outdoor break to enjoy nature between museum visits.", "travel_time_min": 10}}
-    ]
-    
-    IMPORTANT: 
-    - Ensure activities fit within the time window
-    - Account for travel time between activities
-    - Return ONLY the JSON array, no markdown, no extra text
-    - Make sure the last activity ends before {end_time}
-    """
-    
-    messages = [
-        {"role": "system", "content": "You are an expert trip planner AI. You create detailed, realistic itineraries. Always respond with valid JSON only, no markdown formatting."},
-        {"role": "user", "content": prompt}
-    ]
-    
-    response = call_llm_with_fallback("gpt-4o-mini", messages, temperature=0.7)
-    
-    try:
-        content = response.choices[0].message.content
-        if not content or content.strip() == "":
-            print("LLM smart returned empty content, using fallback")
-            return []
-        
-        content = content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        return json.loads(content)
-    except json.JSONDecodeError as e:
-        print(f"Failed to parse LLM smart response as JSON: {str(e)}")
-        print(f"LLM response content: {response.choices[0].message.content[:500]}")
-        return []  # Return empty list as fallback
-    except Exception as e:
-        print(f"Unexpected error parsing LLM smart response: {str(e)}")
-        return []
-
 def plan_trip(data):
     prefs = {
         "starting_address": data.get("starting_address", "Boston, MA"),
@@ -1235,7 +1603,7 @@ def plan_trip(data):
         "use_weather": data.get("use_weather", True)  # Default to True for backward compatibility
     }
     if MOCK:
-        places = MOCK_PLACES
+        places = [Place.from_dict(p) for p in MOCK_PLACES]
         weather = MOCK_WEATHER
         travel_times = MOCK_TRAVEL_TIMES
         lat, lng = 42.36, -71.06
@@ -1249,8 +1617,8 @@ def plan_trip(data):
             budget=prefs["budget"]
         )
         
-        # Calculate travel times from starting point to each place
-        places = calculate_travel_time_from_start(lat, lng, places, prefs["travel_mode"])
+        # Rank places by estimated travel time; only the nearest get real routing
+        places = rank_and_route_places(lat, lng, places, prefs["travel_mode"])
         
         # Fetch real weather data from Open-Meteo
         weather = fetch_weather_from_openmeteo(lat, lng)
@@ -1287,8 +1655,11 @@ def plan_trip(data):
     polished_itinerary = combined_result.get("itinerary", [])
     
     # Add lat/lng, distance, address info, and weather warnings to itinerary items by matching names
+    places_by_name = {}
+    for place in places_sorted:
+        places_by_name.setdefault(place.name, place)
     for item in polished_itinerary:
-        matching_place = next((p for p in places_sorted if p['name'] == item['name']), None)
+        matching_place = places_by_name.get(item['name'])
         if matching_place:
             item['lat'] = matching_place.get('lat')
             item['lng'] = matching_place.get('lng')
@@ -1303,27 +1674,6 @@ def plan_trip(data):
             item['is_outdoor'] = matching_place.get('is_outdoor', False)
             item['weather_warning'] = matching_place.get('weather_warning', None)
     
-    # Sort places by relevance score (highest first)
-    places_sorted = sorted(places, key=lambda x: x.get('relevance_score', 0), reverse=True)
-    
-    # Use itinerary from combined LLM call
-    polished_itinerary = combined_result.get("itinerary", [])
-    
-    # Add lat/lng, distance, address info, and weather warnings to itinerary items by matching names
-    for item in polished_itinerary:
-        matching_place = next((p for p in places_sorted if p['name'] == item['name']), None)
-        if matching_place:
-            item['lat'] = matching_place.get('lat')
-            item['lng'] = matching_place.get('lng')
-            item['distance_km'] = matching_place.get('distance_km', 0)
-            item['address'] = matching_place.get('address', 'Address not available')
-            item['street'] = matching_place.get('street', '')
-            item['city'] = matching_place.get('city', '')
-            item['state'] = matching_place.get('state', '')
-            item['country'] = matching_place.get('country', '')
-            item['is_outdoor'] = matching_place.get('is_outdoor', False)
-            item['weather_warning'] = matching_place.get('weather_warning', None)
-    
     return {
         "itinerary": polished_itinerary,
         "weather": weather,
@@ -1331,6 +1681,102 @@ def plan_trip(data):
         "starting_coords": {"lat": lat, "lng": lng}
     }
 
+def schedule_smart_itinerary(places, matrix, start_time, end_time, scored_names=None, weekday=None):
+    """
+    Timed itinerary for start_time-end_time ("HH:MM") built by scheduler.py
+    from places that carry LLM relevance scores and reasons, using matrix
+    (build_travel_matrix) for travel times. If scored_names is given, only
+    those places are candidates. weekday (0 = Monday, default today) selects
+    opening hours.
+
+    Items have the shape the LLM itinerary had (time, name, duration, cost,
+    reason, travel_time_min, location and score fields) plus numeric
+    duration_min and cost_usd for totals.
+    """
+    start_min = scheduler.parse_clock(start_time)
+    end_min = scheduler.parse_clock(end_time)
+    if start_min is None:
+        start_min = 9 * 60
+    if end_min is None:
+        end_min = 17 * 60
+    if weekday is None:
+        weekday = datetime.now().weekday()
+    
+    candidates = {}
+    for place in places:
+        if matrix.index(place["id"]) is None or place["id"] in candidates:
+            continue
+        if scored_names and place.name not in scored_names:
+            continue
+        candidates[place["id"]] = place
+    stops = [{
+        "key": place_id,
+        "score": place.get('relevance_score', 50),
+        "duration_min": scheduler.estimate_duration_min(place.get('type')),
+        "kind": scheduler.activity_kind(place.get('type'))[0],
+        "windows": scheduler.opening_windows(place.get('hours'), weekday)
+    } for place_id, place in candidates.items()]
+    
+    itinerary = [
+        _itinerary_item(candidates[entry["key"]], entry["start_min"], entry["end_min"] - entry["start_min"], entry["travel_min"])
+        for entry in scheduler.schedule(stops, matrix.time_between, start_min, end_min)
+    ]
+    print(f"Scheduled {len(itinerary)} of {len(stops)} candidate stops for {start_time}-{end_time}")
+    return itinerary
+
+def _itinerary_item(place, start_min, duration_min, travel_min):
+    """Smart itinerary item for a scored place visited at start_min (minutes after midnight)."""
+    cost_usd = scheduler.estimate_cost(place.get('cost'), place.get('type'))
+    return {
+        "time": scheduler.format_clock(start_min),
+        "name": place.get('name'),
+        "duration": scheduler.format_duration(duration_min),
+        "duration_min": duration_min,
+        "cost": f"${cost_usd:.2f}" if cost_usd else "Free",
+        "cost_usd": cost_usd,
+        "reason": place.get('matched_reason') or 'A great activity to enjoy.',
+        "travel_time_min": round(travel_min),
+        "lat": place.get('lat'),
+        "lng": place.get('lng'),
+        "distance_km": place.get('distance_km') or 0,
+        # Place.from_dict sets missing base fields to None, so fall back on falsy values
+        "address": place.get('address') or 'Address not available',
+        "street": place.get('street') or '',
+        "city": place.get('city') or '',
+        "state": place.get('state') or '',
+        "country": place.get('country') or '',
+        "hours": place.get('hours'),
+        "relevance_score": place.get('relevance_score', 50),
+        "matched_reason": place.get('matched_reason'),
+        "is_outdoor": place.get('is_outdoor', False),
+        "weather_warning": place.get('weather_warning')
+    }
+
+def _itinerary_totals(itinerary):
+    """Cost and time totals of a smart itinerary, from each item's numbers."""
+    total_cost = sum(_item_cost_usd(item) for item in itinerary)
+    total_activity_hours = sum(_item_duration_min(item) for item in itinerary) / 60
+    total_travel_minutes = sum(item.get('travel_time_min') or 0 for item in itinerary)
+    return {
+        "total_cost": round(total_cost, 2),
+        "total_time_hours": round(total_activity_hours + total_travel_minutes / 60, 2),
+        "total_activity_hours": round(total_activity_hours, 2),
+        "total_travel_hours": round(total_travel_minutes / 60, 2)
+    }
+
+def _item_duration_min(item):
+    """Visit length of an itinerary item in minutes (older items only have the "duration" text)."""
+    if item.get('duration_min') is not None:
+        return item['duration_min']
+    minutes = scheduler.parse_duration(item.get('duration'))
+    return minutes if minutes is not None else scheduler.DEFAULT_KIND[2]
+
+def _item_cost_usd(item):
+    """Cost of an itinerary item in USD (older items only have the "cost" text)."""
+    if item.get('cost_usd') is not None:
+        return item['cost_usd']
+    return scheduler.estimate_cost(item.get('cost'), None)
+
 def plan_trip_smart(data):
     """
     Smart trip planning with time-based scheduling, realistic durations, and cost estimation.
@@ -1349,7 +1795,7 @@ def plan_trip_smart(data):
     end_time = data.get("end_time", "17:00")
     
     if MOCK:
-        places = MOCK_PLACES
+        places = [Place.from_dict(p) for p in MOCK_PLACES]
         weather = MOCK_WEATHER
         lat, lng = 42.36, -71.06
     else:
@@ -1362,17 +1808,18 @@ def plan_trip_smart(data):
             budget=prefs["budget"]
         )
         
-        # Calculate travel times from starting point to each place
-        places = calculate_travel_time_from_start(lat, lng, places, prefs["travel_mode"])
+        # Rank places by estimated travel time; only the nearest get real routing
+        places = rank_and_route_places(lat, lng, places, prefs["travel_mode"])
         
         # Fetch real weather data from Open-Meteo
         weather = fetch_weather_from_openmeteo(lat, lng)
     
-    # OPTIMIZED: Use combined LLM call for both scoring and time-scheduled itinerary (single API call)
+    # The LLM only scores places and writes reasons (single API call);
+    # the timed itinerary is scheduled locally below
     weather_for_scoring = weather if prefs["use_weather"] else None
     combined_result = score_and_generate_itinerary_combined(
         prefs, places, weather_for_scoring, {place['id']: place.get('travel_time_min', 10) for place in places},
-        start_time=start_time, end_time=end_time, is_smart=True
+        is_smart=True
     )
     
     activity_scores = combined_result.get("activity_scores", {})
@@ -1398,90 +1845,143 @@ def plan_trip_smart(data):
     # Sort by relevance score
     all_activities_sorted = sorted(all_activities, key=lambda x: x.get('relevance_score', 0), reverse=True)
     
-    # Use itinerary from combined LLM call
-    smart_itinerary = combined_result.get("itinerary", [])
+    # Choose, order and time the stops from the scores, opening hours,
+    # per-kind durations and the pairwise travel matrix
+    matrix = build_travel_matrix(lat, lng, places, prefs["travel_mode"])
+    # Only places the LLM scored compete (if its names matched any)
+    scored_names = {place.name for place in places if place.name in activity_scores}
+    smart_itinerary = schedule_smart_itinerary(places, matrix, start_time, end_time, scored_names=scored_names or None)
     
-    # Add lat/lng, distance info, address, relevance scoring, and weather info to itinerary items by matching names
-    for item in smart_itinerary:
-        matching_place = next((p for p in places if p['name'] == item['name']), None)
-        if matching_place:
-            item['lat'] = matching_place.get('lat')
-            item['lng'] = matching_place.get('lng')
-            item['distance_km'] = matching_place.get('distance_km', 0)
-            item['address'] = matching_place.get('address', 'Address not available')
-            item['street'] = matching_place.get('street', '')
-            item['city'] = matching_place.get('city', '')
-            item['state'] = matching_place.get('state', '')
-            item['country'] = matching_place.get('country', '')
-        else:
-            # If no exact match, try to find a similar place or use defaults
-            item['lat'] = None
-            item['lng'] = None
-            item['distance_km'] = 0
-            item['address'] = 'Address not available'
-            item['street'] = ''
-            item['city'] = ''
-            item['state'] = ''
-            item['country'] = ''
-        
-        # Add relevance score, matched_reason, and weather info for consistency
-        # Use normalized activity_scores keys: score, reason, outdoor, warning
-        if matching_place:
-            item['relevance_score'] = matching_place.get('relevance_score', 50)
-            item['matched_reason'] = matching_place.get('matched_reason', item.get('reason', 'A great activity to enjoy.'))
-            item['is_outdoor'] = matching_place.get('is_outdoor', False)
-            item['weather_warning'] = matching_place.get('weather_warning', None)
-        else:
-            item['relevance_score'] = 50
-            item['matched_reason'] = item.get('reason', 'A great activity to enjoy.')
-            item['is_outdoor'] = False
-            item['weather_warning'] = None
-    
-    # Calculate total cost, activity time, and travel time separately
-    total_cost = 0
-    total_activity_hours = 0
-    total_travel_minutes = 0
-    
-    for item in smart_itinerary:
-        # Parse cost
-        cost_str = item.get('cost', 'Free')
-        if cost_str != 'Free' and '$' in cost_str:
-            try:
-                cost_value = float(cost_str.replace('$', '').replace(',', ''))
-                total_cost += cost_value
-            except ValueError:
-                pass
-        
-        # Parse activity duration
-        duration_str = item.get('duration', '0 hours')
-        try:
-            if 'hour' in duration_str:
-                hours = float(duration_str.split('hour')[0].strip())
-                total_activity_hours += hours
-            elif 'minute' in duration_str:
-                minutes = float(duration_str.split('minute')[0].strip())
-                total_activity_hours += minutes / 60
-        except ValueError:
-            pass
-        
-        # Add travel time separately
-        travel_min = item.get('travel_time_min', 0)
-        total_travel_minutes += travel_min
-    
-    # Calculate total time (activity + travel)
-    total_time_hours = total_activity_hours + (total_travel_minutes / 60)
-    
-    return {
+    result = {
         "itinerary": smart_itinerary,
         "all_activities": all_activities_sorted,  # NEW: Full list for browsing
         "weather": weather,
         "places": places,
-        "starting_coords": {"lat": lat, "lng": lng},
-        "total_cost": round(total_cost, 2),
-        "total_time_hours": round(total_time_hours, 2),
-        "total_activity_hours": round(total_activity_hours, 2),
-        "total_travel_hours": round(total_travel_minutes / 60, 2)
+        "starting_coords": {"lat": lat, "lng": lng}
+    }
+    # Totals straight from the scheduled numbers
+    result.update(_itinerary_totals(smart_itinerary))
+    return result
+
+def replan_itinerary(data):
+    """
+    Apply one edit to an existing smart itinerary without re-running
+    plan_trip_smart: no geocoding, place search, routing or weather calls,
+    and the LLM only for an added place that carries no score yet.
+
+    Expects data with:
+    - itinerary: items as returned by plan_trip_smart
+    - starting_coords: {lat, lng} of the trip start
+    - edit: {"op": "replace" | "remove" | "insert" | "move", "index": i,
+      "place": {...} (replace/insert, e.g. an entry of all_activities),
+      "to": j (move)}; insert puts the place before index i
+    - travel_mode, start_time, end_time, and for scoring new places
+      interests, budget, use_weather (optional)
+
+    Only legs whose endpoints changed are recomputed, from the leg cache or
+    the calibrated estimate. Stops before the first changed leg keep their
+    times; later ones are re-timed (waiting for opening hours if needed).
+    Returns the itinerary and totals like plan_trip_smart, plus
+    "recomputed_legs" (positions whose incoming leg changed), "fits_window"
+    (the day still ends by end_time) and, if not, "overrun_min".
+    """
+    mode = GEOAPIFY_MODES.get(data.get("travel_mode", "driving-car"), "drive")
+    start = (data["starting_coords"]["lat"], data["starting_coords"]["lng"])
+    start_min = scheduler.parse_clock(data.get("start_time", "09:00"))
+    end_min = scheduler.parse_clock(data.get("end_time", "17:00"))
+    if start_min is None:
+        start_min = 9 * 60
+    if end_min is None:
+        end_min = 17 * 60
+    weekday = datetime.now().weekday()
+    
+    # (item, position in the original itinerary, or None for an added place)
+    entries = [(item, i) for i, item in enumerate(data["itinerary"])]
+    edit = data["edit"]
+    op, index = edit["op"], edit["index"]
+    if op == "remove":
+        del entries[index]
+    elif op == "move":
+        entries.insert(edit["to"], entries.pop(index))
+    else:
+        place = _scored_place(Place.from_dict(edit["place"]), data)
+        item = _itinerary_item(place, start_min, scheduler.estimate_duration_min(place.get('type')), 0)
+        if op == "replace":
+            entries[index] = (item, None)
+        else:
+            entries.insert(index, (item, None))
+    
+    itinerary = []
+    recomputed = []
+    clock = start_min
+    retime = False
+    for pos, (item, original) in enumerate(entries):
+        item = dict(item)
+        previous_original = entries[pos - 1][1] if pos else -1  # -1: the start
+        duration_min = _item_duration_min(item)
+        if original is None or previous_original is None or original - 1 != previous_original:
+            previous = start if pos == 0 else (itinerary[-1]['lat'], itinerary[-1]['lng'])
+            point = (item.get('lat'), item.get('lng'))
+            if None in previous or None in point:
+                item['travel_time_min'] = 0
+            else:
+                item['travel_time_min'] = round(_cached_leg(previous, point, mode)["time_min"])
+            recomputed.append(pos)
+            retime = True
+        
+        begin = scheduler.parse_clock(item.get('time'))
+        if retime or begin is None:
+            arrive = clock + (item.get('travel_time_min') or 0)
+            begin = arrive
+            # The old flag was for the old arrival time
+            item.pop('outside_opening_hours', None)
+            windows = scheduler.opening_windows(item.get('hours'), weekday)
+            if windows is not None:
+                fitting = [max(arrive, opens) for opens, closes in windows if max(arrive, opens) + duration_min <= closes]
+                item['outside_opening_hours'] = not fitting
+                if fitting:
+                    begin = fitting[0]
+            item['time'] = scheduler.format_clock(begin)
+        clock = begin + duration_min
+        itinerary.append(item)
+    
+    print(f"Re-planned itinerary ({op}): {len(recomputed)} legs recomputed, {len(itinerary)} stops")
+    result = {
+        "itinerary": itinerary,
+        "recomputed_legs": recomputed,
+        "fits_window": clock <= end_min
+    }
+    if clock > end_min:
+        result["overrun_min"] = round(clock - end_min)
+    result.update(_itinerary_totals(itinerary))
+    return result
+
+def _scored_place(place, data):
+    """place with relevance score and reason, asking the LLM only if it has none yet."""
+    if place.get('relevance_score') is not None and place.get('matched_reason'):
+        return place
+    prefs = {
+        "interests": data.get("interests", []),
+        "budget": data.get("budget", "low"),
+        "travel_mode": data.get("travel_mode", "driving-car")
     }
+    weather = None
+    if data.get("use_weather", True):
+        weather = MOCK_WEATHER if MOCK else fetch_weather_from_openmeteo(data["starting_coords"]["lat"], data["starting_coords"]["lng"])
+    scores = _normalize_activity_scores(score_activities_with_llm(prefs, [place], weather))
+    info = scores.get(place.name) or next(iter(scores.values()), {})
+    place['relevance_score'] = info.get('score', 50)
+    place['matched_reason'] = info.get('reason') or 'An interesting activity to explore.'
+    place['is_outdoor'] = info.get('outdoor', False)
+    place['weather_warning'] = info.get('warning')
+    return place
+
+def _cached_leg(a, b, geoapify_mode):
+    """Leg a -> b from the leg cache, else the calibrated straight-line estimate; never calls a routing API."""
+    leg = routing_cache.get(_leg_cache_key(a, b, geoapify_mode))
+    if leg:
+        return leg
+    return _estimate_route([a, b], geoapify_mode)["legs"][0]
 
 #=====================================================
 #                  USER AUTHENTICATION
@@ -0,0 +1,193 @@
+"""
+SimpleCache: LRU limits, stale-while-revalidate and the expiry sweep.
+"""
+
+import threading
+import time
+
+from cache import SimpleCache
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_max_entries_evicts_least_recently_used():
+    cache = SimpleCache("t", max_entries=2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    assert cache.get("a") == 1  # a is now more recent than b
+    cache.set("c", 3, 60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.get_stats()
+    assert stats["total_entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_max_bytes_evicts_until_within_limit():
+    value = "x" * 100  # ~102 bytes as JSON
+    cache = SimpleCache("t", max_bytes=250)
+    cache.set("a", value, 60)
+    cache.set("b", value, 60)
+    cache.get("a")
+    cache.set("c", value, 60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("c") == value
+    assert cache.get_stats()["approx_bytes"] <= 250
+
+
+def test_overwrite_replaces_size():
+    cache = SimpleCache("t")
+    cache.set("a", "x" * 100, 60)
+    cache.set("a", "y", 60)
+    assert cache.get_stats()["approx_bytes"] == 3
+    assert cache.get_stats()["total_entries"] == 1
+
+
+def test_counters():
+    cache = SimpleCache("t")
+    cache.set("a", 1, 60)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["sets"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_get_or_revalidate_serves_stale_then_refreshes():
+    cache = SimpleCache("t", stale_seconds=60)
+    cache.set("k", "old", 0.05)
+    time.sleep(0.1)
+    refreshed = []
+
+    def refresh():
+        refreshed.append(True)
+        cache.set("k", "new", 60)
+        return "new"
+
+    # get() only returns fresh values; get_or_revalidate() serves the stale one
+    assert cache.get("k") is None
+    assert cache.get_or_revalidate("k", refresh) == "old"
+    assert _wait_for(lambda: cache.get("k") == "new")
+    assert refreshed == [True]
+    stats = cache.get_stats()
+    assert stats["stale_hits"] == 1
+    assert stats["background_refreshes"] == 1
+
+
+def test_get_or_revalidate_miss_returns_none_without_refresh():
+    cache = SimpleCache("t", stale_seconds=60)
+    calls = []
+    assert cache.get_or_revalidate("k", lambda: calls.append(True)) is None
+    time.sleep(0.05)
+    assert calls == []
+
+
+def test_sweep_removes_expired_entries_only():
+    cache = SimpleCache("t")
+    cache.set("gone1", 1, 0.01)
+    cache.set("gone2", 2, 0.01)
+    cache.set("kept", 3, 60)
+    cache.set("rewritten", 4, 0.01)
+    cache.set("rewritten", 5, 60)  # leaves a superseded heap record behind
+    time.sleep(0.05)
+
+    assert cache.sweep() == 2
+    assert cache.get_stats()["total_entries"] == 2
+    assert cache.get("kept") == 3
+    assert cache.get("rewritten") == 5
+    assert cache.get_stats()["expirations"] == 2
+
+
+def test_sweep_respects_budget():
+    cache = SimpleCache("t")
+    for i in range(10):
+        cache.set(f"k{i}", i, 0.01)
+    time.sleep(0.05)
+    assert cache.sweep(max_items=4) == 4
+    assert cache.sweep(max_items=100) == 6
+    assert cache.get_stats()["total_entries"] == 0
+
+
+class _BrokenBackend:
+    name = "broken"
+
+    def get(self, key):
+        raise RuntimeError("database is locked")
+
+    def set(self, key, value, expiry_time):
+        raise RuntimeError("database is locked")
+
+    def delete(self, key):
+        raise RuntimeError("database is locked")
+
+    def clear(self):
+        raise RuntimeError("database is locked")
+
+
+def test_backend_errors_do_not_raise():
+    cache = SimpleCache("t", backend=_BrokenBackend())
+    cache.set("a", 1, 60)
+    assert cache.get("a") == 1
+    cache.delete("a")
+    assert cache.get("a") is None
+    cache.clear()
+
+
+def test_concurrent_misses_make_one_upstream_call():
+    cache = SimpleCache("t")
+    calls = []
+    start = threading.Barrier(16)
+    results = []
+
+    def fetch():
+        calls.append(True)
+        time.sleep(0.05)
+        cache.set("k", "value", 60)
+        return "value"
+
+    def worker(i):
+        start.wait()
+        # Arrivals spread across the fetch, and a gap between the miss and
+        # single_flight, so some callers join the flight only after it ended
+        time.sleep(i * 0.005)
+        value = cache.get("k")
+        if value is None:
+            time.sleep(0.03)
+            value = cache.single_flight("k", fetch)
+        results.append(value)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["value"] * 16
+
+
+def test_single_flight_after_leader_finished_uses_cache():
+    cache = SimpleCache("t")
+    calls = []
+
+    def fetch():
+        calls.append(True)
+        cache.set("k", "value", 60)
+        return "value"
+
+    # Both callers missed in get(); the second reaches single_flight only
+    # after the first flight is over
+    assert cache.single_flight("k", fetch) == "value"
+    assert cache.single_flight("k", fetch) == "value"
+    assert len(calls) == 1
@@ -0,0 +1,95 @@
+"""
+Geoapify place slices: reuse across nearby queries and tile edges.
+Upstream calls go to a fake Places API that returns the nearest points of
+a fixed random set, like Geoapify's circle filter with proximity bias.
+"""
+
+import os
+import random
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+
+import geo_tiles
+import services
+
+CAT = "catering.cafe"
+_rnd = random.Random(7)
+POINTS = [(42.36 + _rnd.gauss(0, 0.03), -71.06 + _rnd.gauss(0, 0.04), i) for i in range(5000)]
+
+
+class _Response:
+    ok = True
+    status_code = 200
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture
+def places_api(monkeypatch):
+    calls = []
+
+    def get(url, params=None, **kwargs):
+        calls.append(params)
+        lng, lat, radius = map(float, params["filter"][len("circle:"):].split(","))
+        nearest = sorted((geo_tiles.haversine_m(lat, lng, p[0], p[1]), p) for p in POINTS)
+        nearest = [p for d, p in nearest if d <= radius][:int(params["limit"])]
+        return _Response({"features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [p[1], p[0]]},
+             "properties": {"place_id": f"p{p[2]}", "name": f"P{p[2]}", "categories": [CAT]}}
+            for p in nearest
+        ]})
+
+    monkeypatch.setattr(services, "GEOAPIFY_KEY", "test")
+    monkeypatch.setattr(services.http_client, "get", get)
+    services.places_cache.clear()
+    yield calls
+    services.places_cache.clear()
+
+
+def _nearest_ids(lat, lng, radius_m, k):
+    ranked = sorted((geo_tiles.haversine_m(lat, lng, p[0], p[1]), p[2]) for p in POINTS)
+    return [f"p{i}" for d, i in ranked if d <= radius_m][:k]
+
+
+def _query(lat, lng, radius_m, needed=20):
+    pairs = services._places_in_range_from_geoapify(lat, lng, radius_m, [CAT], needed)[CAT]
+    return [row[0] for _, row in pairs[:needed]]
+
+
+def test_nearest_places_are_exact(places_api):
+    assert _query(42.36, -71.06, 8000) == _nearest_ids(42.36, -71.06, 8000, 20)
+    assert len(places_api) == 1
+
+
+def test_same_tile_reuses_slice(places_api):
+    _query(42.36, -71.06, 8000)
+    lat, lng = 42.3602, -71.0603
+    assert geo_tiles.encode(lat, lng, services.PLACES_CACHE_PRECISION) == geo_tiles.encode(42.36, -71.06, services.PLACES_CACHE_PRECISION)
+    assert _query(lat, lng, 8000) == _nearest_ids(lat, lng, 8000, 20)
+    assert len(places_api) == 1
+
+
+def test_neighbouring_tile_reuses_slice(places_api):
+    precision = services.PLACES_CACHE_PRECISION
+    tile = geo_tiles.encode(42.36, -71.06, precision)
+    lat_min, lat_max, lng_min, lng_max = geo_tiles.bbox(tile)
+    # Two users a few meters apart on either side of the tile's east edge
+    west = ((lat_min + lat_max) / 2, lng_max - 0.00003)
+    east = ((lat_min + lat_max) / 2, lng_max + 0.00003)
+    assert geo_tiles.encode(*east, precision) != tile
+
+    _query(*west, 8000)
+    assert _query(*east, 8000) == _nearest_ids(*east, 8000, 20)
+    assert len(places_api) == 1
+
+
+def test_far_query_fetches_again(places_api):
+    _query(42.36, -71.06, 8000)
+    assert _query(42.45, -71.20, 8000) == _nearest_ids(42.45, -71.20, 8000, 20)
+    assert len(places_api) == 2
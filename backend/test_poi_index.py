@@ -0,0 +1,52 @@
+"""
+Offline POI index built from an OSM-style dump (no Geoapify place_id,
+categories or lat/lon properties).
+"""
+
+import json
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from poi_index import PoiIndex
+from services import _normalize_place
+
+
+def _write_dump(path):
+    features = [
+        {"type": "Feature", "id": "node/1", "geometry": {"type": "Point", "coordinates": [-71.060, 42.360]},
+         "properties": {"name": "A", "amenity": "cafe"}},
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [-71.061, 42.361]},
+         "properties": {"@id": "node/2", "name": "B", "tourism": "museum", "fee": "yes"}},
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [-71.062, 42.362]},
+         "properties": {"osm_type": "way", "osm_id": 3, "name": "C", "leisure": "park", "fee": "no"}},
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [-71.063, 42.363]},
+         "properties": {"name": "D", "amenity": "restaurant"}},
+    ]
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def test_osm_dump_places_have_distinct_ids(tmp_path):
+    path = str(tmp_path / "dump.geojson")
+    _write_dump(path)
+    index = PoiIndex.from_geojson(path, _normalize_place)
+
+    ids = [row[0] for row in index.places]
+    assert len(index.places) == 4
+    assert len(set(ids)) == 4
+    assert None not in ids
+    assert ids[:3] == ["node/1", "node/2", "way3"]
+
+
+def test_osm_dump_places_get_type_and_cost(tmp_path):
+    path = str(tmp_path / "dump.geojson")
+    _write_dump(path)
+    index = PoiIndex.from_geojson(path, _normalize_place)
+
+    by_name = {row[1]: row for row in index.places}
+    assert "catering.cafe" in by_name["A"][4]
+    assert "entertainment.museum" in by_name["B"][4]
+    assert by_name["B"][5] == "$10-25"
+    assert by_name["C"][5] == "Free"
+    assert len(index.query(42.3615, -71.0615, 1000, "catering")) == 2
@@ -0,0 +1,163 @@
+"""
+/api/replan: incremental edits of a smart itinerary.
+"""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+
+import scheduler
+import services
+from app import app
+
+START = {"lat": 42.36, "lng": -71.06}
+
+
+def _item(name, time, lat, lng, duration_min=60, travel=10, **extra):
+    item = {
+        "time": time, "name": name,
+        "duration": scheduler.format_duration(duration_min), "duration_min": duration_min,
+        "cost": "Free", "cost_usd": 0.0, "travel_time_min": travel,
+        "lat": lat, "lng": lng, "relevance_score": 80, "matched_reason": f"{name} fits."
+    }
+    item.update(extra)
+    return item
+
+
+def _itinerary():
+    return [
+        _item("A", "9:10 AM", 42.365, -71.055),
+        _item("B", "10:20 AM", 42.370, -71.050),
+        _item("C", "11:30 AM", 42.375, -71.045),
+        _item("D", "12:40 PM", 42.380, -71.040),
+    ]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    llm_calls = []
+
+    def score(prefs, places, weather=None):
+        llm_calls.append([p["name"] for p in places])
+        return {p["name"]: {"score": 77, "reason": "Scored.", "outdoor": False, "warning": None} for p in places}
+
+    monkeypatch.setattr(services, "score_activities_with_llm", score)
+    services.routing_cache.clear()
+    test_client = app.test_client()
+    test_client.llm_calls = llm_calls
+    return test_client
+
+
+def _replan(client, edit, itinerary=None, **extra):
+    body = {"itinerary": itinerary or _itinerary(), "starting_coords": START, "edit": edit,
+            "travel_mode": "driving-car", "start_time": "09:00", "end_time": "17:00",
+            "use_weather": False}
+    body.update(extra)
+    return client.post("/api/replan", json=body)
+
+
+def test_remove_recomputes_only_the_leg_into_the_next_stop(client):
+    response = _replan(client, {"op": "remove", "index": 1})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [item["name"] for item in data["itinerary"]] == ["A", "C", "D"]
+    assert data["recomputed_legs"] == [1]
+    # A is untouched; C and D move earlier
+    assert data["itinerary"][0]["time"] == "9:10 AM"
+    assert scheduler.parse_clock(data["itinerary"][1]["time"]) < scheduler.parse_clock("11:30 AM")
+    assert client.llm_calls == []
+
+
+def test_remove_last_stop_recomputes_nothing(client):
+    data = _replan(client, {"op": "remove", "index": 3}).get_json()
+    assert data["recomputed_legs"] == []
+    assert [item["time"] for item in data["itinerary"]] == ["9:10 AM", "10:20 AM", "11:30 AM"]
+
+
+def test_move_recomputes_legs_around_the_moved_stop(client):
+    data = _replan(client, {"op": "move", "index": 3, "to": 1}).get_json()
+    assert [item["name"] for item in data["itinerary"]] == ["A", "D", "B", "C"]
+    # A -> D and D -> B are new legs; B -> C is unchanged
+    assert data["recomputed_legs"] == [1, 2]
+    assert data["itinerary"][0]["time"] == "9:10 AM"
+    assert client.llm_calls == []
+
+
+def test_replace_with_scored_place_skips_llm(client):
+    place = {"id": "e", "name": "E", "lat": 42.371, "lng": -71.049, "type": "leisure.park",
+             "cost": "Free", "relevance_score": 66, "matched_reason": "Nice park."}
+    data = _replan(client, {"op": "replace", "index": 1, "place": place}).get_json()
+    assert [item["name"] for item in data["itinerary"]] == ["A", "E", "C", "D"]
+    assert data["recomputed_legs"] == [1, 2]
+    assert data["itinerary"][1]["relevance_score"] == 66
+    assert client.llm_calls == []
+
+
+def test_insert_sparse_place_scores_it_and_fills_defaults(client):
+    place = {"id": "x", "name": "X", "lat": 42.362, "lng": -71.058}
+    data = _replan(client, {"op": "insert", "index": 0, "place": place}).get_json()
+    assert client.llm_calls == [["X"]]
+    inserted = data["itinerary"][0]
+    assert inserted["name"] == "X"
+    assert inserted["relevance_score"] == 77
+    assert inserted["address"] == "Address not available"
+    for field in ("street", "city", "state", "country"):
+        assert inserted[field] == ""
+    assert inserted["duration_min"] == scheduler.DEFAULT_KIND[2]
+    assert data["recomputed_legs"] == [0, 1]
+
+
+def test_retime_recomputes_outside_opening_hours(client):
+    itinerary = _itinerary()
+    # Stale flags from an earlier plan: C opens at noon (fits once it waits),
+    # D's hours are unknown
+    itinerary[2].update(hours="Mo-Su 12:00-13:00", outside_opening_hours=True)
+    itinerary[3].update(outside_opening_hours=True)
+    data = _replan(client, {"op": "remove", "index": 1}, itinerary=itinerary).get_json()
+    c, d = data["itinerary"][1], data["itinerary"][2]
+    assert c["time"] == "12:00 PM"
+    assert c["outside_opening_hours"] is False
+    assert "outside_opening_hours" not in d
+
+    # Now C can't fit its one-hour visit into 12:00-12:30
+    itinerary[2]["hours"] = "Mo-Su 12:00-12:30"
+    data = _replan(client, {"op": "remove", "index": 1}, itinerary=itinerary).get_json()
+    assert data["itinerary"][1]["outside_opening_hours"] is True
+
+
+def test_fits_window_and_totals(client):
+    data = _replan(client, {"op": "remove", "index": 1}).get_json()
+    assert data["fits_window"] is True
+    assert "overrun_min" not in data
+    assert data["total_activity_hours"] == 3
+    assert data["total_time_hours"] == round(3 + data["total_travel_hours"], 2)
+
+    data = _replan(client, {"op": "remove", "index": 1}, end_time="11:00").get_json()
+    assert data["fits_window"] is False
+    assert data["overrun_min"] > 0
+
+
+@pytest.mark.parametrize("edit", [
+    "remove",
+    {"op": "bogus", "index": 0},
+    {"op": "remove", "index": 4},
+    {"op": "remove", "index": -1},
+    {"op": "remove", "index": True},
+    {"op": "remove"},
+    {"op": "move", "index": 0, "to": 9},
+    {"op": "move", "index": 0, "to": False},
+    {"op": "insert", "index": 0, "place": "X"},
+    {"op": "insert", "index": 0, "place": {"name": "X"}},
+    {"op": "replace", "index": 0},
+])
+def test_bad_edits_return_400(client, edit):
+    assert _replan(client, edit).status_code == 400
+
+
+def test_missing_fields_return_400(client):
+    assert client.post("/api/replan", json={"edit": {"op": "remove", "index": 0}}).status_code == 400
+    assert client.post("/api/replan", json={"itinerary": _itinerary(), "edit": {"op": "remove", "index": 0}}).status_code == 400
+    assert client.post("/api/replan", json={"itinerary": {}, "starting_coords": START,
+                                            "edit": {"op": "remove", "index": 0}}).status_code == 400
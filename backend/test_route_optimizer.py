@@ -0,0 +1,105 @@
+"""
+Visiting-order optimization: valid tours, improvement over the
+nearest-neighbour seed, fixed and free ends against brute force.
+"""
+
+import itertools
+
+import numpy as np
+
+import route_optimizer
+
+
+def _random_matrix(seed, n):
+    """Asymmetric travel times between random points (one-way streets)."""
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, 2))
+    distance = np.hypot(*(points[:, None] - points[None, :]).transpose(2, 0, 1))
+    return distance * (1 + 0.3 * rng.random((n, n)))
+
+
+def _line_matrix(positions):
+    positions = np.asarray(positions, dtype=float)
+    return np.abs(positions[:, None] - positions[None, :])
+
+
+def _brute_force(cost, fixed_end):
+    n = len(cost)
+    middle = range(1, n - 1) if fixed_end else range(1, n)
+    best = None
+    for perm in itertools.permutations(middle):
+        path = [0, *perm] + ([n - 1] if fixed_end else [])
+        value = route_optimizer.path_cost(cost, path)
+        if best is None or value < best:
+            best = value
+    return best
+
+
+def _nearest_neighbour_cost(cost, fixed_end):
+    n = len(cost)
+    path, left = [0], set(range(1, n - 1 if fixed_end else n))
+    while left:
+        nxt = min(left, key=lambda j: cost[path[-1], j])
+        path.append(nxt)
+        left.remove(nxt)
+    if fixed_end:
+        path.append(n - 1)
+    return route_optimizer.path_cost(cost, path)
+
+
+def test_order_is_a_permutation_starting_at_zero():
+    for seed in range(20):
+        cost = _random_matrix(seed, 12)
+        for fixed_end in (False, True):
+            order = route_optimizer.optimize_order(cost, fixed_end=fixed_end)
+            assert order[0] == 0
+            assert sorted(order) == list(range(12))
+
+
+def test_fixed_end_stays_last():
+    for seed in range(20):
+        order = route_optimizer.optimize_order(_random_matrix(seed, 10), fixed_end=True)
+        assert order[-1] == 9
+
+
+def test_never_worse_than_nearest_neighbour():
+    for seed in range(30):
+        cost = _random_matrix(seed, 15)
+        for fixed_end in (False, True):
+            order = route_optimizer.optimize_order(cost, fixed_end=fixed_end)
+            assert route_optimizer.path_cost(cost, order) <= _nearest_neighbour_cost(cost, fixed_end) + 1e-9
+
+
+def test_free_end_matches_brute_force():
+    # Stops on a line around the start. Nearest neighbour zig-zags (0 -> 1 ->
+    # -2 -> 3 ...); the best open path sweeps left first and ends at 5.5,
+    # which is not the last index
+    cost = _line_matrix([0, 5.5, 1, -2, 3, -4])
+    order = route_optimizer.optimize_order(cost)
+    assert route_optimizer.path_cost(cost, order) == _brute_force(cost, fixed_end=False) == 13.5
+    assert order == [0, 3, 5, 2, 4, 1]
+
+
+def test_fixed_end_matches_brute_force():
+    cost = _line_matrix([0, 5.5, 1, -2, 3, -4])
+    order = route_optimizer.optimize_order(cost, fixed_end=True)
+    assert order[-1] == 5
+    assert route_optimizer.path_cost(cost, order) == _brute_force(cost, fixed_end=True)
+
+
+def test_close_to_optimal_on_small_random_instances():
+    gaps = []
+    for seed in range(40):
+        cost = _random_matrix(seed, 7)
+        for fixed_end in (False, True):
+            order = route_optimizer.optimize_order(cost, fixed_end=fixed_end)
+            best = _brute_force(cost, fixed_end)
+            gaps.append(route_optimizer.path_cost(cost, order) / best - 1)
+    assert max(gaps) < 0.15
+    assert sum(gaps) / len(gaps) < 0.01
+
+
+def test_tiny_inputs():
+    assert route_optimizer.optimize_order(np.zeros((1, 1))) == [0]
+    assert route_optimizer.optimize_order(_line_matrix([0, 1])) == [0, 1]
+    assert route_optimizer.optimize_order(_line_matrix([0, 1, 2]), fixed_end=True) == [0, 1, 2]
@@ -0,0 +1,134 @@
+"""
+Local itinerary scheduler: opening hours parsing and time-window scheduling.
+"""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import scheduler
+from place import Place
+
+MONDAY, SATURDAY, SUNDAY = 0, 5, 6
+
+
+def test_weekday_hours():
+    assert scheduler.opening_windows("Mo-Fr 09:00-17:00", MONDAY) == [(540, 1020)]
+    assert scheduler.opening_windows("Mo-Fr 09:00-17:00", SATURDAY) == []
+
+
+def test_always_open():
+    assert scheduler.opening_windows("24/7", SUNDAY) == [(0, 1440)]
+
+
+def test_unknown_hours():
+    assert scheduler.opening_windows(None, MONDAY) is None
+    assert scheduler.opening_windows("N/A", MONDAY) is None
+    assert scheduler.opening_windows("call us", MONDAY) is None
+
+
+def test_overnight_span_ends_after_midnight():
+    assert scheduler.opening_windows("22:00-02:00", MONDAY) == [(1320, 1560)]
+
+
+def test_later_rules_override_and_off_closes():
+    hours = "Mo-Su 10:00-18:00; Su off"
+    assert scheduler.opening_windows(hours, SATURDAY) == [(600, 1080)]
+    assert scheduler.opening_windows(hours, SUNDAY) == []
+
+
+def test_split_and_short_ranges():
+    assert scheduler.opening_windows("Mo 10-12, 14:00-18:00", MONDAY) == [(600, 720), (840, 1080)]
+
+
+def test_public_holiday_rules_are_ignored():
+    for day in range(7):
+        assert scheduler.opening_windows("PH off", day) is None
+        assert scheduler.opening_windows("Mo-Su 10:00-18:00; PH off", day) == [(600, 1080)]
+    assert scheduler.opening_windows("Mo-Fr,PH 09:00-17:00", SATURDAY) == []
+    assert scheduler.opening_windows("Mo-Fr,PH 09:00-17:00", MONDAY) == [(540, 1020)]
+
+
+def test_clock_and_duration_round_trip():
+    assert scheduler.parse_clock("09:00") == 540
+    assert scheduler.parse_clock("9:30 PM") == 1290
+    assert scheduler.parse_clock("soon") is None
+    assert scheduler.format_clock(540) == "9:00 AM"
+    for minutes in (45, 60, 75, 120):
+        assert scheduler.parse_duration(scheduler.format_duration(minutes)) == minutes
+
+
+def test_estimate_cost():
+    assert scheduler.estimate_cost("Free", "museum") == 0
+    assert scheduler.estimate_cost("$10-25", None) == 17.5
+    assert scheduler.estimate_cost("Unknown", "entertainment.museum") == 17.5
+
+
+def _stop(key, score, duration_min=60, windows=None, kind=None):
+    return {"key": key, "score": score, "duration_min": duration_min,
+            "kind": kind or key, "windows": windows}
+
+
+def _travel(minutes=10):
+    return lambda a, b: 0 if a == b else minutes
+
+
+def test_schedule_waits_for_opening_time():
+    stops = [_stop("museum", 90, windows=[(11 * 60, 17 * 60)])]
+    [entry] = scheduler.schedule(stops, _travel(), 9 * 60, 17 * 60)
+    assert entry["arrive_min"] == 9 * 60 + 10
+    assert entry["start_min"] == 11 * 60
+    assert entry["end_min"] == 12 * 60
+
+
+def test_schedule_respects_window_and_closed_places():
+    stops = [
+        _stop("a", 90), _stop("b", 80), _stop("c", 70), _stop("d", 60),
+        _stop("closed", 100, windows=[]),
+    ]
+    # 3 hours: room for two one-hour stops plus travel, not three
+    plan = scheduler.schedule(stops, _travel(20), 9 * 60, 12 * 60)
+    keys = [entry["key"] for entry in plan]
+    assert "closed" not in keys
+    assert len(keys) == 2
+    assert set(keys) == {"a", "b"}
+    assert plan[-1]["end_min"] <= 12 * 60
+    for previous, entry in zip(plan, plan[1:]):
+        assert entry["start_min"] >= previous["end_min"] + entry["travel_min"]
+
+
+def test_schedule_orders_stops_to_save_travel():
+    # Stops on a line: start - x - y - z, visiting out of order costs more
+    position = {scheduler.START: 0, "x": 1, "y": 2, "z": 3}
+    travel = lambda a, b: 15 * abs(position[a] - position[b])
+    stops = [_stop("z", 80), _stop("x", 80), _stop("y", 80)]
+    plan = scheduler.schedule(stops, travel, 9 * 60, 18 * 60)
+    assert [entry["key"] for entry in plan] == ["x", "y", "z"]
+
+
+def test_schedule_coerces_scores():
+    stops = [_stop("a", None), _stop("b", "80"), _stop("c", "junk"), _stop("zero", 0)]
+    keys = {entry["key"] for entry in scheduler.schedule(stops, _travel(), 9 * 60, 18 * 60)}
+    assert keys == {"a", "b", "c"}
+
+
+def test_schedule_smart_itinerary_items():
+    import services
+    places = [
+        Place("m", "Museum", 42.37, -71.05, type="entertainment.museum", cost="$10-25", hours="Mo-Su 10:00-17:00"),
+        Place("p", "Park", 42.365, -71.055, type="leisure.park", cost="Free"),
+    ]
+    for place, score in zip(places, (90, 70)):
+        place["relevance_score"] = score
+        place["matched_reason"] = f"{place.name} fits."
+    matrix = services.build_travel_matrix(42.36, -71.06, places, "driving-car")
+
+    itinerary = services.schedule_smart_itinerary(places, matrix, "09:00", "17:00", weekday=MONDAY)
+    by_name = {item["name"]: item for item in itinerary}
+    assert set(by_name) == {"Museum", "Park"}
+    museum = by_name["Museum"]
+    assert scheduler.parse_clock(museum["time"]) >= 10 * 60
+    assert museum["duration_min"] == 120
+    assert museum["cost_usd"] == 17.5
+    assert museum["hours"] == "Mo-Su 10:00-17:00"
+    assert by_name["Park"]["cost"] == "Free"
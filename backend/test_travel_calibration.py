@@ -0,0 +1,72 @@
+"""
+TravelCalibrator: factors, confidence audits and decay of old legs.
+"""
+
+import random
+from math import exp, log
+
+import geo_tiles
+import travel_estimator
+from travel_calibration import FactorStats, TravelCalibrator
+
+POINT = (42.405, -71.055)
+
+
+def _feed(calibrator, factor, count, rnd):
+    """Observe `count` drive legs in POINT's region whose real time is factor x the estimate."""
+    for _ in range(count):
+        a = (42.40 + rnd.uniform(0, 0.01), -71.06 + rnd.uniform(0, 0.01))
+        b = (a[0] + rnd.uniform(0.01, 0.03), a[1] + rnd.uniform(0.01, 0.03))
+        km = geo_tiles.haversine_m(a[0], a[1], b[0], b[1]) / 1000
+        minutes = float(travel_estimator.minutes_for(km, "drive")) * factor * rnd.uniform(0.97, 1.03)
+        calibrator.observe(a, b, "drive", km * 1.3, minutes)
+
+
+def test_factor_is_geometric_mean_within_window():
+    stats = FactorStats(window=10)
+    for ratio in (1.2, 1.5, 1.8):
+        stats.add(log(ratio), 0.0)
+    assert abs(stats.time_factor - exp((log(1.2) + log(1.5) + log(1.8)) / 3)) < 1e-9
+
+
+def test_factor_follows_a_change_after_the_window():
+    rnd = random.Random(0)
+    calibrator = TravelCalibrator(min_samples=20, window=50)
+    _feed(calibrator, 1.5, 1000, rnd)
+    assert abs(calibrator.factors("drive", *POINT)[1] - 1.5) < 0.05
+
+    # Traffic got worse; 150 new legs outweigh the 1000 old ones
+    _feed(calibrator, 2.0, 150, rnd)
+    assert abs(calibrator.factors("drive", *POINT)[1] - 2.0) < 0.1
+
+
+def test_without_window_old_legs_dominate():
+    rnd = random.Random(0)
+    calibrator = TravelCalibrator(min_samples=20, window=0)
+    _feed(calibrator, 1.5, 1000, rnd)
+    _feed(calibrator, 2.0, 150, rnd)
+    assert calibrator.factors("drive", *POINT)[1] < 1.6
+
+
+def test_confident_region_is_audited_and_can_lose_confidence():
+    rnd = random.Random(1)
+    calibrator = TravelCalibrator(min_samples=20, max_error=0.15, audit_every=3)
+    _feed(calibrator, 1.5, 100, rnd)
+    assert calibrator.is_confident("drive", *POINT)
+
+    # Three requests may skip routing, the fourth must route
+    assert [calibrator.trust_estimate("drive", *POINT) for _ in range(4)] == [True, True, True, False]
+    # Its legs reset the count
+    _feed(calibrator, 1.5, 1, rnd)
+    assert calibrator.trust_estimate("drive", *POINT)
+
+    # The audited legs show the estimate drifted
+    _feed(calibrator, 3.0, 10, rnd)
+    assert not calibrator.is_confident("drive", *POINT)
+    assert not calibrator.trust_estimate("drive", *POINT)
+
+
+def test_unknown_region_is_not_corrected():
+    calibrator = TravelCalibrator()
+    assert calibrator.factors("drive", *POINT) == (1.0, 1.0)
+    assert not calibrator.trust_estimate("drive", *POINT)
@@ -0,0 +1,25 @@
+"""
+Travel matrix keys: the trip start can't collide with a place id.
+"""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import scheduler
+import services
+from place import Place
+
+
+def test_place_id_start_does_not_shadow_the_trip_start():
+    places = [
+        Place("start", "Called start", 42.40, -71.00),
+        Place("p2", "Other", 42.37, -71.05),
+    ]
+    matrix = services.build_travel_matrix(42.36, -71.06, places, "driving-car")
+
+    assert matrix.index(scheduler.START) == 0
+    assert matrix.index("start") == 1
+    assert matrix.index("p2") == 2
+    # The place really is the far one, not the start itself
+    assert matrix.time_between(scheduler.START, "start") > matrix.time_between(scheduler.START, "p2") > 0
@@ -0,0 +1,234 @@
+"""
+Travel-time estimates calibrated against real routes.
+
+travel_estimator assumes fixed average speeds (60/20/5 km/h), which is far
+off in dense cities. Every real leg we route (Geoapify or the road graph)
+pairs a straight-line estimate with the actual distance and time, so the
+calibrator learns, per travel mode and region (geohash of the leg's start,
+CALIBRATION_REGION_PRECISION characters, ~39 x 20 km at 4), a correction
+factor for each: the geometric mean of actual / estimate, kept online
+(mean/variance of the log ratio). Past CALIBRATION_WINDOW legs the mean
+becomes exponentially weighted, so roadworks or changed traffic patterns
+still move a long-established factor. Regions with too few legs use the
+mode's overall factor, and modes with too few legs use no correction.
+
+Errors are measured prequentially: each new leg is predicted with the
+model as it stood, then learned, so reported errors are on unseen legs and
+sit next to the uncorrected estimate's error for comparison. A region whose
+recent error (exponentially weighted) is within CALIBRATION_MAX_ERROR after
+CALIBRATION_MIN_SAMPLES legs is "confident": its estimates can stand in for
+routing calls. Every CALIBRATION_AUDIT_EVERY-th request there is routed
+anyway, so the region keeps being scored on fresh legs and loses its
+confidence if the estimates drift.
+"""
+
+import os
+import threading
+from math import exp, log, sqrt
+
+import numpy as np
+
+import geo_tiles
+import travel_estimator
+
+# Legs shorter than this (straight line, km) say more about snapping than speed
+MIN_LEG_KM = 0.05
+# Weight of the newest leg in a region's recent-error average
+ERROR_ALPHA = 0.1
+
+
+class FactorStats:
+    """
+    Online statistics of log(actual / estimate) for time and distance, plus
+    prediction errors. Each leg is weighted 1 / min(n, window): an exact
+    running mean for the first `window` legs, then an exponential moving
+    average over roughly the last `window`.
+    """
+    __slots__ = ("window", "n", "time_mean", "time_var", "distance_mean", "recent_error",
+                 "error_sum", "baseline_error_sum", "scored", "skipped")
+
+    def __init__(self, window=200):
+        self.window = window
+        self.n = 0
+        self.time_mean = 0.0
+        self.time_var = 0.0
+        self.distance_mean = 0.0
+        self.recent_error = None
+        self.error_sum = 0.0
+        self.baseline_error_sum = 0.0
+        self.scored = 0
+        self.skipped = 0  # requests answered from the estimate since the last observed leg
+
+    def add(self, time_log_ratio, distance_log_ratio):
+        self.n += 1
+        weight = 1.0 / min(self.n, self.window) if self.window else 1.0 / self.n
+        delta = time_log_ratio - self.time_mean
+        self.time_mean += weight * delta
+        self.time_var = (1 - weight) * (self.time_var + weight * delta * delta)
+        self.distance_mean += weight * (distance_log_ratio - self.distance_mean)
+
+    def score(self, error, baseline_error):
+        """Record the relative error of a prediction made before the leg was learned."""
+        self.scored += 1
+        self.error_sum += error
+        self.baseline_error_sum += baseline_error
+        if self.recent_error is None:
+            self.recent_error = error
+        else:
+            self.recent_error += ERROR_ALPHA * (error - self.recent_error)
+
+    @property
+    def time_factor(self):
+        return exp(self.time_mean)
+
+    @property
+    def distance_factor(self):
+        return exp(self.distance_mean)
+
+    def to_dict(self):
+        return {
+            "legs": self.n,
+            "time_factor": round(self.time_factor, 3),
+            "distance_factor": round(self.distance_factor, 3),
+            "time_log_std": round(sqrt(self.time_var), 3) if self.n > 1 else None,
+            "mean_abs_error": round(self.error_sum / self.scored, 3) if self.scored else None,
+            "baseline_mean_abs_error": round(self.baseline_error_sum / self.scored, 3) if self.scored else None,
+            "recent_error": round(self.recent_error, 3) if self.recent_error is not None else None
+        }
+
+
+class TravelCalibrator:
+    """
+    Per-(mode, region) correction factors for straight-line travel estimates.
+    Modes are Geoapify mode names (drive, bicycle, walk), as in travel_estimator.
+    """
+    def __init__(self, min_samples=20, max_error=0.15, region_precision=4, audit_every=10, window=200):
+        self.min_samples = min_samples
+        self.max_error = max_error
+        self.region_precision = region_precision
+        self.audit_every = audit_every
+        self.window = window
+        self._lock = threading.Lock()
+        self._modes = {}    # mode -> FactorStats
+        self._regions = {}  # (mode, region) -> FactorStats
+
+    def _region(self, lat, lng):
+        return geo_tiles.encode(lat, lng, self.region_precision)
+
+    def _model(self, mode, region):
+        """Stats the estimate for (mode, region) is based on, or None. Caller holds the lock."""
+        stats = self._regions.get((mode, region))
+        if stats is not None and stats.n >= self.min_samples:
+            return stats
+        stats = self._modes.get(mode)
+        if stats is not None and stats.n >= self.min_samples:
+            return stats
+        return None
+
+    def factors(self, mode, lat, lng):
+        """(distance_factor, time_factor) for legs starting at (lat, lng)."""
+        region = self._region(lat, lng)
+        with self._lock:
+            stats = self._model(mode, region)
+            if stats is None:
+                return 1.0, 1.0
+            return stats.distance_factor, stats.time_factor
+
+    def calibrate(self, mode, lat, lng, distance_km, time_min):
+        """Correct straight-line (distance_km, time_min) estimates (scalars or arrays) from (lat, lng)."""
+        distance_factor, time_factor = self.factors(mode, lat, lng)
+        return np.asarray(distance_km) * distance_factor, np.asarray(time_min) * time_factor
+
+    def calibrate_rows(self, sources, distance_km, time_min, mode):
+        """calibrate() for each row of (len(sources), N) estimate arrays; returns new arrays."""
+        distance_km = np.array(distance_km, dtype=float)
+        time_min = np.array(time_min, dtype=float)
+        for i, (lat, lng) in enumerate(sources):
+            distance_factor, time_factor = self.factors(mode, lat, lng)
+            distance_km[i] *= distance_factor
+            time_min[i] *= time_factor
+        return distance_km, time_min
+
+    def _confident(self, stats):
+        """True if a region's own estimates have been within max_error lately. Caller holds the lock."""
+        return (stats is not None and stats.n >= self.min_samples and
+                stats.recent_error is not None and stats.recent_error <= self.max_error)
+
+    def is_confident(self, mode, lat, lng):
+        """True if the region's own estimates have been within max_error lately."""
+        with self._lock:
+            return self._confident(self._regions.get((mode, self._region(lat, lng))))
+
+    def trust_estimate(self, mode, lat, lng):
+        """
+        True if a request starting at (lat, lng) may use the calibrated
+        estimate instead of routing: the region is confident and fewer than
+        audit_every requests have skipped routing since it last observed a
+        leg. False means route this one (and observe its legs).
+        """
+        with self._lock:
+            stats = self._regions.get((mode, self._region(lat, lng)))
+            if not self._confident(stats) or stats.skipped >= self.audit_every:
+                return False
+            stats.skipped += 1
+            return True
+
+    def observe(self, a, b, mode, distance_km, time_min):
+        """
+        Learn from a routed leg a -> b ((lat, lng)) of distance_km / time_min,
+        against its straight-line estimate. Scores the current model on it first.
+        """
+        estimate_km = geo_tiles.haversine_m(a[0], a[1], b[0], b[1]) / 1000
+        if estimate_km < MIN_LEG_KM or distance_km <= 0 or time_min <= 0:
+            return
+        estimate_min = float(travel_estimator.minutes_for(estimate_km, mode))
+        region = self._region(a[0], a[1])
+        with self._lock:
+            region_stats = self._regions.get((mode, region))
+            if region_stats is None:
+                region_stats = self._regions[(mode, region)] = FactorStats(self.window)
+            mode_stats = self._modes.get(mode)
+            if mode_stats is None:
+                mode_stats = self._modes[mode] = FactorStats(self.window)
+
+            model = self._model(mode, region)
+            predicted = estimate_min * (model.time_factor if model is not None else 1.0)
+            error = abs(predicted - time_min) / time_min
+            baseline_error = abs(estimate_min - time_min) / time_min
+            time_log_ratio = log(time_min / estimate_min)
+            distance_log_ratio = log(distance_km / estimate_km)
+            for stats in (region_stats, mode_stats):
+                stats.score(error, baseline_error)
+                stats.add(time_log_ratio, distance_log_ratio)
+            region_stats.skipped = 0
+
+    def get_stats(self, max_regions=20):
+        """Per-mode factors and errors, plus the busiest regions."""
+        with self._lock:
+            regions = sorted(self._regions.items(), key=lambda item: -item[1].n)
+            confident = sum(1 for stats in self._regions.values() if self._confident(stats))
+            return {
+                "min_samples": self.min_samples,
+                "max_error": self.max_error,
+                "region_precision": self.region_precision,
+                "audit_every": self.audit_every,
+                "window": self.window,
+                "regions": len(self._regions),
+                "confident_regions": confident,
+                "modes": {mode: stats.to_dict() for mode, stats in self._modes.items()},
+                "top_regions": {f"{mode}/{region}": stats.to_dict() for (mode, region), stats in regions[:max_regions]}
+            }
+
+
+calibrator = TravelCalibrator(
+    min_samples=int(os.getenv("CALIBRATION_MIN_SAMPLES", 20)),
+    max_error=float(os.getenv("CALIBRATION_MAX_ERROR", 0.15)),
+    region_precision=int(os.getenv("CALIBRATION_REGION_PRECISION", 4)),
+    audit_every=int(os.getenv("CALIBRATION_AUDIT_EVERY", 10)),
+    window=int(os.getenv("CALIBRATION_WINDOW", 200))
+)
+
+
+def get_stats():
+    """Factors and error statistics of the shared calibrator."""
+    return calibrator.get_stats()
@@ -0,0 +1,61 @@
+"""
+Vectorized straight-line distance / travel-time estimates (NumPy).
+
+Used wherever we need travel times without a routing call: ranking and
+pruning candidate places before real routing, the local route matrix, and
+calculate_route's fallback when the routing API is unavailable. Distances
+are great-circle (haversine) and times assume an average speed per mode.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Average speeds by Geoapify routing mode
+SPEEDS_KMH = {"drive": 60, "bicycle": 20, "walk": 5}
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km; arguments broadcast like NumPy arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def minutes_for(distance_km, mode):
+    """Estimated travel minutes for distance(s) in km at the mode's average speed."""
+    return np.asarray(distance_km, dtype=float) / SPEEDS_KMH.get(mode, SPEEDS_KMH["drive"]) * 60
+
+
+def estimate_from(lat, lng, lats, lngs, mode):
+    """(distance_km, time_min) arrays from one point to many."""
+    distance_km = haversine_km(lat, lng, lats, lngs)
+    return distance_km, minutes_for(distance_km, mode)
+
+
+def estimate_matrix(sources, targets, mode):
+    """(distance_km, time_min) arrays of shape (len(sources), len(targets)) from (lat, lng) lists."""
+    src = np.asarray(sources, dtype=float).reshape(-1, 2)
+    dst = np.asarray(targets, dtype=float).reshape(-1, 2)
+    distance_km = haversine_km(src[:, 0:1], src[:, 1:2], dst[:, 0], dst[:, 1])
+    return distance_km, minutes_for(distance_km, mode)
+
+
+def estimate_legs(waypoints, mode):
+    """(distance_km, time_min) arrays for each consecutive leg of a (lat, lng) path."""
+    pts = np.asarray(waypoints, dtype=float).reshape(-1, 2)
+    distance_km = haversine_km(pts[:-1, 0], pts[:-1, 1], pts[1:, 0], pts[1:, 1])
+    return distance_km, minutes_for(distance_km, mode)
+
+
+def rank_by_eta(lat, lng, places, mode):
+    """
+    Estimate every place's travel time from (lat, lng) in one array operation.
+    Returns (order, distance_km, time_min): order lists place indices nearest
+    first (ties keep their original order); the arrays follow the input order.
+    """
+    lats = np.fromiter((p["lat"] for p in places), dtype=float, count=len(places))
+    lngs = np.fromiter((p["lng"] for p in places), dtype=float, count=len(places))
+    distance_km, time_min = estimate_from(lat, lng, lats, lngs, mode)
+    order = np.argsort(time_min, kind="stable")
+    return order, distance_km, time_min
@@ -0,0 +1,98 @@
+"""
+Pairwise travel-time matrix between candidate places.
+
+A TravelMatrix holds N x N distance (km) and travel-time (minutes) arrays
+for a set of points, usually the trip start (index 0) followed by the
+candidate places. Every cell starts as a straight-line estimate
+(travel_estimator) computed in one vectorized pass; cells for which a real
+routed leg is known are then overwritten with it. Lookups by index or by
+key (place id) are O(1), so itinerary scheduling and ordering code can
+query it freely.
+
+Filling in real legs is kept bounded for a few hundred points: only the
+start row/column and each point's k nearest neighbours are looked up,
+since those are the legs an itinerary actually uses (see neighbor_pairs).
+"""
+
+import numpy as np
+
+import travel_estimator
+
+
+class TravelMatrix:
+    """N x N travel estimates between points, indexed by position or key."""
+    def __init__(self, keys, points, mode):
+        self.keys = list(keys)
+        self.points = [(float(lat), float(lng)) for lat, lng in points]
+        self.mode = mode
+        self._index = {key: i for i, key in enumerate(self.keys)}
+        distance_km, time_min = travel_estimator.estimate_matrix(self.points, self.points, mode)
+        self.km = distance_km.astype(np.float32)
+        self.minutes = time_min.astype(np.float32)
+        # True where the cell holds a real routed leg rather than an estimate
+        self.routed = np.zeros(self.km.shape, dtype=bool)
+        np.fill_diagonal(self.routed, True)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the arrays (used for cache size accounting)."""
+        return int(self.km.nbytes + self.minutes.nbytes + self.routed.nbytes)
+
+    def index(self, key):
+        """Position of key, or None if it isn't in the matrix."""
+        return self._index.get(key)
+
+    def time_between(self, a, b):
+        """Travel minutes from key a to key b, or None if either is unknown."""
+        i, j = self._index.get(a), self._index.get(b)
+        if i is None or j is None:
+            return None
+        return float(self.minutes[i, j])
+
+    def distance_between(self, a, b):
+        """Distance in km from key a to key b, or None if either is unknown."""
+        i, j = self._index.get(a), self._index.get(b)
+        if i is None or j is None:
+            return None
+        return float(self.km[i, j])
+
+    def set_leg(self, i, j, distance_km, time_min):
+        """Overwrite the estimate for i -> j with a routed leg."""
+        self.km[i, j] = distance_km
+        self.minutes[i, j] = time_min
+        self.routed[i, j] = True
+
+    def neighbor_pairs(self, k, anchor=0):
+        """
+        (i, j) pairs worth filling with real legs: anchor (the start) to and
+        from every point, plus each point to its k nearest points by estimate.
+        O(N * k) pairs instead of N^2.
+        """
+        n = len(self.keys)
+        pairs = set()
+        if anchor is not None and n:
+            for j in range(n):
+                if j != anchor:
+                    pairs.add((anchor, j))
+                    pairs.add((j, anchor))
+        k = min(k, n - 1)
+        if k > 0:
+            # argpartition picks each row's k+1 smallest (including itself) in O(N)
+            nearest = np.argpartition(self.km, k, axis=1)[:, :k + 1]
+            for i in range(n):
+                for j in nearest[i]:
+                    if i != j:
+                        pairs.add((i, int(j)))
+        return sorted(pairs)
+
+    def get_stats(self):
+        """Size and how many cells hold routed legs."""
+        n = len(self.keys)
+        return {
+            "points": n,
+            "routed_cells": int(self.routed.sum()) - n,
+            "bytes": self.nbytes
+        }